@@ -945,19 +945,26 @@ class DenseDesignMatrix(Dataset):
         assert self.X.shape[0] == self.y.shape[0]
         assert self.X.shape[0] == stop - start
 
-    def convert_to_one_hot(self, min_class=0):
+    def convert_to_one_hot(self, min_class=0, dense=False):
         """
         .. todo::
 
             WRITEME properly
 
-        If y exists and is a vector of ints, converts it to a binary matrix
-        Otherwise will raise some exception
+        If y exists and is a vector of ints, makes the targets one-hot
+        vectors. Otherwise will raise some exception
+
+        By default, the labels are kept as integers, in an IndexSpace with
+        one label per example: iterators expand them to one-hot vectors when
+        the targets are requested in a VectorSpace, so that they do not use
+        num_classes times more memory.
 
         Parameters
         ----------
         min_class : int
             WRITEME
+        dense : bool, optional
+            If True, y is replaced by a binary matrix, with a VectorSpace.
         """
 
         if self.y is None:
@@ -987,17 +994,19 @@ class DenseDesignMatrix(Dataset):
 
         num_classes = self.y.max() + 1
 
-        y = np.zeros((self.y.shape[0], num_classes))
-
-        for i in xrange(self.y.shape[0]):
-            y[i, self.y[i]] = 1
-
-        self.y = y
+        if dense:
+            y = np.zeros((self.y.shape[0], num_classes))
+            y[np.arange(self.y.shape[0]), self.y] = 1
+            self.y = y
+            new_y_space = VectorSpace(dim=num_classes)
+        else:
+            self.y = self.y.reshape((self.y.shape[0], 1))
+            self.y_labels = num_classes
+            new_y_space = IndexSpace(dim=1, max_labels=num_classes)
 
         # Update self.data_specs with the updated dimension of self.y
         init_space, source = self.data_specs
         X_space, init_y_space = init_space.components
-        new_y_space = VectorSpace(dim=num_classes)
         new_space = CompositeSpace((X_space, new_y_space))
         self.data_specs = (new_space, source)
 
@@ -1065,6 +1074,39 @@ class DenseDesignMatrix(Dataset):
         # of the view_converter
         self.X_topo_space = self.view_converter.topo_space
 
+    def set_design_matrix_layout(self, layout):
+        """
+        Lays the examples out in the rows of the design matrix in the
+        axis ordering `layout`, e.g. the axes of the Conv2DSpace of the
+        input of a convolutional network. Batches of the features
+        formatted to a Conv2DSpace with these axes and the dtype of the
+        design matrix are then reshaped views of the design matrix instead
+        of transposed copies. The design matrix is copied once, in memory.
+
+        This changes the order of the columns of the design matrix, so it
+        is only useful if the features are read in a Conv2DSpace, and
+        should be done after preprocessing.
+
+        Parameters
+        ----------
+        layout : tuple
+            A permutation of ('b', 0, 1, 'c') starting with 'b'.
+        """
+        if self.view_converter is None or \
+                not hasattr(self.view_converter, 'set_layout'):
+            raise ValueError("Only the design matrices of datasets with a "
+                             "DefaultViewConverter can be laid out in "
+                             "another axis ordering.")
+        if not isinstance(self.X, np.ndarray):
+            raise NotImplementedError("Only design matrices held in a "
+                                      "numpy.ndarray can be laid out in "
+                                      "another axis ordering, not %s."
+                                      % type(self.X))
+        topo_view = self.view_converter.design_mat_to_topo_view(self.X)
+        self.view_converter.set_layout(layout)
+        self.X = np.ascontiguousarray(
+            self.view_converter.topo_view_to_design_mat(topo_view))
+
 
 class DenseDesignMatrixPyTables(DenseDesignMatrix):
 
@@ -1297,14 +1339,21 @@ class DefaultViewConverter(object):
     axes : tuple
       The axis ordering to use in topological views of the data. Must be some
       permutation of ('b', 0, 1, 'c'). Default: ('b', 0, 1, 'c')
+    layout : tuple
+      The axis ordering in which the examples are laid out in the rows of
+      the design matrix. Must be some permutation of ('b', 0, 1, 'c')
+      starting with 'b'. Batches formatted to a Conv2DSpace with these axes
+      are reshaped views of the rows of the design matrix, while other
+      axes need a transposed copy. Default: ('b', 'c', 0, 1)
     """
 
-    def __init__(self, shape, axes=('b', 0, 1, 'c')):
+    def __init__(self, shape, axes=('b', 0, 1, 'c'), layout=('b', 'c', 0, 1)):
         self.shape = shape
         self.pixels_per_channel = 1
         for dim in self.shape[:-1]:
             self.pixels_per_channel *= dim
         self.axes = axes
+        self.set_layout(layout)
         self._update_topo_space()
 
     def view_shape(self):
@@ -1331,7 +1380,7 @@ class DefaultViewConverter(object):
         ----------
         design_matrix: numpy.ndarray
           A design matrix with data in rows. Data is assumed to be laid out in
-          memory according to the axis order ('b', 'c', 0, 1)
+          memory according to the axis order self.layout
 
         returns: numpy.ndarray
           A matrix with axis order given by self.axes and batch shape given by
@@ -1355,13 +1404,11 @@ class DefaultViewConverter(object):
                               expected_row_size,
                               design_matrix.shape[1]))
 
-        bc01_shape = tuple([design_matrix.shape[0], ] +  # num. batches
-                           # Maps the (0, 1, 'c') of self.shape to ('c', 0, 1)
-                           [self.shape[i] for i in (2, 0, 1)])
-        topo_array_bc01 = design_matrix.reshape(bc01_shape)
-        axis_order = [('b', 'c', 0, 1).index(axis) for axis in self.axes]
+        topo_array = design_matrix.reshape(
+            self._layout_shape(design_matrix.shape[0]))
+        axis_order = [self.layout.index(axis) for axis in self.axes]
         # Use numpy transpose to support bcolz arrays
-        return np.transpose(topo_array_bc01, axis_order)
+        return np.transpose(topo_array, axis_order)
 
     def design_mat_to_weights_view(self, X):
         """
@@ -1389,9 +1436,9 @@ class DefaultViewConverter(object):
 
         returns: numpy.ndarray
           A design matrix with data in rows. Data, is laid out in memory
-          according to the default axis order ('b', 'c', 0, 1). This will
-          try to return a view into topo_array if possible; otherwise it will
-          allocate a new ndarray.
+          according to the axis order self.layout. This will try to return a
+          view into topo_array if possible; otherwise it will allocate a new
+          ndarray.
         """
         for shape_elem, axis in safe_zip(self.shape, (0, 1, 'c')):
             if topo_array.shape[self.axes.index(axis)] != shape_elem:
@@ -1404,11 +1451,11 @@ class DefaultViewConverter(object):
                     "  self.axes:        %s\n"
                     "  topo_array.shape: %s (should be in self.axes' order)")
 
-        topo_array_bc01 = topo_array.transpose([self.axes.index(ax)
-                                                for ax in ('b', 'c', 0, 1)])
+        topo_array = topo_array.transpose([self.axes.index(ax)
+                                           for ax in self.layout])
 
-        return topo_array_bc01.reshape((topo_array_bc01.shape[0],
-                                        np.prod(topo_array_bc01.shape[1:])))
+        return topo_array.reshape((topo_array.shape[0],
+                                   np.prod(topo_array.shape[1:])))
 
     def get_formatted_batch(self, batch, dspace):
         """
@@ -1425,15 +1472,23 @@ class DefaultViewConverter(object):
             # check that it's a valid batch in dspace.
             return dspace.np_format_as(batch, dspace)
         elif isinstance(dspace, Conv2DSpace):
-            # design_mat_to_topo_view will return a batch formatted
-            # in a Conv2DSpace, but not necessarily the right one.
-            topo_batch = self.design_mat_to_topo_view(batch)
             if self.topo_space.axes != self.axes:
                 warnings.warn("It looks like %s.axes has been changed "
                               "directly, please use the set_axes() method "
                               "instead." % self.__class__.__name__)
                 self._update_topo_space()
 
+            if (dspace.axes == self.layout and
+                    tuple(dspace.shape) + (dspace.num_channels,) ==
+                    tuple(self.shape) and
+                    (dspace.dtype is None or dspace.dtype == batch.dtype)):
+                # The rows of the batch are already laid out in dspace, no
+                # conversion is needed
+                return batch.reshape(self._layout_shape(batch.shape[0]))
+
+            # design_mat_to_topo_view will return a batch formatted
+            # in a Conv2DSpace, but not necessarily the right one.
+            topo_batch = self.design_mat_to_topo_view(batch)
             return self.topo_space.np_format_as(topo_batch, dspace)
         else:
             raise ValueError("%s does not know how to format a batch into "
@@ -1449,6 +1504,9 @@ class DefaultViewConverter(object):
         # Patch old pickle files that don't have the axes attribute.
         if 'axes' not in d:
             d['axes'] = ['b', 0, 1, 'c']
+        # Old pickle files always lay the examples out in ('b', 'c', 0, 1)
+        if 'layout' not in d:
+            d['layout'] = ('b', 'c', 0, 1)
         self.__dict__.update(d)
 
         # Same for topo_space
@@ -1471,6 +1529,41 @@ class DefaultViewConverter(object):
         self.axes = axes
         self._update_topo_space()
 
+    def set_layout(self, layout):
+        """
+        Sets the axis ordering in which the examples are laid out in the
+        rows of the design matrix. This does not move the data: use
+        `DenseDesignMatrix.set_design_matrix_layout` to change the layout
+        of the design matrix of a dataset.
+
+        Parameters
+        ----------
+        layout : tuple
+            A permutation of ('b', 0, 1, 'c') starting with 'b'.
+        """
+        layout = tuple(layout)
+        if sorted(layout, key=str) != sorted(('b', 0, 1, 'c'), key=str) or \
+                layout[0] != 'b':
+            raise ValueError("layout must be a permutation of ('b', 0, 1, "
+                             "'c') starting with 'b', got %s" % str(layout))
+        self.layout = layout
+
+    def _layout_shape(self, num_examples):
+        """
+        Returns the shape of `num_examples` rows of the design matrix
+        reshaped to the axes of self.layout.
+
+        Parameters
+        ----------
+        num_examples : int
+            The number of rows.
+        """
+        dims = {'b': num_examples,
+                0: self.shape[0],
+                1: self.shape[1],
+                'c': self.shape[2]}
+        return tuple(dims[axis] for axis in self.layout)
+
 
 def from_dataset(dataset, num_examples):
     """
@@ -1559,7 +1652,7 @@ def dataset_range(dataset, start, stop):
     return rval
 
 
-def convert_to_one_hot(dataset, min_class=0):
+def convert_to_one_hot(dataset, min_class=0, dense=False):
     """
     .. todo::
 
@@ -1567,7 +1660,7 @@ def convert_to_one_hot(dataset, min_class=0):
 
     Convenient way of accessing convert_to_one_hot from a yaml file
     """
-    dataset.convert_to_one_hot(min_class=min_class)
+    dataset.convert_to_one_hot(min_class=min_class, dense=dense)
     return dataset
 
 
@@ -4,6 +4,7 @@ from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrixPyTables
 from pylearn2.datasets.dense_design_matrix import DefaultViewConverter
 from pylearn2.datasets.dense_design_matrix import from_dataset
+from pylearn2.space import Conv2DSpace, VectorSpace
 from pylearn2.utils import serial
 
 
@@ -28,10 +29,24 @@ def test_init_with_X_or_topo():
 def test_convert_to_one_hot():
     rng = np.random.RandomState([2013, 11, 14])
     m = 11
+    y = rng.randint(low=0, high=10, size=(m,))
     d = DenseDesignMatrix(
         X=rng.randn(m, 4),
-        y=rng.randint(low=0, high=10, size=(m,)))
+        y=y.copy())
     d.convert_to_one_hot()
+    # The labels stay integers, and are expanded when iterating
+    assert d.y.shape == (m, 1)
+    num_classes = y.max() + 1
+    targets = VectorSpace(dim=num_classes)
+    batch = d.iterator(mode='sequential', batch_size=m,
+                       data_specs=(targets, 'targets')).next()
+    np.testing.assert_equal(batch, np.eye(num_classes)[y])
+
+    d = DenseDesignMatrix(
+        X=rng.randn(m, 4),
+        y=y.copy())
+    d.convert_to_one_hot(dense=True)
+    np.testing.assert_equal(d.y, np.eye(num_classes)[y])
 
 
 def test_init_with_vc():
@@ -106,3 +121,29 @@ def test_from_dataset():
     assert slice_d.X.shape[1] == d3.X.shape[1]
     assert slice_d.X.shape[0] == 5
     assert slice_d.y.shape[0] == 5
+
+
+def test_design_matrix_layout():
+    """
+    Tests that laying the design matrix out in the axes of a Conv2DSpace
+    makes its batches views of the design matrix, without changing them.
+    """
+    rng = np.random.RandomState([2015, 3, 18])
+    topo_view = rng.randn(10, 2, 3, 4).astype('float32')
+    d = DenseDesignMatrix(topo_view=topo_view)
+    space = Conv2DSpace(shape=(2, 3), num_channels=4, dtype='float32')
+
+    def get_batches():
+        return list(d.iterator(mode='sequential', batch_size=5,
+                               data_specs=(space, 'features')))
+
+    expected = get_batches()
+    d.set_design_matrix_layout(('b', 0, 1, 'c'))
+    np.testing.assert_equal(d.get_topological_view(), topo_view)
+    batches = get_batches()
+    for batch, expected_batch in zip(batches, expected):
+        np.testing.assert_equal(batch, expected_batch)
+        assert batch.flags.c_contiguous
+        assert np.may_share_memory(batch, d.X)
+    np.testing.assert_raises(ValueError, d.set_design_matrix_layout,
+                             (0, 'b', 1, 'c'))
@@ -30,11 +30,13 @@ from theano import config
 from theano import function
 import time
 from pylearn2.utils import sharedX
-from theano.sandbox.rng_mrg import MRG_RandomStreams
+from pylearn2.utils.lazy_import import lazy_import
 from theano.gof.op import get_debug_values
 
 logger = logging.getLogger(__name__)
 
+rng_mrg = lazy_import('theano.sandbox.rng_mrg')
+
 
 def max_pool(z, pool_shape, top_down=None, theano_rng=None):
     """
@@ -1021,7 +1023,7 @@ def profile_samples(f):
     """
     logger.info('profiling samples {0}'.format(f))
     rng = np.random.RandomState([2012, 7, 19])
-    theano_rng = MRG_RandomStreams(rng.randint(2147462579))
+    theano_rng = rng_mrg.MRG_RandomStreams(rng.randint(2147462579))
     batch_size = 80
     rows = 26
     cols = 27
@@ -1,8 +1,5 @@
 """Code for reformatting supervised learning targets."""
-from operator import mul
-
 import numpy as np
-from theano.compat.six.moves import reduce
 import theano.sparse
 if theano.sparse.enable_sparse:
     scipy_available = True
@@ -48,7 +45,7 @@ class OneHotFormatter(object):
                                      (self.__class__.__name__, str(dtype))))
             self._dtype = dtype
 
-    def format(self, targets, mode='stack', sparse=False):
+    def format(self, targets, mode='stack', sparse=False, out=None):
         """
         Formats a given array of target labels into a one-hot
         vector. If labels appear multiple times, their value
@@ -74,9 +71,16 @@ class OneHotFormatter(object):
                 the result is the same in case a label
                 is duplicated in the input.
         sparse : bool
-            If true then the return value is sparse matrix. Note that
+            If true then the return value is a CSR matrix. Note that
             if sparse is True, then mode cannot be 'stack' because
-            sparse matrices need to be 2D
+            sparse matrices need to be 2D, and targets must be 2D
+        out : ndarray, optional
+            A dense array of the shape of the result in which to write it,
+            instead of allocating one. If it is the `out` of the previous
+            call to this formatter and was not modified since, only the
+            ones written by that call are reset to zero, so that reusing a
+            buffer costs as much as the number of labels rather than the
+            size of the buffer.
 
         Returns
         -------
@@ -96,38 +100,94 @@ class OneHotFormatter(object):
                              "dimensions" % targets.ndim)
         if 'int' not in str(targets.dtype):
             raise TypeError("need an integer array for targets")
+        max_labels = self._max_labels
+        if targets.size > 0 and (targets.min() < 0 or
+                                 targets.max() >= max_labels):
+            raise ValueError("Targets must be in [0, %d), got values in "
+                             "[%d, %d]" % (max_labels, targets.min(),
+                                           targets.max()))
         if sparse:
             if not scipy_available:
                 raise RuntimeError("The converting of indices to a sparse "
                                    "one-hot vector requires scipy to be "
                                    "installed")
-            if mode == 'concatenate':
-                one_hot = scipy.sparse.csr_matrix(
-                    (np.ones(targets.size, dtype=self._dtype),
-                     (targets.flatten() + np.arange(targets.size)
-                      * self._max_labels)
-                     % (self._max_labels * targets.shape[1]),
-                     np.arange(targets.shape[0] + 1) * targets.shape[1]),
-                    (targets.shape[0], self._max_labels * targets.shape[1])
-                )
-            elif mode == 'merge':
-                one_hot = scipy.sparse.csr_matrix(
-                    (np.ones(targets.size), targets.flatten(),
-                     np.arange(targets.shape[0] + 1) * targets.shape[1]),
-                    (targets.shape[0], self._max_labels)
-                )
+            if out is not None:
+                raise ValueError("Sparse one-hot matrices can not be written "
+                                 "to a buffer.")
+            if targets.ndim != 2:
+                raise ValueError("Sparse one-hot matrices need 2D targets, "
+                                 "got %d dimensions" % targets.ndim)
+            return self._format_csr(targets, mode)
+
+        # The position of each one in the flattened result
+        flat_targets = targets.ravel()
+        num_labels = targets.shape[-1]
+        if mode == 'merge':
+            shape = targets.shape[:-1] + (max_labels,)
+            rows = np.arange(targets.size) // num_labels
         else:
-            one_hot = np.zeros(targets.shape + (self._max_labels,),
-                               dtype=self._dtype)
-            shape = (np.prod(one_hot.shape[:-1]), one_hot.shape[-1])
-            one_hot.reshape(shape)[np.arange(shape[0]), targets.flatten()] = 1
-            if mode == 'concatenate':
-                shape = one_hot.shape[-3:-2] + (reduce(mul,
-                                                       one_hot.shape[-2:], 1),)
-                one_hot = one_hot.reshape(shape)
-            elif mode == 'merge':
-                one_hot = np.minimum(one_hot.sum(axis=one_hot.ndim - 2), 1)
-        return one_hot
+            if mode == 'stack':
+                shape = targets.shape + (max_labels,)
+            else:
+                shape = targets.shape[:-1] + (num_labels * max_labels,)
+            rows = np.arange(targets.size)
+        index = rows * max_labels + flat_targets
+
+        if out is None:
+            one_hot = np.zeros(shape, dtype=self._dtype)
+            one_hot.reshape(-1)[index] = 1
+            return one_hot
+
+        if out.shape != shape:
+            raise ValueError("out should have shape %s, got %s"
+                             % (shape, out.shape))
+        last_out, last_index = getattr(self, '_last', (None, None))
+        if last_out is out:
+            out.flat[last_index] = 0
+        else:
+            out.fill(0)
+        out.flat[index] = 1
+        self._last = (out, index)
+        return out
+
+    def _format_csr(self, targets, mode):
+        """
+        Returns the one-hot CSR matrix of 2D targets, built directly from
+        their indices.
+
+        Parameters
+        ----------
+        targets : ndarray
+            A batch (2D array) where each row is a list of targets.
+        mode : string
+            'concatenate' or 'merge', see `format`.
+        """
+        num_rows, num_labels = targets.shape
+        max_labels = self._max_labels
+        if mode == 'concatenate':
+            indices = (targets + np.arange(num_labels) * max_labels).ravel()
+            indptr = np.arange(num_rows + 1) * num_labels
+            shape = (num_rows, num_labels * max_labels)
+        else:
+            # Duplicated labels are a single one, and the labels of each
+            # row are sorted so that the matrix is in canonical format
+            labels = np.sort(targets, axis=1)
+            keep = np.ones(labels.shape, dtype=bool)
+            keep[:, 1:] = labels[:, 1:] != labels[:, :-1]
+            indices = labels[keep]
+            indptr = np.zeros(num_rows + 1, dtype=int)
+            np.cumsum(keep.sum(axis=1), out=indptr[1:])
+            shape = (num_rows, max_labels)
+        data = np.ones(indices.size, dtype=self._dtype)
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape)
+
+    def __getstate__(self):
+        """
+        Leaves the buffer of the last call to `format` out of pickles.
+        """
+        state = self.__dict__.copy()
+        state.pop('_last', None)
+        return state
 
     def theano_expr(self, targets, mode='stack', sparse=False):
         """
@@ -334,10 +394,9 @@ def compressed_one_hot(labels, dtype=None, out=None, simplify_binary=True,
         to `labels.dtype` if not provided.
 
     out : ndarray, optional
-        An array to use in lieu of allocating one. Must be the
-        right shape, i.e. same first dimension as `labels` and
-        second dimension greater than or equal to the number of
-        unique values in `labels`.
+        An array to use in lieu of allocating one. Must have the
+        shape of the result, which depends on the number of unique
+        values in `labels`.
 
     simplify_binary : bool, optional
         If `True`, if there are only two distinct labels, return
@@ -373,12 +432,17 @@ def compressed_one_hot(labels, dtype=None, out=None, simplify_binary=True,
         in which the corresponding columns appear in `out`.
     """
     labels = _validate_labels(labels, ndim=1)
-    labels_ = labels.copy()
-    uniq = np.unique(labels_)
-    for i, e in enumerate(uniq):
-        labels_[labels_ == e] = i
+    uniq, labels_ = np.unique(labels, return_inverse=True)
     if simplify_binary and len(uniq) == 2:
-        return labels_.reshape((labels_.shape[0], 1)), uniq
+        labels_ = labels_.reshape((labels_.shape[0], 1))
+        if out is not None:
+            if out.shape != labels_.shape:
+                raise ValueError("out should have shape %s, got %s"
+                                 % (labels_.shape, out.shape))
+            out[...] = labels_
+            labels_ = out
+        return labels_, uniq
     else:
+        # OneHotFormatter checks the shape of out
         return OneHotFormatter(len(uniq), dtype=dtype).format(
-            labels_, mode=mode, sparse=sparse), uniq
+            labels_, mode=mode, sparse=sparse, out=out), uniq
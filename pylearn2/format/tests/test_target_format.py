@@ -144,3 +144,64 @@ def test_out_compressed_one_hot():
     out, uniq = compressed_one_hot([2, 5], simplify_binary=False)
     assert_equal(out, [[1, 0], [0, 1]])
     assert_equal(uniq, [2, 5])
+
+
+def test_one_hot_formatter_out():
+    fmt = OneHotFormatter(max_labels=5)
+    rng = numpy.random.RandomState(0)
+    for mode, shape in [('stack', (4, 2, 5)), ('concatenate', (4, 10)),
+                        ('merge', (4, 5))]:
+        out = numpy.empty(shape, dtype='float32')
+        for i in range(3):
+            labels = rng.randint(0, 5, size=(4, 2))
+            rval = fmt.format(labels, mode=mode, out=out)
+            assert_(rval is out)
+            assert_equal(out, fmt.format(labels, mode=mode))
+        # A buffer not written by the previous call is fully reset
+        out = numpy.ones(shape, dtype='float32')
+        assert_equal(fmt.format(labels, mode=mode, out=out),
+                     fmt.format(labels, mode=mode))
+    assert_raises(ValueError, fmt.format, numpy.zeros(3, dtype='int32'),
+                  out=numpy.zeros((3, 4)))
+
+
+def test_one_hot_formatter_range():
+    fmt = OneHotFormatter(max_labels=3)
+    assert_raises(ValueError, fmt.format, numpy.array([0, 3]))
+    assert_raises(ValueError, fmt.format, numpy.array([[-1, 0]]),
+                  mode='merge')
+
+
+def test_one_hot_formatter_sparse():
+    fmt = OneHotFormatter(max_labels=4, dtype='float32')
+    labels = numpy.array([[3, 1, 3], [0, 0, 0], [2, 1, 0]])
+    for mode in ['concatenate', 'merge']:
+        one_hot = fmt.format(labels, mode=mode, sparse=True)
+        assert_equal(str(one_hot.dtype), 'float32')
+        assert_(one_hot.has_canonical_format)
+        assert_equal(one_hot.toarray(), fmt.format(labels, mode=mode))
+    assert_raises(ValueError, fmt.format, labels, mode='merge', sparse=True,
+                  out=numpy.zeros((3, 4)))
+
+
+def test_compressed_one_hot_out():
+    out = numpy.zeros((3, 3))
+    rval, uniq = compressed_one_hot([2, 5, 3], out=out)
+    assert_(rval is out)
+    assert_equal(out, [[1, 0, 0], [0, 0, 1], [0, 1, 0]])
+
+    out = numpy.zeros(9)
+    rval, uniq = compressed_one_hot([2, 5, 3], out=out, mode='concatenate')
+    assert_(rval is out)
+    assert_equal(out, compressed_one_hot([2, 5, 3], mode='concatenate')[0])
+
+    out = numpy.ones((2, 1))
+    rval, uniq = compressed_one_hot([5, 2], out=out)
+    assert_(rval is out)
+    assert_equal(out, [[1], [0]])
+
+    # The number of columns comes from the labels, not from out
+    assert_raises(ValueError, compressed_one_hot, [2, 5, 3],
+                  out=numpy.zeros((3, 4)))
+    assert_raises(ValueError, compressed_one_hot, [5, 2],
+                  out=numpy.zeros((2, 2)))
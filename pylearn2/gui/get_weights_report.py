@@ -9,16 +9,18 @@ from theano.compat.six.moves import input
 
 from pylearn2.utils import serial
 from pylearn2.gui import patch_viewer
-from pylearn2.config import yaml_parse
 from pylearn2.datasets import control
 import numpy as np
 
 
 from pylearn2.utils.exc import reraise_as
+from pylearn2.utils.lazy_import import lazy_import
 
 
 logger = logging.getLogger(__name__)
 
+yaml_parse = lazy_import('pylearn2.config.yaml_parse')
+
 
 def get_weights_report(model_path=None,
                        model=None,
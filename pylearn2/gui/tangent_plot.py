@@ -4,12 +4,12 @@ Code for plotting curves with tangent lines.
 
 __author__ = "Ian Goodfellow"
 
-try:
-    from matplotlib import pyplot
-except Exception:
-    pyplot = None
 from theano.compat.six.moves import xrange
 
+from pylearn2.utils.lazy_import import is_available, lazy_import
+
+pyplot = lazy_import('matplotlib.pyplot')
+
 
 def tangent_plot(x, y, s):
     """
@@ -35,7 +35,7 @@ def tangent_plot(x, y, s):
     assert len(y) == n
     assert len(s) == n
 
-    if pyplot is None:
+    if not is_available(pyplot):
         raise RuntimeError("Could not import pyplot, can't run this code.")
 
     pyplot.plot(x, y, color='b')
@@ -1,15 +1,16 @@
 """K-means as a postprocessing Block subclass."""
 
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy
 from theano.compat.six.moves import xrange
 from pylearn2.blocks import Block
 from pylearn2.models.model import Model
 from pylearn2.space import VectorSpace
 from pylearn2.utils import sharedX
-from pylearn2.utils.mem import improve_memory_error_message
 from pylearn2.utils import wraps
 from pylearn2.utils import contains_nan
+from pylearn2.utils.rng import make_np_rng
 import warnings
 
 try:
@@ -18,11 +19,114 @@ except ImportError:
     milk = None
     warnings.warn(""" Install milk ( http://packages.python.org/milk/ )
                     It has a better k-means implementation. Falling back to
-                    our own really slow implementation. """)
+                    our own implementation. """)
 
 logger = logging.getLogger(__name__)
 
 
+def _assign_chunk(X, x_sq, mu, mu_sq, start, stop, min_dists):
+    """
+    Assigns the examples `start:stop` of `X` to their closest mean.
+
+    The squared distances are computed as ||x||^2 - 2 x.mu + ||mu||^2,
+    so that most of the work is a single matrix product. The terms
+    cancel out when the examples are close to their mean, so they are
+    computed in float64 even for float32 examples, at the price of a
+    float64 copy of the chunk and a slower matrix product.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        The design matrix.
+    x_sq : numpy.ndarray
+        The squared norms of the rows of `X`, in float64.
+    mu : numpy.ndarray
+        The means, one per row, in float64.
+    mu_sq : numpy.ndarray
+        The squared norms of the means, in float64.
+    start : int
+        The first example of the chunk.
+    stop : int
+        The example after the last one of the chunk.
+    min_dists : numpy.ndarray
+        Receives the squared distance of each example to its mean.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        The number of examples of the chunk assigned to each mean.
+    sums : numpy.ndarray
+        The sum of the examples of the chunk assigned to each mean.
+    """
+    k, m = mu.shape
+    X = numpy.asarray(X[start:stop], dtype='float64')
+    dists = numpy.dot(X, mu.T)
+    dists *= -2
+    dists += mu_sq
+    dists += x_sq[start:stop, numpy.newaxis]
+    assign = dists.argmin(axis=1)
+    # Rounding errors can make the expanded form slightly negative
+    numpy.maximum(dists[numpy.arange(len(assign)), assign], 0,
+                  out=min_dists[start:stop])
+
+    counts = numpy.bincount(assign, minlength=k)
+    # Sum the examples of each mean over contiguous runs of sorted examples
+    order = numpy.argsort(assign, kind='mergesort')
+    clusters = numpy.flatnonzero(counts)
+    starts = numpy.cumsum(counts[clusters]) - counts[clusters]
+    sums = numpy.zeros((k, m))
+    sums[clusters] = numpy.add.reduceat(X[order], starts, axis=0)
+    return counts, sums
+
+
+def _kmeans_plus_plus(X, x_sq, k, rng):
+    """
+    Chooses `k` examples of `X` as initial means with k-means++: each
+    mean is drawn with a probability proportional to the squared
+    distance of the examples to the closest mean already chosen.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        The design matrix.
+    x_sq : numpy.ndarray
+        The squared norms of the rows of `X`, in float64. The dot
+        products are computed in the dtype of `X`, which only perturbs
+        the probabilities of drawing the examples.
+    k : int
+        The number of means.
+    rng : numpy.random.RandomState
+        Draws the means.
+
+    Returns
+    -------
+    mu : numpy.ndarray
+        The means, one per row.
+    """
+    n = X.shape[0]
+    mu = numpy.empty((k, X.shape[1]), dtype=X.dtype)
+    closest = None
+    idx = rng.randint(n)
+    for i in xrange(k):
+        if i > 0:
+            cumulative = numpy.cumsum(closest)
+            if cumulative[-1] > 0:
+                idx = numpy.searchsorted(
+                    cumulative, rng.uniform(0, cumulative[-1]), side='right')
+                idx = min(idx, n - 1)
+            else:
+                # All the examples are already means
+                idx = rng.randint(n)
+        mu[i] = X[idx]
+        dists = x_sq - 2 * numpy.dot(X, mu[i]) + x_sq[idx]
+        numpy.maximum(dists, 0, out=dists)
+        if closest is None:
+            closest = dists
+        else:
+            numpy.minimum(closest, dists, out=closest)
+    return mu
+
+
 class KMeans(Block, Model):
     """
     Block that outputs a vector of probabilities that a sample belong
@@ -41,10 +145,25 @@ class KMeans(Block, Model):
         Maximum number of iterations. Defaults to infinity.
     verbose : bool
         WRITEME
+    init : str, optional
+        How the means are initialized when `train_all` is not given
+        them: 'k-means++' draws them with k-means++ seeding, 'random'
+        picks random examples.
+    chunk_size : int, optional
+        The number of examples whose distances to the means are computed
+        at once. Defaults to about 8MB of distances, and 8MB of examples
+        copied to float64.
+    num_threads : int, optional
+        The number of threads computing the distances of the chunks.
+    rng : numpy.random.RandomState or seed, optional
+        Initializes the means.
     """
 
+    _default_seed = [2015, 4, 21]
+
     def __init__(self, k, nvis, convergence_th=1e-6, max_iter=None,
-                 verbose=False):
+                 verbose=False, init='k-means++', chunk_size=None,
+                 num_threads=1, rng=None):
         Block.__init__(self)
         Model.__init__(self)
 
@@ -61,6 +180,20 @@ class KMeans(Block, Model):
             self.max_iter = float('inf')
 
         self.verbose = verbose
+        if init not in ('k-means++', 'random'):
+            raise ValueError("init must be 'k-means++' or 'random', got %s"
+                             % str(init))
+        self.init = init
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be positive, got %d"
+                             % chunk_size)
+        self.chunk_size = chunk_size
+        if num_threads < 1:
+            raise ValueError("num_threads must be positive, got %d"
+                             % num_threads)
+        self.num_threads = num_threads
+        self.rng = make_np_rng(rng, self._default_seed,
+                               which_method=['randint', 'uniform'])
 
     def train_all(self, dataset, mu=None):
         """
@@ -89,106 +222,93 @@ class KMeans(Block, Model):
             cluster_ids, mu = milk.kmeans(X, k)
         else:
             # our own implementation
+            x_sq = numpy.einsum('ij,ij->i', X, X, dtype='float64')
 
-            # taking random inputs as initial clusters if user does not provide
-            # them.
+            # initializing the clusters if user does not provide them.
             if mu is not None:
                 if not len(mu) == k:
                     raise Exception("You gave %i clusters"
                                     ", but k=%i were expected"
                                     % (len(mu), k))
+                mu = numpy.array(mu, dtype=X.dtype)
+            elif self.init == 'k-means++':
+                mu = _kmeans_plus_plus(X, x_sq, k, self.rng)
             else:
-                indices = numpy.random.randint(X.shape[0], size=k)
+                indices = self.rng.randint(X.shape[0], size=k)
                 mu = X[indices]
 
-            try:
-                dists = numpy.zeros((n, k))
-            except MemoryError as e:
-                improve_memory_error_message(e, "dying trying to allocate "
-                                                "dists matrix for {0} "
-                                                "examples and {1} "
-                                                "means".format(n, k))
-
-            old_kills = {}
-
-            iter = 0
-            mmd = prev_mmd = float('inf')
-            while True:
-                if self.verbose:
-                    logger.info('kmeans iter {0}'.format(iter))
-
-                # print 'iter:',iter,' conv crit:',abs(mmd-prev_mmd)
-                # if numpy.sum(numpy.isnan(mu)) > 0:
-                if contains_nan(mu):
-                    logger.info('nan found')
-                    return X
-
-                # computing distances
-                for i in xrange(k):
-                    dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
-
-                if iter > 0:
-                    prev_mmd = mmd
-
-                min_dists = dists.min(axis=1)
-
-                # mean minimum distance:
-                mmd = min_dists.mean()
-
-                logger.info('cost: {0}'.format(mmd))
-
-                if iter > 0 and (iter >= self.max_iter or
-                                 abs(mmd - prev_mmd) < self.convergence_th):
-                    # converged
-                    break
-
-                # finding minimum distances
-                min_dist_inds = dists.argmin(axis=1)
-
-                # computing means
-                i = 0
-                blacklist = []
-                new_kills = {}
-                while i < k:
-                    b = min_dist_inds == i
-                    if not numpy.any(b):
-                        killed_on_prev_iter = True
-                        # initializes empty cluster to be the mean of the d
-                        # data points farthest from their corresponding means
-                        if i in old_kills:
-                            d = old_kills[i] - 1
-                            if d == 0:
-                                d = 50
-                            new_kills[i] = d
-                        else:
-                            d = 5
-                        mu[i, :] = 0
-                        for j in xrange(d):
-                            idx = numpy.argmax(min_dists)
-                            min_dists[idx] = 0
-                            # chose point idx
-                            mu[i, :] += X[idx, :]
-                            blacklist.append(idx)
-                        mu[i, :] /= float(d)
-                        # cluster i was empty, reset it to d far out data
-                        # points recomputing distances for this cluster
-                        dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
-                        min_dists = dists.min(axis=1)
-                        for idx in blacklist:
-                            min_dists[idx] = 0
-                        min_dist_inds = dists.argmin(axis=1)
-                        # done
-                        i += 1
-                    else:
-                        mu[i, :] = numpy.mean(X[b, :], axis=0)
-                        if contains_nan(mu):
-                            logger.info('nan found at {0}'.format(i))
-                            return X
-                        i += 1
+            chunk_size = self.chunk_size
+            if chunk_size is None:
+                # Bounds both the distances and the float64 copy of the
+                # examples of a chunk
+                chunk_size = max(1, 2 ** 20 // max(k, m))
+            chunks = [(start, min(start + chunk_size, n))
+                      for start in xrange(0, n, chunk_size)]
+            min_dists = numpy.empty(n)
 
-                old_kills = new_kills
+            pool = None
+            if self.num_threads > 1 and len(chunks) > 1:
+                pool = ThreadPool(self.num_threads)
 
-                iter += 1
+            try:
+                iter = 0
+                mmd = prev_mmd = float('inf')
+                while True:
+                    if self.verbose:
+                        logger.info('kmeans iter {0}'.format(iter))
+
+                    if contains_nan(mu):
+                        logger.info('nan found')
+                        return X
+
+                    # computing distances, and the sums of the examples
+                    # closest to each mean
+                    mu64 = numpy.asarray(mu, dtype='float64')
+                    mu_sq = numpy.einsum('ij,ij->i', mu64, mu64)
+
+                    def assign(chunk):
+                        return _assign_chunk(X, x_sq, mu64, mu_sq, chunk[0],
+                                             chunk[1], min_dists)
+                    if pool is None:
+                        stats = [assign(chunk) for chunk in chunks]
+                    else:
+                        stats = pool.map(assign, chunks)
+                    counts = sum(c for c, s in stats)
+                    sums = sum(s for c, s in stats)
+
+                    if iter > 0:
+                        prev_mmd = mmd
+
+                    # mean minimum distance:
+                    mmd = min_dists.mean()
+
+                    logger.info('cost: {0}'.format(mmd))
+
+                    if iter > 0 and (iter >= self.max_iter or
+                                     abs(mmd - prev_mmd) <
+                                     self.convergence_th):
+                        # converged
+                        break
+
+                    # computing means
+                    alive = counts > 0
+                    mu[alive] = sums[alive] / counts[alive, numpy.newaxis]
+
+                    # initializes each empty cluster to be the mean of 5
+                    # of the data points farthest from their means
+                    dead = numpy.flatnonzero(~alive)
+                    if len(dead) > 0:
+                        num_far = min(5 * len(dead), n)
+                        far = numpy.argsort(-min_dists,
+                                            kind='mergesort')[:num_far]
+                        far = far[numpy.arange(5 * len(dead)) % num_far]
+                        mu[dead] = X[far.reshape((len(dead), 5))].mean(
+                            axis=1)
+
+                    iter += 1
+            finally:
+                if pool is not None:
+                    pool.close()
 
         self.mu = sharedX(mu)
         self._params = [self.mu]
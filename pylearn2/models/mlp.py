@@ -18,13 +18,9 @@ from theano.compat import six
 from theano.compat.six.moves import reduce, xrange
 from theano import config
 from theano.gof.op import get_debug_values
-from theano.sandbox.rng_mrg import MRG_RandomStreams
-from theano.sandbox.cuda.dnn import dnn_available, dnn_pool
-from theano.tensor.signal.downsample import max_pool_2d
 import theano.tensor as T
 
 from pylearn2.compat import OrderedDict
-from pylearn2.costs.mlp import Default
 from pylearn2.expr.probabilistic_max_pooling import max_pool_channels
 from pylearn2.linear import conv2d
 from pylearn2.linear.matrixmul import MatrixMul
@@ -49,19 +45,24 @@ from pylearn2.utils import wraps
 from pylearn2.utils import contains_inf
 from pylearn2.utils import isfinite
 from pylearn2.utils.data_specs import DataSpecsMapping
+from pylearn2.utils.lazy_import import lazy_import
 
 from pylearn2.expr.nnet import (elemwise_kl, kl, compute_precision,
                                 compute_recall, compute_f1)
 
-# Only to be used by the deprecation warning wrapper functions
-from pylearn2.costs.mlp import L1WeightDecay as _L1WD
-from pylearn2.costs.mlp import WeightDecay as _WD
-
 from pylearn2.sandbox.rnn.models.mlp_hook import RNNWrapper
 
 
 logger = logging.getLogger(__name__)
 
+# Only needed when pooling layers build their graphs, and importing the
+# cuDNN wrappers initializes the CUDA backend.
+dnn = lazy_import('theano.sandbox.cuda.dnn')
+rng_mrg = lazy_import('theano.sandbox.rng_mrg')
+downsample = lazy_import('theano.tensor.signal.downsample')
+# Only needed to train, not to unpickle or apply a model.
+costs_mlp = lazy_import('pylearn2.costs.mlp')
+
 logger.debug("MLP changing the recursion limit.")
 # We need this to be high enough that the big theano graphs we make
 # when doing max pooling via subtensors don't cause python to complain.
@@ -516,7 +517,7 @@ class MLP(Layer):
     @wraps(Layer.get_default_cost)
     def get_default_cost(self):
 
-        return Default()
+        return costs_mlp.Default()
 
     @wraps(Layer.get_output_space)
     def get_output_space(self):
@@ -820,7 +821,8 @@ class MLP(Layer):
         self._validate_layer_names(list(input_include_probs.keys()))
         self._validate_layer_names(list(input_scales.keys()))
 
-        theano_rng = MRG_RandomStreams(max(self.rng.randint(2 ** 15), 1))
+        theano_rng = rng_mrg.MRG_RandomStreams(
+            max(self.rng.randint(2 ** 15), 1))
 
         for layer in self.layers:
             layer_name = layer.layer_name
@@ -3457,7 +3459,7 @@ def pool_dnn(bc01, pool_shape, pool_stride, mode='max'):
                                   'in Pylearn2 using cuDNN as of '
                                   'January 19th, 2015.')
 
-    mx = dnn_pool(bc01, tuple(pool_shape), tuple(pool_stride), mode)
+    mx = dnn.dnn_pool(bc01, tuple(pool_shape), tuple(pool_stride), mode)
     return mx
 
 
@@ -3504,12 +3506,12 @@ def max_pool(bc01, pool_shape, pool_stride, image_shape, try_dnn=True):
         name = 'anon_bc01'
 
     if try_dnn and bc01.dtype == "float32":
-        use_dnn = dnn_available()
+        use_dnn = dnn.dnn_available()
     else:
         use_dnn = False
 
     if pool_shape == pool_stride and not use_dnn:
-        mx = max_pool_2d(bc01, pool_shape, False)
+        mx = downsample.max_pool_2d(bc01, pool_shape, False)
         mx.name = 'max_pool(' + name + ')'
         return mx
 
@@ -3808,20 +3810,38 @@ def mean_pool(bc01, pool_shape, pool_stride, image_shape):
     return mx
 
 
-@wraps(_WD)
 def WeightDecay(*args, **kwargs):
+    """
+    Deprecated alias of `pylearn2.costs.mlp.WeightDecay`.
+
+    Parameters
+    ----------
+    args : list
+        Positional arguments passed to `pylearn2.costs.mlp.WeightDecay`.
+    kwargs : dict
+        Keyword arguments passed to `pylearn2.costs.mlp.WeightDecay`.
+    """
     warnings.warn("pylearn2.models.mlp.WeightDecay has moved to "
                   "pylearn2.costs.mlp.WeightDecay. This link"
                   "may be removed after 2015-05-13.")
-    return _WD(*args, **kwargs)
+    return costs_mlp.WeightDecay(*args, **kwargs)
 
 
-@wraps(_L1WD)
 def L1WeightDecay(*args, **kwargs):
+    """
+    Deprecated alias of `pylearn2.costs.mlp.L1WeightDecay`.
+
+    Parameters
+    ----------
+    args : list
+        Positional arguments passed to `pylearn2.costs.mlp.L1WeightDecay`.
+    kwargs : dict
+        Keyword arguments passed to `pylearn2.costs.mlp.L1WeightDecay`.
+    """
     warnings.warn("pylearn2.models.mlp.L1WeightDecay has moved to "
                   "pylearn2.costs.mlp.WeightDecay. This link"
                   "may be removed after 2015-05-13.")
-    return _L1WD(*args, **kwargs)
+    return costs_mlp.L1WeightDecay(*args, **kwargs)
 
 
 class LinearGaussian(Linear):
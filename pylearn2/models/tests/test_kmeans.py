@@ -26,3 +26,59 @@ def test_kmeans():
 
     train = Train(model=model, dataset=dataset)
     train.main_loop()
+
+
+def test_kmeans_clusters():
+    """
+    Tests that both initializations find well separated clusters, with
+    and without threads.
+    """
+    rng = np.random.RandomState(0)
+    centers = rng.uniform(-10, 10, size=(4, 3))
+    labels = rng.randint(4, size=200)
+    X = centers[labels] + rng.normal(scale=.1, size=(200, 3))
+    dataset = DenseDesignMatrix(X=X)
+
+    for init in ['k-means++', 'random']:
+        model = KMeans(k=4, nvis=3, init=init, rng=0)
+        model.train_all(dataset)
+        mu = model.get_params()[0].get_value()
+        assert mu.shape == (4, 3)
+        if init == 'k-means++':
+            # Every cluster is matched by a mean
+            dists = ((centers[:, np.newaxis] - mu) ** 2).sum(axis=2)
+            assert np.all(dists.min(axis=1) < .1)
+
+    single = KMeans(k=4, nvis=3, rng=1, chunk_size=7)
+    single.train_all(dataset)
+    threaded = KMeans(k=4, nvis=3, rng=1, chunk_size=7, num_threads=3)
+    threaded.train_all(dataset)
+    np.testing.assert_allclose(single.mu.get_value(),
+                               threaded.mu.get_value())
+
+
+def test_kmeans_dead_cluster():
+    """
+    Tests that a mean without examples is moved to the examples farthest
+    from their means.
+    """
+    X = np.array([[0.], [.1], [.2], [10.], [10.1], [10.2]])
+    dataset = DenseDesignMatrix(X=X)
+    model = KMeans(k=2, nvis=1, max_iter=3)
+    model.train_all(dataset, mu=np.array([[0.], [100.]]))
+    mu = np.sort(model.mu.get_value(), axis=0)
+    np.testing.assert_allclose(mu, [[.1], [10.1]], rtol=1e-5)
+
+
+def test_kmeans_float32_offset():
+    """
+    Tests that float32 examples far from the origin are assigned to the
+    closest mean, despite the cancellation in the expanded distances.
+    """
+    X = np.array([[1000.], [1000.01], [1000.05], [1000.06]],
+                 dtype='float32')
+    dataset = DenseDesignMatrix(X=X)
+    model = KMeans(k=2, nvis=1, max_iter=2)
+    model.train_all(dataset, mu=X[[0, 3]])
+    mu = np.sort(model.mu.get_value(), axis=0)
+    np.testing.assert_allclose(mu, [[1000.005], [1000.055]], rtol=1e-6)
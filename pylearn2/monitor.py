@@ -10,11 +10,16 @@ __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 
 import copy
+import multiprocessing
+import os
+import threading
 import time
+import traceback
 import warnings
 import logging
 import numpy as np
 from theano.compat import six
+from theano.compat.six.moves import queue
 
 from pylearn2.compat import OrderedDict
 import theano.sparse
@@ -22,18 +27,33 @@ from theano import config
 from theano import tensor as T
 from theano.printing import var_descriptor
 
-from pylearn2.config import yaml_parse
 from pylearn2.datasets.dataset import Dataset
 from pylearn2.space import Space, CompositeSpace, NullSpace
 from pylearn2.utils import function, sharedX, safe_zip, safe_izip
+from pylearn2.utils.checkpoint import get_plain_state, set_plain_state
 from pylearn2.utils.exc import reraise_as
+from pylearn2.utils.function_cache import get_mode
 from pylearn2.utils.iteration import is_stochastic
+from pylearn2.utils.lazy_import import lazy_import
 from pylearn2.utils.data_specs import DataSpecsMapping
 from pylearn2.utils.string_utils import number_aware_alphabetical_key
 from pylearn2.utils.timing import log_timing
 
 log = logging.getLogger(__name__)
 
+yaml_parse = lazy_import('pylearn2.config.yaml_parse')
+
+# The locks held by Monitor.call_async while it forks, see
+# register_fork_lock
+_fork_locks = []
+
+# The type of the elements of each record of a MonitorChannel
+RECORD_DTYPES = OrderedDict([('val_record', config.floatX),
+                             ('batch_record', 'int64'),
+                             ('example_record', 'int64'),
+                             ('epoch_record', 'int64'),
+                             ('time_record', 'float64')])
+
 
 class Monitor(object):
     """
@@ -74,7 +94,12 @@ class Monitor(object):
         self._num_batches = []
         self._dirty = True
         self._rng_seed = []
-        self.names_to_del = ['theano_function_mode']
+        self._resample_rngs = []
+        self._schedules = []
+        self.names_to_del = ['theano_function_mode', '_async_job',
+                             '_record_callbacks']
+        self._async_job = None
+        self._record_callbacks = []
         self.t0 = time.time()
         self.theano_function_mode = None
         self.on_channel_conflict = 'error'
@@ -129,10 +154,15 @@ class Monitor(object):
             self.theano_function_mode = mode
 
     def add_dataset(self, dataset, mode='sequential', batch_size=None,
-                    num_batches=None, seed=None):
+                    num_batches=None, seed=None, subsample=None,
+                    resample=False, schedule=None):
         """
         Determines the data used to calculate the values of each channel.
 
+        `mode`, `batch_size`, `num_batches`, `seed`, `subsample`,
+        `resample` and `schedule` can be given either once for all
+        datasets or as lists with one element per dataset.
+
         Parameters
         ----------
         dataset : object
@@ -150,6 +180,22 @@ class Monitor(object):
             batches will be calculated based on full dataset size).
         seed : int, optional
             Optional. The seed to be used for random iteration modes.
+        subsample : int, optional
+            If specified, the channels are computed on a random subset of
+            this many examples of the dataset instead of the whole
+            dataset, drawn without replacement. The size of the subset
+            is rounded down to a multiple of `batch_size`, and
+            `num_batches` is ignored. Requires `mode` to be 'sequential'
+            or 'shuffled_sequential'.
+        resample : bool, optional
+            Only used with `subsample`. If True, a different subset is
+            drawn every time the channels are computed. If False (the
+            default), the same subset is used every time, so that the
+            records can be compared to each other.
+        schedule : MonitorSchedule, optional
+            Decides when the channels of the dataset are computed. If
+            not specified, they are computed every time the monitor is
+            called.
         """
         # The user can ommit using lists if only one dataset is set
         if not isinstance(dataset, list):
@@ -164,14 +210,47 @@ class Monitor(object):
             seed = [None] * len(dataset)
         if not isinstance(seed, list):
             seed = [seed]
+        if not isinstance(subsample, list):
+            subsample = [subsample] * len(dataset)
+        if not isinstance(resample, list):
+            resample = [resample] * len(dataset)
+        if not isinstance(schedule, list):
+            schedule = [schedule] * len(dataset)
         if len(mode) != len(dataset):
             raise ValueError("Received " + str(len(dataset)) +
                              " dataset but " + str(len(mode)) + " modes.")
         if any([len(l) != len(dataset) for l in [batch_size, seed]]):
             raise ValueError("make sure each dataset has its iteration " +
                              "batch size and number of batches.")
-        for (d, m, b, n, sd) in safe_izip(dataset, mode, batch_size,
-                                          num_batches, seed):
+        if any([len(l) != len(dataset) for l in [subsample, resample,
+                                                 schedule]]):
+            raise ValueError("make sure each dataset has its subsample "
+                             "size, resampling option and schedule.")
+        for (d, m, b, n, sd, sub, rs, sch) in safe_izip(dataset, mode,
+                                                        batch_size,
+                                                        num_batches, seed,
+                                                        subsample, resample,
+                                                        schedule):
+            if sub is not None:
+                if m not in ('sequential', 'shuffled_sequential'):
+                    raise ValueError("Monitor.add_dataset can only "
+                                     "subsample with the 'sequential' or "
+                                     "'shuffled_sequential' modes, got " +
+                                     str(m))
+                if sub < 1:
+                    raise ValueError("subsample must be a positive number "
+                                     "of examples, got " + str(sub))
+                # A prefix of a random permutation of the examples is a
+                # subset drawn without replacement. It is the same subset
+                # at every call as long as the seed stays the same.
+                m = 'shuffled_sequential'
+                b = sub if b is None else min(b, sub)
+                n = sub // b
+                if sd is None:
+                    sd = [2013, 2, 22]
+            elif rs:
+                raise ValueError("resample requires subsample to be "
+                                 "specified.")
             try:
                 it = d.iterator(mode=m,
                                 batch_size=b,
@@ -205,29 +284,195 @@ class Monitor(object):
                 self._batch_size.append(b)
                 self._num_batches.append(n)
                 self._rng_seed.append(sd)
+                if rs:
+                    self._resample_rngs.append(np.random.RandomState(sd))
+                else:
+                    self._resample_rngs.append(None)
+                self._schedules.append(sch)
 
     def __call__(self):
         """
-        Runs the model on the monitoring dataset in order to add one
+        Runs the model on the monitoring datasets in order to add one
         data point to each of the channels.
+
+        Datasets whose schedule says they are not due are skipped, and
+        their channels get no new data point.
         """
+        # Record the results of a pending call_async first, so that
+        # records stay in order.
+        self.wait()
 
         # If the channels have changed at all, we need to recompile the theano
         # functions used to compute them
         if self._dirty:
             self.redo_theano()
 
-        datasets = self._datasets
+        jobs = self._begin_record()
+        self._accumulate(jobs)
+        self._record([idx for idx, dataset, seed in jobs], self._get_counts())
+
+    def call_async(self):
+        """
+        Like `__call__`, but the channels are computed in a forked
+        process while the caller goes on, e.g. with training.
+
+        The process sees the parameters of the model and every other
+        shared variable as they are when this method is called, so the
+        channels describe the model at that time, whatever training does
+        in the meantime. Being a separate process, it does not compete
+        with the caller for the interpreter lock. The new data points are
+        only added to the channels by `wait`, with the epoch, batch and
+        example counts and the time of this call.
+
+        On platforms without `os.fork`, or when Theano uses a GPU, whose
+        context cannot be used by a forked process, the channels are
+        computed right away, like `__call__` does.
+
+        A thread holding a lock (e.g. of the logging module) when the
+        process is forked would leave it locked forever in the forked
+        process, which could then deadlock. The channels are thus also
+        computed right away while threads that are not daemon threads
+        (e.g. the ones of `pylearn2.utils.serial.AsyncSaver`) are
+        running. Daemon threads must not be running code that takes
+        locks, unless they do it while holding a lock registered with
+        `register_fork_lock`.
+        """
+        self.wait()
+        if self._dirty:
+            self.redo_theano()
+
+        jobs = self._begin_record()
+        monitored = [idx for idx, dataset, seed in jobs]
+        counts = self._get_counts()
+        threads = _non_daemon_threads()
+        if threads:
+            names = ', '.join(thread.name for thread in threads)
+            log.warning("Computing the monitoring channels right away "
+                        "rather than in a forked process, since threads "
+                        "are running: %s", names)
+        if threads or not _can_fork():
+            self._accumulate(jobs)
+            self._record(monitored, counts)
+            return
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=self._accumulate_in_child,
+                                          args=(jobs, results),
+                                          name='Monitor.call_async')
+        process.daemon = True
+        locks = list(_fork_locks)
+        for lock in locks:
+            lock.acquire()
+        try:
+            process.start()
+        finally:
+            for lock in locks:
+                lock.release()
+        self._async_job = (process, results, monitored, counts)
+
+    def _accumulate_in_child(self, jobs, results):
+        """
+        Body of the processes forked by `call_async`: accumulates the
+        channels and sends their values back.
+
+        Parameters
+        ----------
+        jobs : list of tuples
+            The return value of `_begin_record`.
+        results : multiprocessing.Queue
+            Receives a dictionary mapping the names of the channels to
+            their values, and the formatted traceback of the error that
+            occurred, if any.
+        """
+        try:
+            self._accumulate(jobs)
+            values = dict((name, channel.val_shared.get_value())
+                          for name, channel in six.iteritems(self.channels))
+            results.put((values, None))
+        except Exception:
+            results.put((None, traceback.format_exc()))
+
+    def wait(self):
+        """
+        Waits for the channels computed by the last call to `call_async`,
+        if any, and adds their new data points. Errors raised while
+        computing them are raised again here.
+        """
+        if self._async_job is None:
+            return
+        process, results, monitored, counts = self._async_job
+        self._async_job = None
+        with log_timing(log, None, level=logging.DEBUG,
+                        final_msg='Waited for the monitoring channels:'):
+            while True:
+                try:
+                    values, error = results.get(timeout=1.)
+                    break
+                except queue.Empty:
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError("The monitoring process died "
+                                           "with exit code %d"
+                                           % process.exitcode)
+            process.join()
+        if error is not None:
+            raise RuntimeError("Computing the monitoring channels "
+                               "failed:\n" + error)
+        for name, value in six.iteritems(values):
+            if name in self.channels:
+                self.channels[name].val_shared.set_value(value)
+        self._record(monitored, counts)
+
+    def _get_counts(self):
+        """
+        Returns the epoch, batch and example counts and the time to
+        attach to the next data points.
+        """
+        return (self._epochs_seen, self._num_batches_seen,
+                self._examples_seen, time.time() - self.t0)
+
+    def _begin_record(self):
+        """
+        Calls the record callbacks, resets the channels, computes the
+        channels that do not depend on data, and selects the datasets to
+        monitor.
 
+        Returns
+        -------
+        jobs : list of tuples
+            The index of each dataset to monitor, with the dataset itself
+            and the seed of its iterator.
+        """
+        for callback in self._record_callbacks:
+            callback()
         # Set all channels' val_shared to 0
         self.begin_record_entry()
-        for d, i, b, n, a, sd, ne in safe_izip(datasets,
-                                               self._iteration_mode,
-                                               self._batch_size,
-                                               self._num_batches,
-                                               self.accum,
-                                               self._rng_seed,
-                                               self.num_examples):
+        self.accum_data_independent()
+
+        jobs = []
+        for idx, schedule in enumerate(self._schedules):
+            if schedule is not None and not schedule.is_due(self):
+                continue
+            seed = self._rng_seed[idx]
+            if self._resample_rngs[idx] is not None:
+                seed = self._resample_rngs[idx].randint(2 ** 30)
+            jobs.append((idx, self._datasets[idx], seed))
+        return jobs
+
+    def _accumulate(self, jobs):
+        """
+        Accumulates the values of the channels over the monitoring
+        datasets.
+
+        Parameters
+        ----------
+        jobs : list of tuples
+            The return value of `_begin_record`.
+        """
+        for idx, d, sd in jobs:
+            i = self._iteration_mode[idx]
+            b = self._batch_size[idx]
+            n = self._num_batches[idx]
+            a = self.accum[idx]
+            ne = self.num_examples[idx]
             if isinstance(d, six.string_types):
                 d = yaml_parse.load(d)
                 raise NotImplementedError()
@@ -262,20 +507,36 @@ class Monitor(object):
                                        "it had %d examples total, but at "
                                        "runtime it gave us %d." %
                                        (ne, actual_ne))
-        # end for d
 
+    def _record(self, monitored, counts):
+        """
+        Adds the accumulated values to the records of the channels of
+        the monitored datasets, and of the channels that do not depend on
+        data.
+
+        Parameters
+        ----------
+        monitored : list of int
+            Indices of the datasets that were monitored.
+        counts : tuple
+            The epoch, batch and example counts and the time to attach to
+            the data points, from `_get_counts`.
+        """
+        epochs_seen, batches_seen, examples_seen, t = counts
         log.info("Monitoring step:")
-        log.info("\tEpochs seen: %d" % self._epochs_seen)
-        log.info("\tBatches seen: %d" % self._num_batches_seen)
-        log.info("\tExamples seen: %d" % self._examples_seen)
-        t = time.time() - self.t0
+        log.info("\tEpochs seen: %d" % epochs_seen)
+        log.info("\tBatches seen: %d" % batches_seen)
+        log.info("\tExamples seen: %d" % examples_seen)
         for channel_name in sorted(self.channels.keys(),
                                    key=number_aware_alphabetical_key):
             channel = self.channels[channel_name]
+            if channel.dataset is not None and \
+               self._datasets.index(channel.dataset) not in monitored:
+                continue
             channel.time_record.append(t)
-            channel.batch_record.append(self._num_batches_seen)
-            channel.example_record.append(self._examples_seen)
-            channel.epoch_record.append(self._epochs_seen)
+            channel.batch_record.append(batches_seen)
+            channel.example_record.append(examples_seen)
+            channel.epoch_record.append(epochs_seen)
             val = channel.val_shared.get_value()
             channel.val_record.append(val)
             # TODO: use logging infrastructure so that user can configure
@@ -287,6 +548,15 @@ class Monitor(object):
 
             log.info("\t%s: %s" % (channel_name, val_str))
 
+        for idx in monitored:
+            schedule = self._schedules[idx]
+            if schedule is not None:
+                schedule.update(self, [channel for channel
+                                       in self.channels.values()
+                                       if channel.dataset is not None and
+                                       self._datasets.index(
+                                           channel.dataset) == idx])
+
     def run_prereqs(self, data, dataset):
         """
         Runs all "prerequistie functions" on a batch of data. Always
@@ -364,6 +634,43 @@ class Monitor(object):
         """
         self._epochs_seen += 1
 
+    def restore_records(self, old_monitor):
+        """
+        Continues the history of `old_monitor`, typically a monitor
+        loaded from a training checkpoint: copies its counts of batches,
+        examples and epochs seen and the records of every channel that
+        exists in both monitors.
+
+        Parameters
+        ----------
+        old_monitor : Monitor
+            The monitor whose history to continue.
+        """
+        self._num_batches_seen = old_monitor._num_batches_seen
+        self._examples_seen = old_monitor._examples_seen
+        self._epochs_seen = old_monitor._epochs_seen
+        self.training_succeeded = old_monitor.training_succeeded
+        last_time = 0.
+        for name, old_channel in six.iteritems(old_monitor.channels):
+            if name not in self.channels:
+                log.warning("Channel %s of the restored monitor no longer "
+                            "exists, its history is dropped.", name)
+                continue
+            channel = self.channels[name]
+            for field, dtype in six.iteritems(RECORD_DTYPES):
+                setattr(channel, field,
+                        ChannelRecord(getattr(old_channel, field), dtype))
+            if len(channel.time_record) > 0 and \
+               channel.time_record[-1] is not None:
+                last_time = max(last_time, channel.time_record[-1])
+        # Keep the time records increasing across the interruption
+        self.t0 = time.time() - last_time
+        # Resume the monitoring schedules where they were
+        for schedule, old_schedule in zip(self._schedules,
+                                          old_monitor._schedules):
+            if schedule is not None and type(schedule) is type(old_schedule):
+                schedule.set_state(old_schedule.get_state())
+
     def redo_theano(self):
         """
         Recompiles Theano functions used by this monitor.
@@ -386,7 +693,7 @@ class Monitor(object):
         init_names = dir(self)
         self.prereqs = OrderedDict()
         for channel in self.channels.values():
-            if channel.prereqs is not None:
+            if channel.prereqs is not None and channel.dataset is not None:
                 dataset = channel.dataset
                 if dataset not in self.prereqs:
                     self.prereqs[dataset] = []
@@ -402,9 +709,19 @@ class Monitor(object):
             self.begin_record_entry = function(
                 inputs=[],
                 updates=updates,
-                mode=self.theano_function_mode,
+                mode=get_mode(self.theano_function_mode),
                 name='Monitor.begin_record_entry'
             )
+        updates = OrderedDict((channel.val_shared, channel.val)
+                              for channel in self.channels.values()
+                              if channel.dataset is None)
+        with log_timing(log, "compiling accum_data_independent"):
+            self.accum_data_independent = function(
+                inputs=[],
+                updates=updates,
+                mode=get_mode(self.theano_function_mode),
+                name='Monitor.accum_data_independent'
+            )
         updates = OrderedDict()
         givens = OrderedDict()
         # Get the appropriate kind of theano variable to represent the data
@@ -442,7 +759,10 @@ class Monitor(object):
                              for i in it]
         givens = [OrderedDict() for d in self._datasets]
         updates = [OrderedDict() for d in self._datasets]
+
         for i, channel in enumerate(self.channels.values()):
+            if channel.dataset is None:
+                continue
             index = self._datasets.index(channel.dataset)
             d = self._datasets[index]
             g = givens[index]
@@ -513,7 +833,8 @@ class Monitor(object):
                 self.accum.append(function(theano_args,
                                            givens=g,
                                            updates=u,
-                                           mode=self.theano_function_mode,
+                                           mode=get_mode(
+                                               self.theano_function_mode),
                                            name=function_name))
             for a in self.accum:
                 if mode is not None and hasattr(mode, 'record'):
@@ -593,8 +914,15 @@ class Monitor(object):
         if '_dataset' in d:
             d['_datasets'] = [d['_dataset']]
             del d['_dataset']
+        if '_schedules' not in d:
+            d['_resample_rngs'] = [None] * len(d['_datasets'])
+            d['_schedules'] = [None] * len(d['_datasets'])
 
         self.__dict__.update(d)
+        self._async_job = None
+        self._record_callbacks = []
+        if '_record_callbacks' not in self.names_to_del:
+            self.names_to_del.append('_record_callbacks')
 
     def add_channel(self, name, ipt, val, dataset=None, prereqs=None,
                     data_specs=None):
@@ -708,6 +1036,75 @@ class Monitor(object):
             reraise_as(ValueError("The dataset specified is not one of the " +
                                   "monitor's datasets"))
 
+        self._set_channel(name, ipt, val, data_specs, dataset, prereqs)
+
+    def add_data_independent_channel(self, name, val):
+        """
+        Asks the monitor to start tracking a value that does not depend
+        on any data, such as a shared variable updated by the training
+        algorithm.
+
+        Unlike the channels of `add_channel`, such a channel does not
+        belong to a monitoring dataset: it gets a new data point at every
+        monitoring step, whatever the schedules of the datasets, without
+        iterating over any data, and it can be tracked by a monitor that
+        has no dataset at all. Its value is computed when the monitoring
+        step starts, even with `call_async`.
+
+        Parameters
+        ----------
+        name : str
+            The display name in the monitor.
+        val : tensor_like
+            The value to be tracked. It may only depend on shared
+            variables and constants.
+        """
+        val = T.as_tensor_variable(val)
+        for elem in theano.gof.graph.inputs([val]):
+            if not hasattr(elem, 'get_value') and \
+               not isinstance(elem, theano.gof.graph.Constant):
+                raise ValueError("Channel %s depends on %s, which is not a "
+                                 "shared variable." % (name, elem))
+        self._set_channel(name, None, val, (NullSpace(), ''), None, None)
+
+    def add_record_callback(self, callback):
+        """
+        Registers a function to call at the start of every monitoring
+        step, before the channels that do not depend on data are
+        computed, e.g. to set the shared variables they track.
+
+        Unlike prerequisites, callbacks are always called by the
+        training process, even with `call_async`. They are not saved
+        with the monitor.
+
+        Parameters
+        ----------
+        callback : callable
+            Called without arguments.
+        """
+        self._record_callbacks.append(callback)
+
+    def _set_channel(self, name, ipt, val, data_specs, dataset, prereqs):
+        """
+        Creates a channel, handling name conflicts according to
+        `on_channel_conflict`.
+
+        Parameters
+        ----------
+        name : str
+            The display name in the monitor.
+        ipt : tensor_like
+            The symbolic inputs of the channel.
+        val : tensor_like
+            The value to be tracked.
+        data_specs : (space, source) pair
+            Identifies the order, format and semantics of ipt
+        dataset : pylearn2.datasets.Dataset or None
+            The dataset to compute the channel on, or None if it does
+            not depend on data.
+        prereqs : list of callables or None
+            See `add_channel`.
+        """
         if ((self.on_channel_conflict not in
              ('error', 'copy_history', 'overwrite'))):
             raise ValueError("on_channel_conflict should be either 'error'" +
@@ -794,7 +1191,8 @@ class Monitor(object):
 
     def setup(self, dataset, cost, batch_size, num_batches=None,
               extra_costs=None, mode='sequential', obj_prereqs=None,
-              cost_monitoring_args=None):
+              cost_monitoring_args=None, subsample=None, resample=False,
+              schedule=None):
         """
         Sets up the monitor for a cost minimization problem.
         Adds channels defined by both the model and the cost for
@@ -829,6 +1227,19 @@ class Monitor(object):
             Dictionary of kwargs that will be passed to
             `cost.get_monitoring_channels()`
             (but not for the extra_costs).
+        subsample : int or dict, optional
+            Size of the random subset of each dataset the channels are
+            computed on; see `add_dataset`. Can be a dictionary mapping
+            dataset names to sizes, in which case datasets that are not
+            in it are not subsampled.
+        resample : bool or dict, optional
+            Whether to draw a new subset at every computation; see
+            `add_dataset`. Can be a dictionary mapping dataset names to
+            booleans.
+        schedule : MonitorSchedule or dict, optional
+            Decides when the channels of each dataset are computed; see
+            `add_dataset`. Can be a dictionary mapping dataset names to
+            schedules. A single schedule is copied for each dataset.
         """
 
         if dataset is None:
@@ -919,13 +1330,24 @@ class Monitor(object):
         else:
             seed = None
 
+        def for_dataset(option, dataset_name, default):
+            if isinstance(option, dict):
+                return option.get(dataset_name, default)
+            return copy.deepcopy(option)
+
         for dataset_name in dataset:
             cur_dataset = dataset[dataset_name]
             self.add_dataset(dataset=cur_dataset,
                              mode=mode,
                              batch_size=batch_size,
                              num_batches=num_batches,
-                             seed=seed)
+                             seed=seed,
+                             subsample=for_dataset(subsample, dataset_name,
+                                                   None),
+                             resample=for_dataset(resample, dataset_name,
+                                                  False),
+                             schedule=[for_dataset(schedule, dataset_name,
+                                                   None)])
             if dataset_name == '':
                 dprefix = ''
             else:
@@ -963,6 +1385,371 @@ class Monitor(object):
                                  dataset=cur_dataset)
 
 
+class MonitorSchedule(object):
+    """
+    Decides when the channels of a monitoring dataset are computed.
+
+    The base class computes them every time the monitor is called.
+    Subclasses can monitor expensive datasets less often; see
+    `Monitor.add_dataset`.
+    """
+
+    def is_due(self, monitor):
+        """
+        Returns True if the channels of the dataset should be computed
+        in the current monitoring step.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor that is being called.
+        """
+        return True
+
+    def update(self, monitor, channels):
+        """
+        Called after the channels of the dataset have been computed and
+        recorded.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor that has been called.
+        channels : list of MonitorChannel
+            The channels of the dataset, with their new records.
+        """
+
+    def get_state(self):
+        """
+        Returns the progress of the schedule, to be saved in training
+        checkpoints.
+        """
+        return get_plain_state(self)
+
+    def set_state(self, state):
+        """
+        Restores progress saved with `get_state`.
+
+        Parameters
+        ----------
+        state : dict
+            The return value of `get_state`.
+        """
+        set_plain_state(self, state)
+
+
+class PeriodicMonitorSchedule(MonitorSchedule):
+    """
+    Computes the channels of a dataset once every few epochs or seconds.
+
+    The channels are always computed the first time the monitor is
+    called, so that training starts with a record of every channel.
+
+    Parameters
+    ----------
+    epochs : int, optional
+        Number of training epochs between two computations of the
+        channels.
+    seconds : float, optional
+        Number of seconds between two computations of the channels. If
+        both `epochs` and `seconds` are specified, the channels are
+        computed as soon as either period has elapsed.
+    """
+
+    def __init__(self, epochs=None, seconds=None):
+        if epochs is None and seconds is None:
+            raise ValueError("PeriodicMonitorSchedule needs a period in "
+                             "epochs or in seconds.")
+        if epochs is not None and epochs < 1:
+            raise ValueError("epochs must be at least 1, got " + str(epochs))
+        if seconds is not None and seconds < 0:
+            raise ValueError("seconds must be non-negative, got " +
+                             str(seconds))
+        self.epochs = epochs
+        self.seconds = seconds
+        self.last_epoch = None
+        self.last_time = None
+
+    def is_due(self, monitor):
+        """
+        Returns True if one of the periods has elapsed since the last
+        computation of the channels.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor that is being called.
+        """
+        if self.last_epoch is None:
+            return True
+        if (self.epochs is not None and
+                monitor.get_epochs_seen() - self.last_epoch >= self.epochs):
+            return True
+        return (self.seconds is not None and
+                time.time() - self.last_time >= self.seconds)
+
+    def update(self, monitor, channels):
+        """
+        Starts a new period.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor that has been called.
+        channels : list of MonitorChannel
+            The channels of the dataset, with their new records.
+        """
+        # With Monitor.call_async, the records are older than the
+        # current state of the monitor.
+        if channels:
+            self.last_epoch = channels[0].epoch_record[-1]
+            self.last_time = monitor.t0 + channels[0].time_record[-1]
+        else:
+            self.last_epoch = monitor.get_epochs_seen()
+            self.last_time = time.time()
+
+
+class AdaptiveMonitorSchedule(PeriodicMonitorSchedule):
+    """
+    Computes the channels of a dataset often while they change quickly,
+    and less and less often as they level off.
+
+    After each computation, the largest relative change of the channels
+    since their previous record is compared to `threshold`. If it is
+    larger, the period in epochs is halved, otherwise it is doubled,
+    within `[min_epochs, max_epochs]`.
+
+    Termination criteria and extensions that watch these channels see
+    fewer records, so their patience should be set in records rather
+    than epochs.
+
+    Parameters
+    ----------
+    min_epochs : int, optional
+        The shortest period, used while the channels change quickly.
+    max_epochs : int, optional
+        The longest period, used once the channels have levelled off.
+    threshold : float, optional
+        Relative change of a channel above which it is considered to
+        change quickly.
+    channel_names : list of str, optional
+        The channels whose changes are tracked. If not specified, all
+        the channels of the dataset are tracked.
+    """
+
+    def __init__(self, min_epochs=1, max_epochs=16, threshold=.01,
+                 channel_names=None):
+        if min_epochs < 1 or max_epochs < min_epochs:
+            raise ValueError("Expected 1 <= min_epochs <= max_epochs, got "
+                             "min_epochs=%s and max_epochs=%s"
+                             % (min_epochs, max_epochs))
+        super(AdaptiveMonitorSchedule, self).__init__(epochs=min_epochs)
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.threshold = threshold
+        self.channel_names = channel_names
+
+    def update(self, monitor, channels):
+        """
+        Starts a new period, whose length depends on how fast the
+        channels changed.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor that has been called.
+        channels : list of MonitorChannel
+            The channels of the dataset, with their new records.
+        """
+        super(AdaptiveMonitorSchedule, self).update(monitor, channels)
+        # Relative changes are never negative
+        change = -1.
+        for channel in channels:
+            if (self.channel_names is not None and
+                    channel.name not in self.channel_names):
+                continue
+            if len(channel.val_record) < 2:
+                continue
+            old, new = channel.val_record[-2:]
+            if not (np.isfinite(old) and np.isfinite(new)):
+                continue
+            change = max(change, abs(new - old) / max(abs(old), 1e-8))
+        if change < 0:
+            # Nothing to compare to yet
+            return
+        if change > self.threshold:
+            self.epochs = max(self.min_epochs, self.epochs // 2)
+        else:
+            self.epochs = min(self.max_epochs, self.epochs * 2)
+
+
+class ChannelRecord(object):
+    """
+    A growable one-dimensional array holding the history of one field of
+    a `MonitorChannel`.
+
+    It behaves like the list it replaces (`append`, `extend`, `+=`,
+    indexing, slicing, iteration, `len` and comparison with lists), but
+    stores its elements in a typed NumPy array whose capacity doubles
+    when it is full, so appending is amortized constant time.
+    `numpy.asarray(record)` returns a view of the elements without
+    copying them, and the whole record is pickled as a single array.
+
+    Parameters
+    ----------
+    values : iterable, optional
+        The initial elements.
+    dtype : str or numpy.dtype, optional
+        The type of the elements. If elements that cannot be converted
+        to it are added (e.g. None in the records of old pickle files),
+        the record switches to the `object` type.
+    """
+
+    def __init__(self, values=(), dtype='float64'):
+        try:
+            data = np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            data = np.array(values, dtype=object)
+        self._data = data.reshape((data.size,))
+        self._size = self._data.shape[0]
+
+    @property
+    def dtype(self):
+        """
+        The type of the elements.
+        """
+        return self._data.dtype
+
+    def _reserve(self, capacity):
+        """
+        Makes room for at least `capacity` elements.
+
+        Parameters
+        ----------
+        capacity : int
+            The number of elements the storage must be able to hold.
+        """
+        if capacity <= self._data.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._data.shape[0], 16)
+        data = np.empty(new_capacity, dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def _convert_to_object(self):
+        """
+        Switches the storage to the `object` type.
+        """
+        self._data = self._data.astype(object)
+
+    def append(self, value):
+        """
+        Adds an element at the end of the record.
+
+        Parameters
+        ----------
+        value : object
+            The element to add.
+        """
+        self._reserve(self._size + 1)
+        try:
+            self._data[self._size] = value
+        except (TypeError, ValueError):
+            self._convert_to_object()
+            self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        """
+        Adds elements at the end of the record.
+
+        Parameters
+        ----------
+        values : iterable
+            The elements to add.
+        """
+        values = list(values)
+        self._reserve(self._size + len(values))
+        try:
+            self._data[self._size:self._size + len(values)] = values
+        except (TypeError, ValueError):
+            self._convert_to_object()
+            self._data[self._size:self._size + len(values)] = values
+        self._size += len(values)
+
+    def __array__(self, dtype=None):
+        """
+        Returns a view of the elements.
+
+        Parameters
+        ----------
+        dtype : numpy.dtype, optional
+            If specified, the elements are converted to this type.
+        """
+        values = self._data[:self._size]
+        if dtype is not None:
+            values = values.astype(dtype)
+        return values
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self._data[:self._size])
+
+    def __getitem__(self, index):
+        values = self._data[:self._size][index]
+        if isinstance(index, slice):
+            return ChannelRecord(values, dtype=self._data.dtype)
+        return values
+
+    def __setitem__(self, index, value):
+        self._data[:self._size][index] = value
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __add__(self, values):
+        rval = self[:]
+        rval.extend(values)
+        return rval
+
+    def __eq__(self, other):
+        try:
+            other = list(other)
+        except TypeError:
+            return False
+        return len(other) == self._size and all(
+            a == b for a, b in safe_izip(self._data[:self._size], other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ChannelRecord(%r)' % self._data[:self._size].tolist()
+
+    def __getstate__(self):
+        """
+        Returns the elements as one array, without the unused capacity.
+        """
+        return {'data': self._data[:self._size].copy()}
+
+    def __setstate__(self, d):
+        """
+        Sets the object to have the state described by `d`.
+
+        Parameters
+        ----------
+        d : dict
+            The return value of `__getstate__`.
+        """
+        self._data = d['data']
+        self._size = self._data.shape[0]
+
+
 class MonitorChannel(object):
     """
     A class representing a specific quantity to be monitored.
@@ -978,6 +1765,9 @@ class MonitorChannel(object):
         The display name in the monitor.
     data_specs : (space, source) pair
         Identifies the order, format and semantics of graph_input
+    dataset : pylearn2.datasets.Dataset or None
+        The dataset the channel is computed on, or None if it does not
+        depend on data (see `Monitor.add_data_independent_channel`).
     prereqs : list of callables
         Callables that take numpy tensors each prereq must be called
         exactly once per each new batch of data before the channel
@@ -1016,25 +1806,16 @@ class MonitorChannel(object):
         # Dataset monitored by this channel
         self.dataset = dataset
         if old_channel is not None:
-            # Value of the desired quantity at measurement time.
-            self.val_record = old_channel.val_record[:-1]
-            # Number of batches seen at measurement time.
-            self.batch_record = old_channel.batch_record[:-1]
-            # Number of examples seen at measurement time (batch sizes may
-            # fluctuate).
-            self.example_record = old_channel.example_record[:-1]
-            self.epoch_record = old_channel.epoch_record[:-1]
-            self.time_record = old_channel.time_record[:-1]
+            records = dict((field, getattr(old_channel, field)[:-1])
+                           for field in RECORD_DTYPES)
         else:
-            # Value of the desired quantity at measurement time.
-            self.val_record = []
-            # Number of batches seen at measurement time.
-            self.batch_record = []
-            # Number of examples seen at measurement time (batch sizes may
-            # fluctuate).
-            self.example_record = []
-            self.epoch_record = []
-            self.time_record = []
+            records = dict((field, ()) for field in RECORD_DTYPES)
+        # val_record: value of the desired quantity at measurement time.
+        # batch_record: number of batches seen at measurement time.
+        # example_record: number of examples seen at measurement time
+        # (batch sizes may fluctuate).
+        for field, dtype in six.iteritems(RECORD_DTYPES):
+            setattr(self, field, ChannelRecord(records[field], dtype))
 
     def __str__(self):
         """
@@ -1134,6 +1915,11 @@ class MonitorChannel(object):
             self.epoch_record = range(len(self.val_record))
         if 'time_record' not in d:
             self.time_record = [None] * len(self.val_record)
+        # Old pickle files store the records as lists
+        for field, dtype in six.iteritems(RECORD_DTYPES):
+            record = getattr(self, field)
+            if not isinstance(record, ChannelRecord):
+                setattr(self, field, ChannelRecord(record, dtype))
 
 
 def push_monitor(model, name, transfer_experience=False,
@@ -1270,6 +2056,56 @@ def get_monitor_doc(var):
 
     return doc
 
+
+def register_fork_lock(lock):
+    """
+    Makes `Monitor.call_async` hold `lock` while it forks a process.
+    Background threads running code that takes other locks (e.g. logging
+    or allocating memory) should do it while holding such a lock, so
+    that the forked process does not inherit these locks in a locked
+    state.
+
+    Parameters
+    ----------
+    lock : threading.Lock
+        The lock to hold.
+    """
+    _fork_locks.append(lock)
+
+
+def unregister_fork_lock(lock):
+    """
+    Undoes `register_fork_lock`.
+
+    Parameters
+    ----------
+    lock : threading.Lock
+        A lock given to `register_fork_lock`.
+    """
+    _fork_locks.remove(lock)
+
+
+def _non_daemon_threads():
+    """
+    Returns the threads other than the current one that are running and
+    are not daemon threads.
+    """
+    current = threading.current_thread()
+    return [thread for thread in threading.enumerate()
+            if thread is not current and thread.is_alive() and
+            not thread.daemon]
+
+
+def _can_fork():
+    """
+    Returns True if `Monitor.call_async` can compute the channels in a
+    forked process: the platform supports `os.fork` and Theano does not
+    use a GPU.
+    """
+    return (hasattr(os, 'fork') and config.device == 'cpu' and
+            not config.init_gpu_device)
+
+
 _err_no_data = "You tried to add a channel to a Monitor that has no dataset."
 _err_ambig_data = ("You added a channel to a Monitor that has multiple " +
                    "datasets, and did not specify which dataset to use it " +
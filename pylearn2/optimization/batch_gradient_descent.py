@@ -71,6 +71,21 @@ class BatchGradientDescent(object):
     gradient_updates : dict
         A dictionary of shared variable updates to run each time the
         gradient is computed
+    lbfgs : bool
+        If True, searches along the direction given by the limited-memory
+        BFGS approximation of the inverse Hessian times the gradient,
+        rather than along the gradient. Can not be used with conjugate.
+        Each iteration first tries the whole L-BFGS step, and only runs
+        the line search if it does not decrease the objective enough.
+    lbfgs_memory : int
+        Has no effect unless lbfgs == True. The number of past steps
+        used to approximate the inverse Hessian.
+    reset_lbfgs : bool
+        Has no effect unless lbfgs == True. If True, forgets the past
+        steps at the start of each call to minimize, so the first step
+        is in the direction of steepest descent. Otherwise, the past steps
+        are kept across calls to minimize (which only makes sense if the
+        objective function is the same on each call)
 
     Notes
     -----
@@ -84,7 +99,8 @@ class BatchGradientDescent(object):
                  reset_alpha=True, conjugate=False,
                  reset_conjugate=True, gradients=None,
                  gradient_updates=None, line_search_mode=None,
-                 accumulate=False, theano_function_mode=None):
+                 accumulate=False, theano_function_mode=None,
+                 lbfgs=False, lbfgs_memory=10, reset_lbfgs=True):
 
         self.__dict__.update(locals())
         del self.self
@@ -289,9 +305,87 @@ class BatchGradientDescent(object):
         else:
             self.tol = tol
 
+        if self.lbfgs:
+            if self.conjugate:
+                raise ValueError("lbfgs and conjugate can not be used "
+                                 "together.")
+            num_params = sum(param.get_value(borrow=True).size
+                             for param in self.params)
+            self._lbfgs_history = LBFGSHistory(lbfgs_memory, num_params)
+            # The learning rate scaler of each scalar parameter
+            if lr_scalers is None:
+                lr_scalers = {}
+            self._lbfgs_scales = np.concatenate(
+                [np.repeat(float(lr_scalers.get(param, 1.)),
+                           param.get_value(borrow=True).size)
+                 for param in self.params])
+
         self.ave_step_size = sharedX(0.)
         self.ave_grad_mult = sharedX(0.)
 
+    def _make_lbfgs_direction(self):
+        """
+        Replaces the gradient stored in `param_to_grad_shared` by the
+        L-BFGS search direction, after adding the last step to the
+        history.
+
+        Returns
+        -------
+        slope : float or None
+            The rate at which the objective decreases when stepping
+            against the direction, to first order. None if the direction
+            is the gradient itself, as no step is in the history yet.
+        """
+        history = self._lbfgs_history
+        grad_shared = [self.param_to_grad_shared[param]
+                       for param in self.params]
+        history.update(self.params, grad_shared)
+        direction = history.direction()
+        offset = 0
+        for grad_var in grad_shared:
+            value = grad_var.get_value(borrow=True)
+            grad_var.set_value(direction[offset:offset + value.size]
+                               .reshape(value.shape).astype(value.dtype))
+            offset += value.size
+        if history.num_steps == 0:
+            return None
+        return np.dot(history.gradient * self._lbfgs_scales, direction)
+
+    def _try_unit_step(self, inputs, norm, slope, obj):
+        """
+        Takes the whole L-BFGS step, which is already scaled by the
+        approximation of the inverse Hessian, and keeps it if it
+        satisfies the sufficient decrease (Armijo) condition, with the
+        constant used by
+        `pylearn2.optimization.linesearch.scalar_armijo_search`.
+        Otherwise, the parameters are set back to their cached values.
+
+        Parameters
+        ----------
+        inputs : tuple
+            The inputs of the objective
+        norm : float
+            The norm the search direction was divided by
+        slope : float
+            See `_make_lbfgs_direction`
+        obj : float
+            The objective at the current point, which is known from the
+            previous iteration
+
+        Returns
+        -------
+        obj : float or None
+            The objective after the step, or None if it was undone.
+        """
+        self._goto_alpha(norm)
+        new_obj = self.obj(*inputs)
+        if self.verbose:
+            logger.info('\tunit L-BFGS step {0}'.format(new_obj))
+        if new_obj < obj and new_obj <= obj - 1e-4 * slope:
+            return new_obj
+        self._goto_alpha(0.)
+        return None
+
     def minimize(self, * inputs):
         """
         .. todo::
@@ -304,6 +398,9 @@ class BatchGradientDescent(object):
         alpha_list = list(self.init_alpha)
 
         orig_obj = self.obj(*inputs)
+        # The objective at the current point, kept to avoid evaluating it
+        # again before trying the unit L-BFGS step
+        current_obj = orig_obj
 
         if self.verbose:
             logger.info(orig_obj)
@@ -326,6 +423,9 @@ class BatchGradientDescent(object):
         else:
             norm = 1.
 
+        if self.lbfgs and self.reset_lbfgs:
+            self._lbfgs_history.reset()
+
         while iters != self.max_iter:
             if self.verbose:
                 logger.info('batch gradient descent iteration '
@@ -337,9 +437,19 @@ class BatchGradientDescent(object):
             self._compute_grad(*inputs)
             if self.conjugate:
                 self._make_conjugate()
+            if self.lbfgs:
+                slope = self._make_lbfgs_direction()
             norm = self._normalize_grad()
-
-            if self.line_search_mode is None:
+            unit_obj = None
+            if self.lbfgs and slope is not None:
+                unit_obj = self._try_unit_step(inputs, norm, slope,
+                                               current_obj)
+
+            if unit_obj is not None:
+                best_obj = unit_obj
+                # The step size is measured along the normalized direction
+                step_size = norm
+            elif self.line_search_mode is None:
                 best_obj, best_alpha, best_alpha_ind = \
                     self.obj(* inputs), 0., -1
                 prev_best_obj = best_obj
@@ -520,6 +630,7 @@ class BatchGradientDescent(object):
                 alpha_list = [x/2., x]
                 best_obj = mn
             # end if branching on type of line search
+            current_obj = best_obj
 
             new_weight = self.new_weight.get_value()
             old = self.ave_step_size.get_value()
@@ -555,6 +666,127 @@ class BatchGradientDescent(object):
         return best_obj
 
 
+class LBFGSHistory(object):
+    """
+    The history of the limited-memory BFGS method: the last few steps
+    taken in parameter space, and the corresponding changes of the
+    gradient, stored in preallocated arrays used as ring buffers.
+
+    Parameters
+    ----------
+    memory : int
+        The number of (step, gradient change) pairs to keep
+    num_params : int
+        The total number of scalar parameters being optimized
+    """
+
+    def __init__(self, memory, num_params):
+        if memory < 1:
+            raise ValueError("L-BFGS needs a memory of at least 1 step, "
+                             "got " + str(memory))
+        self.memory = memory
+        self._s = np.zeros((memory, num_params))
+        self._y = np.zeros((memory, num_params))
+        self._rho = np.zeros(memory)
+        self._alpha = np.zeros(memory)
+        self._x = np.zeros(num_params)
+        self._g = np.zeros(num_params)
+        self._prev_x = np.zeros(num_params)
+        self._prev_g = np.zeros(num_params)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all the past steps.
+        """
+        self._size = 0
+        self._newest = -1
+        self._has_prev = False
+
+    def update(self, params, grads):
+        """
+        Reads the current parameters and gradient, and records the step
+        since the last call to `update`.
+
+        The step is discarded if it does not satisfy the curvature
+        condition, since it would make the approximation of the inverse
+        Hessian not positive definite.
+
+        Parameters
+        ----------
+        params : list
+            The shared variables being optimized
+        grads : list
+            Shared variables holding the gradient of each parameter
+        """
+        for flat, variables in [(self._x, params), (self._g, grads)]:
+            offset = 0
+            for var in variables:
+                value = var.get_value(borrow=True)
+                flat[offset:offset + value.size] = value.ravel()
+                offset += value.size
+
+        if self._has_prev:
+            idx = (self._newest + 1) % self.memory
+            s = self._s[idx]
+            y = self._y[idx]
+            np.subtract(self._x, self._prev_x, out=s)
+            np.subtract(self._g, self._prev_g, out=y)
+            ys = np.dot(y, s)
+            if ys > 1e-10 * np.sqrt(np.dot(y, y) * np.dot(s, s)):
+                self._rho[idx] = 1. / ys
+                self._newest = idx
+                self._size = min(self._size + 1, self.memory)
+
+        self._prev_x[...] = self._x
+        self._prev_g[...] = self._g
+        self._has_prev = True
+
+    @property
+    def gradient(self):
+        """
+        The last gradient passed to `update`, as a flat array.
+        """
+        return self._g
+
+    @property
+    def num_steps(self):
+        """
+        The number of past steps used by `direction`.
+        """
+        return self._size
+
+    def direction(self):
+        """
+        Returns the approximation of the inverse Hessian times the last
+        gradient passed to `update`, computed with the two-loop
+        recursion. Stepping against it decreases the objective function.
+
+        Returns
+        -------
+        direction : numpy.ndarray
+            A flat array with one element per scalar parameter
+        """
+        q = self._g.copy()
+        order = [(self._newest - i) % self.memory
+                 for i in xrange(self._size)]
+        for idx in order:
+            self._alpha[idx] = self._rho[idx] * np.dot(self._s[idx], q)
+            q -= self._alpha[idx] * self._y[idx]
+        if self._size > 0:
+            y = self._y[self._newest]
+            q *= np.dot(self._s[self._newest], y) / np.dot(y, y)
+        for idx in reversed(order):
+            beta = self._rho[idx] * np.dot(self._y[idx], q)
+            q += (self._alpha[idx] - beta) * self._s[idx]
+        if not np.dot(q, self._g) > 0.:
+            # Not a descent direction, most likely because of numerical
+            # error: forget the past steps and use steepest descent
+            self._size = 0
+            return self._g.copy()
+        return q
+
+
 class Accumulator(object):
     """
     Standin for a theano function with the given inputs, outputs, updates.
@@ -171,5 +171,90 @@ def test_batch_gradient_descent():
                 assert False
 
 
+def test_lbfgs():
+    """ Verify that the L-BFGS directions let batch gradient descent
+    minimize an ill-conditioned quadratic function in fewer iterations
+    than steepest descent, with both line search modes."""
+
+    n = 10
+    rng = np.random.RandomState([2014, 11, 11])
+    Q = np.linalg.qr(rng.randn(n, n))[0]
+    A = np.cast[config.floatX](np.dot(Q * np.logspace(0, 2, n), Q.T))
+    b = np.cast[config.floatX](rng.randn(n))
+    init_x = np.cast[config.floatX](rng.randn(n))
+    analytical_x = np.linalg.solve(A, -b)
+
+    half = np.cast[config.floatX](0.5)
+    x = sharedX(init_x, name='x')
+    obj = half * T.dot(T.dot(x, A), x) + T.dot(b, x)
+
+    def distance(lbfgs, line_search_mode):
+        x.set_value(init_x)
+        minimizer = BatchGradientDescent(objective=obj,
+                                         params=[x],
+                                         max_iter=30,
+                                         line_search_mode=line_search_mode,
+                                         lbfgs=lbfgs,
+                                         lbfgs_memory=5)
+        minimizer.minimize()
+        return np.abs(x.get_value() - analytical_x).max()
+
+    for line_search_mode in [None, 'exhaustive']:
+        lbfgs_distance = distance(True, line_search_mode)
+        assert lbfgs_distance < 1e-2
+        assert lbfgs_distance < distance(False, line_search_mode)
+
+
+def test_lbfgs_unit_step():
+    """ Verify that L-BFGS takes whole steps when they decrease the
+    objective enough, so that it needs fewer evaluations of the objective
+    than conjugate gradient to reach a better solution, and that trying
+    a whole step evaluates the objective only once."""
+
+    n = 10
+    rng = np.random.RandomState([2014, 11, 12])
+    Q = np.linalg.qr(rng.randn(n, n))[0]
+    A = np.cast[config.floatX](np.dot(Q * np.logspace(0, 2, n), Q.T))
+    b = np.cast[config.floatX](rng.randn(n))
+    init_x = np.cast[config.floatX](rng.randn(n))
+
+    half = np.cast[config.floatX](0.5)
+    x = sharedX(init_x, name='x')
+    obj = half * T.dot(T.dot(x, A), x) + T.dot(b, x)
+
+    def run(**kwargs):
+        x.set_value(init_x)
+        minimizer = BatchGradientDescent(objective=obj,
+                                         params=[x],
+                                         max_iter=20,
+                                         **kwargs)
+        calls = [0]
+        compiled_obj = minimizer.obj
+
+        def counted_obj(*inputs):
+            calls[0] += 1
+            return compiled_obj(*inputs)
+        minimizer.obj = counted_obj
+
+        unit_steps = [0]
+        try_unit_step = minimizer._try_unit_step
+
+        def counted_try_unit_step(*args):
+            before = calls[0]
+            rval = try_unit_step(*args)
+            assert calls[0] == before + 1
+            unit_steps[0] += 1
+            return rval
+        minimizer._try_unit_step = counted_try_unit_step
+        rval = minimizer.minimize(), calls[0]
+        assert unit_steps[0] > 0 or not kwargs.get('lbfgs')
+        return rval
+
+    lbfgs_obj, lbfgs_calls = run(lbfgs=True, lbfgs_memory=5)
+    cg_obj, cg_calls = run(conjugate=True)
+    assert lbfgs_obj <= cg_obj
+    assert lbfgs_calls < cg_calls
+
+
 if __name__ == '__main__':
     test_batch_gradient_descent()
@@ -11,13 +11,10 @@ if cuda.cuda_available:
     import gpu_unshared_conv # register optimizations
 
 import numpy as np
-import warnings
 
-try:
-    import matplotlib.pyplot as plt
-except (RuntimeError, ImportError, TypeError) as matplotlib_exception:
-    warnings.warn("Unable to import matplotlib. Some features unavailable. "
-                  "Original exception: " + str(matplotlib_exception))
+from pylearn2.utils.lazy_import import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,3 @@
+"""
+Scripts measuring the speed of pylearn2.
+"""
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Measures the time it takes to import pylearn2 modules, and fails if it
+exceeds a budget.
+
+Each module is imported in a fresh interpreter, after Theano, so that
+the reported time is the one spent in pylearn2 and in the modules it
+imports on top of Theano. The script also checks that importing the
+modules used by the command line tools and by unpickling does not import
+heavy modules (matplotlib, PIL, yaml, the CUDA backend of Theano and the
+costs, which are only needed to train), which pylearn2 only imports on
+first use.
+
+Examples
+--------
+Check the default budgets, taking the best of 5 runs:
+
+    python import_time.py --repeat 5
+
+Check a single module against a budget of 0.2 seconds:
+
+    python import_time.py --budget 0.2 pylearn2.models.mlp
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+from pylearn2.compat import OrderedDict
+
+# Time budgets in seconds, on top of the time to import Theano
+DEFAULT_BUDGETS = OrderedDict([
+    ('pylearn2', .1),
+    ('pylearn2.utils.serial', .2),
+    ('pylearn2.monitor', .4),
+    ('pylearn2.models.mlp', .5),
+    ('pylearn2.train', .4),
+    ('pylearn2.scripts.print_monitor', .1),
+    ('pylearn2.scripts.show_weights', .5),
+])
+
+# Modules that the modules above must not import
+HEAVY_MODULES = ['matplotlib', 'PIL', 'yaml', 'theano.sandbox.cuda',
+                 'theano.sandbox.rng_mrg', 'theano.tensor.signal.downsample',
+                 'pylearn2.costs']
+
+_MEASURE = """
+import json, sys, time
+t0 = time.time()
+import theano
+t1 = time.time()
+import %s
+t2 = time.time()
+print(json.dumps({'theano': t1 - t0, 'module': t2 - t1,
+                  'heavy': [name for name in %r
+                            if sys.modules.get(name) is not None]}))
+"""
+
+
+def measure(module, python=sys.executable):
+    """
+    Imports a module in a new interpreter.
+
+    Parameters
+    ----------
+    module : str
+        The name of the module.
+    python : str, optional
+        The interpreter to use.
+
+    Returns
+    -------
+    result : dict
+        'theano' is the time it took to import Theano, 'module' the time
+        it took to import `module` after it, and 'heavy' the list of the
+        heavy modules that were imported.
+    """
+    command = [python, '-c', _MEASURE % (module, HEAVY_MODULES)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def check_budgets(budgets, repeat=3, python=sys.executable):
+    """
+    Measures the import time of modules and compares it to their budget.
+
+    Parameters
+    ----------
+    budgets : dict
+        Maps module names to their budget in seconds.
+    repeat : int, optional
+        The number of measurements of each module. The best one is kept.
+    python : str, optional
+        The interpreter to use.
+
+    Returns
+    -------
+    results : OrderedDict
+        Maps module names to dicts with the keys 'time', 'budget',
+        'heavy' (the heavy modules imported) and 'ok'.
+    """
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1, got %d" % repeat)
+    results = OrderedDict()
+    for module, budget in budgets.items():
+        runs = [measure(module, python) for _ in range(repeat)]
+        best = min(run['module'] for run in runs)
+        heavy = sorted(set(name for run in runs for name in run['heavy']))
+        results[module] = {'time': best, 'budget': budget,
+                           'theano': min(run['theano'] for run in runs),
+                           'heavy': heavy,
+                           'ok': best <= budget and not heavy}
+    return results
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Checks the import time of pylearn2 modules.")
+    parser.add_argument('modules', nargs='*',
+                        help="Modules to check. Defaults to the modules "
+                             "used by the command line tools.")
+    parser.add_argument('--budget', type=float, default=None,
+                        help="Budget in seconds for the given modules, "
+                             "on top of importing Theano.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of measurements per module; the "
+                             "best one is kept.")
+    parser.add_argument('--json', action='store_true',
+                        help="Print the results as JSON.")
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the benchmark and returns the exit status: 0 if all the modules
+    are within budget, 1 otherwise.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to sys.argv[1:].
+    """
+    args = make_argument_parser().parse_args(argv)
+    if args.modules:
+        budget = args.budget
+        budgets = OrderedDict((module, budget if budget is not None
+                               else DEFAULT_BUDGETS.get(module, 1.))
+                              for module in args.modules)
+    elif args.budget is not None:
+        budgets = OrderedDict((module, args.budget)
+                              for module in DEFAULT_BUDGETS)
+    else:
+        budgets = DEFAULT_BUDGETS
+    results = check_budgets(budgets, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for module, result in results.items():
+            status = 'ok' if result['ok'] else 'FAILED'
+            print('%-40s %6.3fs / %6.3fs  %s' % (module, result['time'],
+                                                 result['budget'], status))
+            if result['heavy']:
+                print('    imports %s' % ', '.join(result['heavy']))
+        theano_time = min(result['theano'] for result in results.values())
+        print('(theano itself takes %.3fs)' % theano_time)
+    return int(not all(result['ok'] for result in results.values()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
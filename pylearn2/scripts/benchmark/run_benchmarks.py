@@ -0,0 +1,845 @@
+#!/usr/bin/env python
+"""
+Runs benchmarks of pylearn2 on the CPU and compares them to a baseline,
+so that performance regressions can be caught by any machine.
+
+The benchmarks range from small pieces of the data pipeline (iterating
+over datasets, converting between spaces, formatting targets) to whole
+steps of a job (preprocessing a dataset, fitting KMeans and PCA, MLP
+forward passes and updates, saving and loading models, instantiating
+YAML files).
+
+Each benchmark is run once to warm up, then `--repeat` times, and the
+best time is kept. The results are written as JSON in this format,
+which only changes along with `FORMAT_VERSION`:
+
+    {"format": 1,
+     "environment": {"python": ..., "numpy": ..., "theano": ...,
+                     "floatX": ..., "platform": ..., ...},
+     "scale": 1.0,
+     "benchmarks": {
+         "<name>": {"seconds": <best time>, "median": <median time>,
+                    "runs": <number of timed runs>,
+                    "items": <items processed by a run>,
+                    "items_per_second": <items / seconds>},
+         "<name of a skipped benchmark>": {"skipped": "<reason>"},
+         ...}}
+
+Items are examples, labels or bytes, depending on the benchmark. The
+comparison with a baseline uses the time per item. The time per item
+of many benchmarks depends on the scale (e.g. fitting ZCA or KMeans, or
+iterating over datasets that do not fit in the CPU caches), so the
+baseline must have been recorded with the same `--scale`.
+
+Examples
+--------
+Record a baseline:
+
+    python run_benchmarks.py --output baseline.json
+
+Check for regressions of more than 30% in the iterators:
+
+    python run_benchmarks.py -k iterator --baseline baseline.json \\
+        --tolerance .3
+"""
+from __future__ import print_function
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import theano
+from theano import config
+
+from pylearn2.compat import OrderedDict
+
+FORMAT_VERSION = 1
+
+# Maps the names of the benchmarks to the functions setting them up
+BENCHMARKS = OrderedDict()
+
+ITERATION_MODES = ['sequential', 'shuffled_sequential', 'random_slice',
+                   'random_uniform', 'batchwise_shuffled_sequential']
+
+# Sizes of the hidden layers of the benchmarked MLPs
+MLP_SIZES = OrderedDict([('small', [256]),
+                         ('medium', [1024]),
+                         ('large', [2048, 2048])])
+
+BATCH_SIZE = 100
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised by the setup of a benchmark that cannot run here, e.g.
+    because an optional dependency is missing.
+    """
+
+
+def benchmark(name):
+    """
+    Returns a decorator registering a benchmark.
+
+    The decorated function takes the scale of the benchmark (1 for the
+    default size) and returns `(run, items)`, where `run` is the callable
+    to time and `items` the number of items a call processes.
+
+    Parameters
+    ----------
+    name : str
+        The name of the benchmark, with dots separating its groups.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _num_examples(scale, default=10000):
+    """
+    Returns the number of examples of a benchmark, a multiple of the
+    batch size.
+
+    Parameters
+    ----------
+    scale : float
+        The scale of the benchmark.
+    default : int, optional
+        The number of examples at scale 1.
+    """
+    return max(1, int(default * scale) // BATCH_SIZE) * BATCH_SIZE
+
+
+def _design_matrix(num_examples, dim, num_classes=10):
+    """
+    Returns a random dense dataset with one-hot targets.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    dim : int
+        The number of features.
+    num_classes : int, optional
+        The number of classes.
+    """
+    from pylearn2.testing.datasets import random_one_hot_dense_design_matrix
+    rng = np.random.RandomState([2015, 3, 19])
+    return random_one_hot_dense_design_matrix(rng, num_examples, dim,
+                                              num_classes)
+
+
+def _make_dense(num_examples):
+    """
+    Returns a DenseDesignMatrix of vectors.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    """
+    return _design_matrix(num_examples, 100)
+
+
+def _make_topo(num_examples):
+    """
+    Returns a DenseDesignMatrix of images.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    """
+    from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+    rng = np.random.RandomState([2015, 3, 19])
+    topo_view = rng.uniform(size=(num_examples, 16, 16, 3)).astype(
+        config.floatX)
+    return DenseDesignMatrix(topo_view=topo_view, axes=('b', 0, 1, 'c'))
+
+
+def _make_sparse(num_examples):
+    """
+    Returns a SparseDataset.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    """
+    try:
+        import scipy.sparse
+        from pylearn2.datasets.sparse_dataset import SparseDataset
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    rng = np.random.RandomState([2015, 3, 19])
+    X = scipy.sparse.rand(num_examples, 1000, density=.01, format='csr',
+                          random_state=rng).astype(config.floatX)
+    return SparseDataset(from_scipy_sparse_dataset=X)
+
+
+def _make_vector_spaces(num_examples):
+    """
+    Returns a VectorSpacesDataset with features and targets.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    """
+    from pylearn2.datasets.vector_spaces_dataset import VectorSpacesDataset
+    from pylearn2.space import CompositeSpace, VectorSpace
+    dataset = _make_dense(num_examples)
+    space = CompositeSpace([VectorSpace(dataset.X.shape[1]),
+                            VectorSpace(dataset.y.shape[1])])
+    return VectorSpacesDataset((dataset.X, dataset.y),
+                               (space, ('features', 'targets')))
+
+
+DATASETS = OrderedDict([('dense', _make_dense),
+                        ('topo', _make_topo),
+                        ('sparse', _make_sparse),
+                        ('vector_spaces', _make_vector_spaces)])
+
+
+def _register_iterator_benchmark(dataset_name, mode):
+    """
+    Registers the benchmark of an epoch of a dataset in an iteration
+    mode.
+
+    Parameters
+    ----------
+    dataset_name : str
+        A key of `DATASETS`.
+    mode : str
+        The iteration mode.
+    """
+    @benchmark('iterator.%s.%s' % (dataset_name, mode))
+    def setup(scale):
+        from pylearn2.utils.iteration import is_stochastic
+        num_examples = _num_examples(scale)
+        dataset = DATASETS[dataset_name](num_examples)
+        num_batches = num_examples // BATCH_SIZE
+
+        def run():
+            if is_stochastic(mode):
+                rng = np.random.RandomState(0)
+            else:
+                rng = None
+            iterator = dataset.iterator(mode=mode, batch_size=BATCH_SIZE,
+                                        num_batches=num_batches, rng=rng,
+                                        data_specs=dataset.get_data_specs(),
+                                        return_tuple=True)
+            for batch in iterator:
+                pass
+        return run, num_examples
+
+
+for _dataset_name in DATASETS:
+    for _mode in ITERATION_MODES:
+        _register_iterator_benchmark(_dataset_name, _mode)
+
+
+def _register_space_benchmark(name, make_spaces, make_batch):
+    """
+    Registers the benchmark of `Space.np_format_as` between two spaces.
+
+    Parameters
+    ----------
+    name : str
+        The name of the conversion.
+    make_spaces : callable
+        Returns the spaces to convert from and to.
+    make_batch : callable
+        Takes the space to convert from and returns a batch of it.
+    """
+    @benchmark('space.%s' % name)
+    def setup(scale):
+        source, target = make_spaces()
+        batch = make_batch(source)
+        num_batches = _num_examples(scale) // BATCH_SIZE
+
+        def run():
+            for i in range(num_batches):
+                source.np_format_as(batch, target)
+        return run, num_batches * BATCH_SIZE
+
+
+def _random_batch(space):
+    """
+    Returns a random batch of a space.
+
+    Parameters
+    ----------
+    space : Space
+        A VectorSpace or a Conv2DSpace.
+    """
+    return space.get_origin_batch(BATCH_SIZE) + np.cast[space.dtype](.5)
+
+
+def _label_batch(space):
+    """
+    Returns a random batch of an IndexSpace.
+
+    Parameters
+    ----------
+    space : IndexSpace
+        The space of the labels.
+    """
+    rng = np.random.RandomState([2015, 3, 19])
+    return rng.randint(space.max_labels,
+                       size=(BATCH_SIZE, space.dim)).astype(space.dtype)
+
+
+def _vector_to_conv2d():
+    """
+    Returns a VectorSpace and a Conv2DSpace of the same size.
+    """
+    from pylearn2.space import Conv2DSpace, VectorSpace
+    return (VectorSpace(32 * 32 * 3),
+            Conv2DSpace((32, 32), num_channels=3, axes=('b', 0, 1, 'c')))
+
+
+def _b01c_to_c01b():
+    """
+    Returns two Conv2DSpaces with different axes.
+    """
+    from pylearn2.space import Conv2DSpace
+    return (Conv2DSpace((32, 32), num_channels=3, axes=('b', 0, 1, 'c')),
+            Conv2DSpace((32, 32), num_channels=3, axes=('c', 0, 1, 'b')))
+
+
+def _index_to_vector():
+    """
+    Returns an IndexSpace and the VectorSpace of its one-hot vectors.
+    """
+    from pylearn2.space import IndexSpace, VectorSpace
+    return IndexSpace(max_labels=100, dim=1), VectorSpace(100)
+
+
+_register_space_benchmark('vector_to_conv2d', _vector_to_conv2d,
+                          _random_batch)
+_register_space_benchmark('conv2d_b01c_to_c01b', _b01c_to_c01b,
+                          _random_batch)
+_register_space_benchmark('index_to_vector', _index_to_vector, _label_batch)
+
+
+def _register_preprocessing_benchmark(name, make_preprocessor):
+    """
+    Registers the benchmark of fitting a preprocessor and applying it.
+
+    Parameters
+    ----------
+    name : str
+        The name of the preprocessor.
+    make_preprocessor : callable
+        Returns a new preprocessor.
+    """
+    @benchmark('preprocessing.%s' % name)
+    def setup(scale):
+        from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+        num_examples = _num_examples(scale)
+        X = _make_dense(num_examples).X
+
+        def run():
+            dataset = DenseDesignMatrix(X=X.copy())
+            make_preprocessor().apply(dataset, can_fit=True)
+        return run, num_examples
+
+
+def _gcn():
+    """
+    Returns a GlobalContrastNormalization preprocessor.
+    """
+    from pylearn2.datasets.preprocessing import GlobalContrastNormalization
+    return GlobalContrastNormalization()
+
+
+def _standardize():
+    """
+    Returns a Standardize preprocessor.
+    """
+    from pylearn2.datasets.preprocessing import Standardize
+    return Standardize()
+
+
+def _zca():
+    """
+    Returns a ZCA preprocessor.
+    """
+    from pylearn2.datasets.preprocessing import ZCA
+    return ZCA()
+
+
+_register_preprocessing_benchmark('global_contrast_normalization', _gcn)
+_register_preprocessing_benchmark('standardize', _standardize)
+_register_preprocessing_benchmark('zca', _zca)
+
+
+def _labels(scale, max_labels=100):
+    """
+    Returns random labels.
+
+    Parameters
+    ----------
+    scale : float
+        The scale of the benchmark.
+    max_labels : int, optional
+        The number of classes.
+    """
+    rng = np.random.RandomState([2015, 3, 19])
+    return rng.randint(max_labels, size=_num_examples(scale, 100000))
+
+
+@benchmark('one_hot.format')
+def _one_hot_format(scale):
+    """
+    Formats labels as one-hot vectors.
+    """
+    from pylearn2.format.target_format import OneHotFormatter
+    labels = _labels(scale)
+    formatter = OneHotFormatter(100)
+    return lambda: formatter.format(labels), len(labels)
+
+
+@benchmark('one_hot.format_sparse')
+def _one_hot_format_sparse(scale):
+    """
+    Formats labels as a sparse matrix of one-hot vectors.
+    """
+    from pylearn2.format.target_format import OneHotFormatter
+    labels = _labels(scale).reshape((-1, 1))
+    formatter = OneHotFormatter(100)
+    return (lambda: formatter.format(labels, mode='concatenate',
+                                     sparse=True),
+            len(labels))
+
+
+@benchmark('one_hot.compressed')
+def _compressed_one_hot(scale):
+    """
+    Formats labels with compressed_one_hot.
+    """
+    from pylearn2.format.target_format import compressed_one_hot
+    labels = _labels(scale)
+    return lambda: compressed_one_hot(labels), len(labels)
+
+
+@benchmark('kmeans.fit')
+def _kmeans_fit(scale):
+    """
+    Fits KMeans with 20 clusters.
+    """
+    from pylearn2.models.kmeans import KMeans
+    dataset = _design_matrix(_num_examples(scale, 2000), 50)
+    return (lambda: KMeans(k=20, nvis=50, max_iter=10).train_all(dataset),
+            dataset.X.shape[0])
+
+
+@benchmark('pca.fit')
+def _pca_fit(scale):
+    """
+    Fits a PCA with 20 components.
+    """
+    from pylearn2.models.pca import CovEigPCA
+    X = _make_dense(_num_examples(scale, 5000)).X
+    return lambda: CovEigPCA(num_components=20).train(X), X.shape[0]
+
+
+def _make_mlp(size):
+    """
+    Returns an MLP with rectified linear hidden layers and a softmax
+    output, taking 784 inputs.
+
+    Parameters
+    ----------
+    size : str
+        A key of `MLP_SIZES`.
+    """
+    from pylearn2.models.mlp import MLP, RectifiedLinear, Softmax
+    layers = [RectifiedLinear(dim=dim, layer_name='h%d' % i, irange=.05)
+              for i, dim in enumerate(MLP_SIZES[size])]
+    layers.append(Softmax(n_classes=10, layer_name='y', irange=.05))
+    return MLP(layers=layers, nvis=784, seed=[2015, 3, 19])
+
+
+def _register_mlp_benchmarks(size):
+    """
+    Registers the benchmarks of the forward pass and of the SGD update of
+    an MLP.
+
+    Parameters
+    ----------
+    size : str
+        A key of `MLP_SIZES`.
+    """
+    @benchmark('mlp.fprop.%s' % size)
+    def setup_fprop(scale):
+        model = _make_mlp(size)
+        X = model.get_input_space().make_theano_batch()
+        fprop = theano.function([X], model.fprop(X))
+        batch = _design_matrix(BATCH_SIZE, 784).X.astype(config.floatX)
+        num_batches = _num_examples(scale, 2000) // BATCH_SIZE
+
+        def run():
+            for i in range(num_batches):
+                fprop(batch)
+        return run, num_batches * BATCH_SIZE
+
+    @benchmark('mlp.sgd_update.%s' % size)
+    def setup_update(scale):
+        from pylearn2.training_algorithms.sgd import SGD
+        model = _make_mlp(size)
+        dataset = _design_matrix(BATCH_SIZE, 784)
+        algorithm = SGD(learning_rate=.01, batch_size=BATCH_SIZE)
+        algorithm.setup(model, dataset)
+        X = dataset.X.astype(config.floatX)
+        y = dataset.y.astype(config.floatX)
+        num_batches = _num_examples(scale, 2000) // BATCH_SIZE
+
+        def run():
+            for i in range(num_batches):
+                algorithm.sgd_update(X, y)
+        return run, num_batches * BATCH_SIZE
+
+
+for _size in MLP_SIZES:
+    _register_mlp_benchmarks(_size)
+
+
+@benchmark('serial.save')
+def _serial_save(scale):
+    """
+    Saves a medium MLP. The items are the bytes of the file.
+    """
+    from pylearn2.utils import serial
+    model = _make_mlp('medium')
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'model.pkl')
+    try:
+        serial.save(path, model)
+        num_bytes = os.path.getsize(path)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    def run():
+        run_dir = tempfile.mkdtemp()
+        try:
+            serial.save(os.path.join(run_dir, 'model.pkl'), model)
+        finally:
+            shutil.rmtree(run_dir)
+    return run, num_bytes
+
+
+@benchmark('serial.load')
+def _serial_load(scale):
+    """
+    Loads a medium MLP. The items are the bytes of the file.
+    """
+    from pylearn2.utils import serial
+    tmp_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, tmp_dir)
+    path = os.path.join(tmp_dir, 'model.pkl')
+    serial.save(path, _make_mlp('medium'))
+    return lambda: serial.load(path), os.path.getsize(path)
+
+
+_YAML = """
+!obj:pylearn2.train.Train {
+    dataset: &train !obj:pylearn2.testing.datasets.random_dense_design_matrix
+    {
+        rng: !obj:numpy.random.RandomState { seed: 0 },
+        num_examples: 100,
+        dim: 784,
+        num_classes: 10
+    },
+    model: !obj:pylearn2.models.mlp.MLP {
+        nvis: 784,
+        layers: [
+            !obj:pylearn2.models.mlp.RectifiedLinear {
+                dim: 256, layer_name: 'h0', irange: .05
+            },
+            !obj:pylearn2.models.mlp.Softmax {
+                n_classes: 10, layer_name: 'y', irange: .05
+            }
+        ]
+    },
+    algorithm: !obj:pylearn2.training_algorithms.sgd.SGD {
+        learning_rate: .01,
+        batch_size: 100,
+        monitoring_dataset: { 'train': *train },
+        termination_criterion:
+            !obj:pylearn2.termination_criteria.EpochCounter {
+                max_epochs: 1
+            }
+    }
+}
+"""
+
+
+@benchmark('yaml.instantiate')
+def _yaml_instantiate(scale):
+    """
+    Instantiates a training job from YAML.
+    """
+    try:
+        from pylearn2.config import yaml_parse
+        import yaml
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    return lambda: yaml_parse.load(_YAML), 1
+
+
+def get_environment():
+    """
+    Returns a description of the software and hardware the benchmarks
+    run on.
+    """
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('theano', theano.__version__),
+        ('floatX', config.floatX),
+        ('blas', config.blas.ldflags),
+        ('cxx', config.cxx),
+        ('platform', platform.platform()),
+        ('processor', platform.processor()),
+        ('machine', platform.machine()),
+    ])
+
+
+def time_benchmark(setup, scale=1., repeat=5):
+    """
+    Sets up and times a benchmark.
+
+    Parameters
+    ----------
+    setup : callable
+        The function registered by `benchmark`.
+    scale : float, optional
+        The scale of the benchmark.
+    repeat : int, optional
+        The number of timed runs. The best one is kept.
+
+    Returns
+    -------
+    result : OrderedDict
+        The result of the benchmark, as in the JSON output.
+    """
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1, got %d" % repeat)
+    try:
+        run, items = setup(scale)
+    except SkipBenchmark as e:
+        return OrderedDict([('skipped', str(e))])
+    run()
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+    seconds = min(times)
+    return OrderedDict([
+        ('seconds', seconds),
+        ('median', float(np.median(times))),
+        ('runs', repeat),
+        ('items', items),
+        ('items_per_second', items / seconds if seconds > 0 else None),
+    ])
+
+
+def run_benchmarks(names=None, scale=1., repeat=5, log=None):
+    """
+    Runs benchmarks.
+
+    Parameters
+    ----------
+    names : list of str, optional
+        The benchmarks to run. Defaults to all of them.
+    scale : float, optional
+        The scale of the benchmarks.
+    repeat : int, optional
+        The number of timed runs of each benchmark.
+    log : file, optional
+        If specified, the progress is written to it.
+
+    Returns
+    -------
+    results : OrderedDict
+        The results, in the format of the JSON output.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    benchmarks = OrderedDict()
+    for name in names:
+        if log is not None:
+            log.write('%-50s ' % name)
+            log.flush()
+        result = time_benchmark(BENCHMARKS[name], scale, repeat)
+        benchmarks[name] = result
+        if log is not None:
+            log.write(format_result(result) + '\n')
+    return OrderedDict([('format', FORMAT_VERSION),
+                        ('environment', get_environment()),
+                        ('scale', scale),
+                        ('benchmarks', benchmarks)])
+
+
+def format_result(result):
+    """
+    Returns a one-line description of the result of a benchmark.
+
+    Parameters
+    ----------
+    result : dict
+        The result of a benchmark.
+    """
+    if 'skipped' in result:
+        return 'skipped (%s)' % result['skipped']
+    rate = result['items_per_second']
+    return '%10.4fs  %12.1f items/s' % (result['seconds'],
+                                        rate if rate is not None else 0)
+
+
+def compare(results, baseline, tolerance=.2):
+    """
+    Compares results to a baseline, by their time per item. Both must
+    have been run with the same scale.
+
+    Parameters
+    ----------
+    results : dict
+        The return value of `run_benchmarks`.
+    baseline : dict
+        Results of an earlier run, e.g. loaded from its JSON output.
+    tolerance : float, optional
+        A benchmark regressed if its time per item exceeds the one of
+        the baseline by more than this proportion.
+
+    Returns
+    -------
+    comparison : OrderedDict
+        Maps the names of the benchmarks to pairs `(status, ratio)`,
+        where `ratio` is the time per item divided by the one of the
+        baseline (None if either was not measured) and `status` one of
+        'regression', 'improvement', 'ok', 'new' or 'skipped'.
+    """
+    if baseline.get('format') != FORMAT_VERSION:
+        raise ValueError("The baseline is in format %s, expected %s."
+                         % (baseline.get('format'), FORMAT_VERSION))
+    if baseline.get('scale') != results.get('scale'):
+        raise ValueError("The baseline was run with scale %s, but the "
+                         "results with scale %s." % (baseline.get('scale'),
+                                                     results.get('scale')))
+    reference = baseline['benchmarks']
+    comparison = OrderedDict()
+    for name, result in results['benchmarks'].items():
+        if 'skipped' in result:
+            comparison[name] = ('skipped', None)
+            continue
+        old = reference.get(name)
+        if old is None or 'skipped' in old:
+            comparison[name] = ('new', None)
+            continue
+        ratio = ((result['seconds'] / result['items']) /
+                 (old['seconds'] / old['items']))
+        if ratio > 1. + tolerance:
+            status = 'regression'
+        elif ratio < 1. / (1. + tolerance):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparison[name] = (status, ratio)
+    return comparison
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Runs the pylearn2 benchmarks and compares them to a "
+                    "baseline.")
+    parser.add_argument('-k', '--filter', default=None,
+                        help="Only run the benchmarks whose name matches "
+                             "this regular expression.")
+    parser.add_argument('--list', action='store_true',
+                        help="List the benchmarks and exit.")
+    parser.add_argument('--scale', type=float, default=1.,
+                        help="Multiplies the amount of work of each "
+                             "benchmark, e.g. .1 for a quick run.")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Number of timed runs per benchmark; the "
+                             "best one is kept.")
+    parser.add_argument('--output', default=None,
+                        help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', default=None,
+                        help="Compare to the results in this JSON file.")
+    parser.add_argument('--tolerance', type=float, default=.2,
+                        help="Relative slowdown above which a benchmark "
+                             "is reported as a regression.")
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks and returns the exit status: 1 if a benchmark
+    regressed compared to the baseline, 0 otherwise.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to sys.argv[1:].
+    """
+    parser = make_argument_parser()
+    args = parser.parse_args(argv)
+    names = list(BENCHMARKS)
+    if args.filter is not None:
+        pattern = re.compile(args.filter)
+        names = [name for name in names if pattern.search(name)]
+    if args.list:
+        for name in names:
+            print(name)
+        return 0
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Checked before running the benchmarks, see compare
+        if baseline.get('scale') != args.scale:
+            parser.error("The baseline was run with --scale %s, it can "
+                         "only be compared to results with the same "
+                         "scale." % baseline.get('scale'))
+
+    results = run_benchmarks(names, args.scale, args.repeat, sys.stdout)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is None:
+        return 0
+    comparison = compare(results, baseline, args.tolerance)
+    print()
+    for name, (status, ratio) in comparison.items():
+        if ratio is None:
+            print('%-50s %s' % (name, status))
+        else:
+            print('%-50s %-12s %.2fx' % (name, status, ratio))
+    regressions = [name for name, (status, ratio) in comparison.items()
+                   if status == 'regression']
+    if regressions:
+        print('%d regression(s): %s' % (len(regressions),
+                                        ', '.join(regressions)))
+    return int(bool(regressions))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -154,16 +154,16 @@ def main():
                 response = input('Enter your choice: ')
                 if response == '1':
                     for channel in channels.values():
+                        # Average of each value with the k previous ones
                         k = 5
-                        new_val_record = []
-                        for i in xrange(len(channel.val_record)):
-                            new_val = 0.
-                            count = 0.
-                            for j in xrange(max(0, i-k), i+1):
-                                new_val += channel.val_record[j]
-                                count += 1.
-                            new_val_record.append(new_val / count)
-                        channel.val_record = new_val_record
+                        values = np.asarray(channel.val_record,
+                                            dtype='float64')
+                        sums = np.cumsum(values)
+                        lagged = np.concatenate((np.zeros(k + 1),
+                                                 sums))[:len(values)]
+                        counts = np.minimum(np.arange(1, len(values) + 1),
+                                            k + 1)
+                        channel.val_record = (sums - lagged) / counts
                 continue
 
             if response == 'q':
@@ -0,0 +1,112 @@
+"""
+Tests for the benchmark harness in scripts/benchmark/run_benchmarks.py
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from theano import config
+
+from pylearn2.scripts.benchmark import run_benchmarks
+from pylearn2.scripts.benchmark.run_benchmarks import compare, main
+
+
+def test_run_and_compare():
+    """
+    Runs a few benchmarks, writes them as JSON and compares them to
+    themselves.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'results.json')
+        args = ['-k', '^(one_hot|space)\\.', '--scale', '.01', '--repeat',
+                '1', '--output', path]
+        assert main(args) == 0
+        with open(path) as f:
+            results = json.load(f)
+        assert results['format'] == run_benchmarks.FORMAT_VERSION
+        names = sorted(results['benchmarks'])
+        assert names == sorted(name for name in run_benchmarks.BENCHMARKS
+                               if name.startswith(('one_hot.', 'space.')))
+        for result in results['benchmarks'].values():
+            assert result['seconds'] >= 0
+            assert result['items'] > 0
+        assert main(args[:-2] + ['--baseline', path,
+                                 '--tolerance', '1000']) == 0
+        args[3] = '.02'
+        try:
+            main(args[:-2] + ['--baseline', path])
+        except SystemExit:
+            pass
+        else:
+            raise AssertionError("A baseline with another scale should be "
+                                 "rejected.")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_run_mlp():
+    """
+    Runs the benchmarks of the small MLP with float32 parameters, whose
+    Theano functions reject float64 batches.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    floatX = config.floatX
+    try:
+        config.floatX = 'float32'
+        path = os.path.join(tmp_dir, 'results.json')
+        assert main(['-k', '^mlp\\..*\\.small$', '--scale', '.05',
+                     '--repeat', '1', '--output', path]) == 0
+        with open(path) as f:
+            results = json.load(f)
+        assert sorted(results['benchmarks']) == ['mlp.fprop.small',
+                                                 'mlp.sgd_update.small']
+        for result in results['benchmarks'].values():
+            assert result['items'] > 0
+    finally:
+        config.floatX = floatX
+        shutil.rmtree(tmp_dir)
+
+
+def test_compare():
+    """
+    Tests that benchmarks are compared by their time per item.
+    """
+    def make_results(**benchmarks):
+        return {'format': run_benchmarks.FORMAT_VERSION,
+                'scale': 1.,
+                'benchmarks': dict((name, {'seconds': seconds, 'items': items})
+                                   for name, (seconds, items)
+                                   in benchmarks.items())}
+
+    baseline = make_results(a=(1., 10), b=(1., 10), c=(1., 10))
+    baseline['benchmarks']['d'] = {'skipped': 'missing dependency'}
+    results = make_results(a=(2.2, 20), b=(1., 20), c=(3., 20), d=(1., 1),
+                           e=(1., 1))
+    comparison = compare(results, baseline, tolerance=.2)
+    for name, expected in [('a', ('ok', 1.1)), ('b', ('improvement', .5)),
+                           ('c', ('regression', 1.5))]:
+        status, ratio = comparison[name]
+        assert status == expected[0]
+        assert abs(ratio - expected[1]) < 1e-6
+    assert comparison['d'] == ('new', None)
+    assert comparison['e'] == ('new', None)
+
+    try:
+        compare(results, {'format': -1, 'benchmarks': {}})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A baseline in another format should be "
+                             "rejected.")
+
+    other_scale = make_results()
+    other_scale['scale'] = .1
+    try:
+        compare(results, other_scale)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A baseline with another scale should be "
+                             "rejected.")
@@ -50,6 +50,11 @@ For example configuration files that are consumable by this script, see
 - `pylearn2/scripts/tutorials/dbm_demo`
 - `pylearn2/scripts/papers/maxout`
 
+To make a job that can be interrupted and restarted, give the Train
+object a `checkpoint_path` and relaunch the same command with `--resume`:
+training continues from the last checkpoint, or starts from scratch if
+there is none yet.
+
 Use `train.py -h` to see an auto-generated description of advanced options.
 """
 __authors__ = "Ian Goodfellow"
@@ -83,6 +88,9 @@ from pylearn2.utils.logger import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 class FeatureDump(object):
     """
     .. todo::
@@ -168,6 +176,11 @@ def make_argument_parser():
                         action='store_true',
                         help='Display any DEBUG-level log messages, '
                              'suppressed by default.')
+    parser.add_argument('--resume', '-r',
+                        action='store_true',
+                        help='Continue training from the checkpoint_path '
+                             'of each Train object, when a checkpoint '
+                             'exists there.')
     parser.add_argument('config', action='store',
                         choices=None,
                         help='A YAML configuration file specifying the '
@@ -175,8 +188,28 @@ def make_argument_parser():
     return parser
 
 
+def resume(train_obj):
+    """
+    Makes a Train object continue from its checkpoint, if one was saved.
+
+    Parameters
+    ----------
+    train_obj : pylearn2.train.Train
+        The Train object to resume.
+    """
+    checkpoint_path = getattr(train_obj, 'checkpoint_path', None)
+    if checkpoint_path is None:
+        raise ValueError("Cannot resume training: no checkpoint_path was "
+                         "specified in the configuration.")
+    if os.path.exists(checkpoint_path):
+        train_obj.resume()
+    else:
+        logger.info("No checkpoint found at %s, starting from scratch.",
+                    checkpoint_path)
+
+
 def train(config, level_name=None, timestamp=None, time_budget=None,
-          verbose_logging=None, debug=None):
+          verbose_logging=None, debug=None, resume_training=None):
     """
     Trains a given YAML file.
 
@@ -202,6 +235,9 @@ def train(config, level_name=None, timestamp=None, time_budget=None,
     debug : bool, optional
         Display any DEBUG-level log messages,
         False by default.
+    resume_training : bool, optional
+        Continue training from the checkpoint of each Train object,
+        when one exists. False by default.
     """
     train_obj = serial.load_train_file(config)
     try:
@@ -240,6 +276,9 @@ def train(config, level_name=None, timestamp=None, time_budget=None,
             phase_value = 'phase%d' % (number + 1)
             os.environ[phase_variable] = phase_value
 
+            if resume_training:
+                resume(subobj)
+
             # Execute this training phase.
             subobj.main_loop(time_budget=time_budget)
 
@@ -248,6 +287,8 @@ def train(config, level_name=None, timestamp=None, time_budget=None,
             del subobj
             gc.collect()
     else:
+        if resume_training:
+            resume(train_obj)
         train_obj.main_loop(time_budget=time_budget)
 
 
@@ -258,4 +299,4 @@ if __name__ == "__main__":
     parser = make_argument_parser()
     args = parser.parse_args()
     train(args.config, args.level_name, args.timestamp, args.time_budget,
-          args.verbose_logging, args.debug)
+          args.verbose_logging, args.debug, args.resume)
@@ -41,10 +41,17 @@ import theano.sparse
 from theano import tensor
 from theano.tensor import TensorType
 from theano.gof.op import get_debug_values
-from theano.sandbox.cuda.type import CudaNdarrayType
+from pylearn2.compat import OrderedDict
 from pylearn2.utils import py_integer_types, safe_zip, sharedX, wraps
+from pylearn2.utils.lazy_import import lazy_class
 from pylearn2.format.target_format import OneHotFormatter
 
+# Importing theano.sandbox.cuda initializes the CUDA backend, which is slow.
+# There are no CUDA variables until something else imports it.
+CudaNdarrayType = lazy_class('theano.sandbox.cuda.type', 'CudaNdarrayType')
+CudaNdarrayVariable = lazy_class('theano.sandbox.cuda.var',
+                                 'CudaNdarrayVariable')
+
 if theano.sparse.enable_sparse:
     # We know scipy.sparse is available
     import scipy.sparse
@@ -218,7 +225,7 @@ def _cast(arg, dtype):
         return theano.tensor.cast(arg, dtype)
     elif isinstance(arg, theano.sparse.SparseVariable):
         return theano.sparse.cast(arg, dtype)
-    elif isinstance(arg, theano.sandbox.cuda.var.CudaNdarrayVariable):
+    elif isinstance(arg, CudaNdarrayVariable):
         return arg
     else:
         raise TypeError("Unsupported arg type '%s'" % str(type(arg)))
@@ -485,6 +492,33 @@ class Space(object):
                                batch=batch,
                                space=space)
 
+    def np_format_plan(self, space, trusted=False):
+        """
+        Returns a callable formatting numeric batches of this space to
+        `space`, like `np_format_as`, but with the work that does not
+        depend on the batch done once: the transposes, reshapes and casts
+        are resolved, and so is the recursion into the components of
+        composite spaces. The resolved conversions are cached, so asking
+        again for the same conversion is cheap, except the ones keeping
+        state between batches (like the one-hot encoding of an
+        `IndexSpace`), which are resolved again for each plan.
+
+        Parameters
+        ----------
+        space : Space
+            Target space to format batches to.
+        trusted : bool, optional
+            If True, only the first batch is validated. Use it when all
+            the batches come from the same place, e.g. the same dataset,
+            so that the other batches are valid if the first one is.
+
+        Returns
+        -------
+        plan : FormatPlan
+            Called as `plan(batch, out=None)`, see `FormatPlan`.
+        """
+        return FormatPlan(self, space, trusted)
+
     def _check_sizes(self, space):
         """
         Called by self._format_as(space), to check whether self and space
@@ -2658,3 +2692,293 @@ class NullSpace(Space):
         # have been in the batch, since it is empty. We return 0.
         self._validate(is_numeric, batch)
         return 0
+
+
+# The spaces whose conversions are resolved by _compile_np_format. Their
+# string representation describes them completely, so it is used as the
+# key of the cached conversions.
+_PLANNED_TYPES = (VectorSpace, Conv2DSpace, IndexSpace, CompositeSpace,
+                  NullSpace)
+
+# The stateless conversions resolved so far, by (str(source),
+# str(target)), least recently used first
+_np_format_cache = OrderedDict()
+
+# The number of conversions kept in _np_format_cache
+_NP_FORMAT_CACHE_SIZE = 128
+
+
+def _is_planned(space):
+    """
+    Returns True if `space` and all its components are instances of
+    `_PLANNED_TYPES` (and not of subclasses, which may convert batches
+    differently).
+    """
+    if type(space) is CompositeSpace:
+        return all(_is_planned(component) for component in space.components)
+    return type(space) in _PLANNED_TYPES
+
+
+def _write(batch, out):
+    """
+    Copies a (possibly composite) numeric batch to `out`, if it is not
+    None, and returns it.
+    """
+    if out is None:
+        return batch
+    if isinstance(batch, tuple):
+        return tuple(_write(b, o) for b, o in safe_zip(batch, out))
+    if scipy.sparse.issparse(batch):
+        raise ValueError("Sparse batches can not be written to a buffer.")
+    out[...] = batch
+    return out
+
+
+def _finish(batch, dtype, out):
+    """
+    Casts a dense numeric batch to `dtype`, or copies it to `out` (which
+    casts it to the dtype of `out`) if it is not None.
+    """
+    if out is not None:
+        out[...] = batch
+        return out
+    if dtype is None:
+        return batch
+    if isinstance(batch, np.ndarray):
+        return theano._asarray(batch, dtype=dtype)
+    return _cast(batch, dtype)
+
+
+def _is_stateful(convert):
+    """
+    Returns True if `convert`, returned by `_compile_np_format`, keeps
+    state between batches, in which case it can't be shared by several
+    plans.
+    """
+    return getattr(convert, 'stateful', False)
+
+
+def _compile_np_format(source, target):
+    """
+    Returns a function `convert(batch, out)` formatting the numeric
+    batches of `source` to `target`, without validating them.
+
+    The common conversions between dense batches are resolved here, the
+    others call `source._format_as_impl`. Conversions keeping state
+    between batches have a true `stateful` attribute.
+
+    Parameters
+    ----------
+    source : Space
+        The space of the batches.
+    target : Space
+        The space to format them to.
+    """
+    if type(source) is NullSpace and type(target) is NullSpace:
+        return _write
+
+    if type(source) is CompositeSpace and type(target) is CompositeSpace:
+        converts = []
+        for s, t in safe_zip(source.components, target.components):
+            if (isinstance(s, CompositeSpace) !=
+                    isinstance(t, CompositeSpace)):
+                raise TypeError("Can't convert between CompositeSpaces "
+                                "with different tree structures")
+            converts.append(_compile_np_format(s, t))
+
+        def convert(batch, out):
+            if out is None:
+                out = (None,) * len(converts)
+            return tuple(c(b, o) for c, b, o in
+                         safe_zip(converts, batch, out))
+        convert.stateful = any(_is_stateful(c) for c in converts)
+        return convert
+
+    dtype = getattr(target, 'dtype', None)
+    dense_target = type(target) is Conv2DSpace or (
+        type(target) is VectorSpace and not target.sparse)
+
+    if (type(source) is CompositeSpace and type(target) is VectorSpace and
+            not target.sparse and dtype is not None):
+        source._check_sizes(target)
+        widths = [c.get_total_dimension() for c in source.components]
+        converts = [_compile_np_format(c, VectorSpace(dim=width,
+                                                      dtype=dtype))
+                    for c, width in safe_zip(source.components, widths)]
+        bounds = np.cumsum([0] + widths)
+
+        def convert(batch, out):
+            if out is None:
+                return np.concatenate([c(b, None) for c, b in
+                                       safe_zip(converts, batch)], axis=1)
+            # The pieces are written directly into their columns
+            for c, b, start, stop in safe_zip(converts, batch, bounds[:-1],
+                                              bounds[1:]):
+                c(b, out[:, start:stop])
+            return out
+        convert.stateful = any(_is_stateful(c) for c in converts)
+        return convert
+
+    if type(source) is VectorSpace and not source.sparse and dense_target:
+        source._check_sizes(target)
+        if type(target) is VectorSpace:
+            return lambda batch, out: _finish(batch, dtype, out)
+
+        dims = {'c': target.num_channels,
+                0: target.shape[0],
+                1: target.shape[1]}
+        # Always go through default_axes, so conversions like
+        # Conv2DSpace(c01b) -> VectorSpace -> Conv2DSpace(b01c) work
+        shape = tuple(dims[axis] for axis in target.default_axes[1:])
+        perm = None
+        if target.axes != target.default_axes:
+            perm = [target.default_axes.index(axis) for axis in target.axes]
+
+        def convert(batch, out):
+            batch = batch.reshape((batch.shape[0],) + shape)
+            if perm is not None:
+                batch = batch.transpose(perm)
+            return _finish(batch, dtype, out)
+        return convert
+
+    if type(source) is VectorSpace and not source.sparse and \
+            type(target) is CompositeSpace:
+        source._check_sizes(target)
+        widths = [c.get_total_dimension() for c in target.components]
+        converts = [_compile_np_format(VectorSpace(dim=width,
+                                                   dtype=source.dtype), c)
+                    for c, width in safe_zip(target.components, widths)]
+        bounds = np.cumsum([0] + widths)
+
+        def convert(batch, out):
+            if out is None:
+                out = (None,) * len(converts)
+            return tuple(c(batch[:, start:stop], o) for c, start, stop, o in
+                         safe_zip(converts, bounds[:-1], bounds[1:], out))
+        convert.stateful = any(_is_stateful(c) for c in converts)
+        return convert
+
+    if type(source) is Conv2DSpace and dense_target:
+        source._check_sizes(target)
+        if type(target) is Conv2DSpace:
+            if source.axes == target.axes:
+                return lambda batch, out: _finish(batch, dtype, out)
+            perm = [source.axes.index(axis) for axis in target.axes]
+            return lambda batch, out: _finish(batch.transpose(perm), dtype,
+                                              out)
+
+        total_dimension = source.get_total_dimension()
+        # The batch index goes on the first axis
+        assert source.default_axes[0] == 'b'
+        perm = None
+        if source.axes != source.default_axes:
+            perm = [source.axes.index(axis) for axis in source.default_axes]
+
+        def convert(batch, out):
+            if perm is not None:
+                batch = batch.transpose(perm)
+            if out is not None:
+                # Copies the images straight into out when it can be
+                # reshaped without copying it, to skip the intermediate
+                # copy made by reshaping the transposed batch
+                view = out.view()
+                try:
+                    view.shape = batch.shape
+                except AttributeError:
+                    pass
+                else:
+                    view[...] = batch
+                    return out
+            batch = batch.reshape((batch.shape[0], total_dimension))
+            return _finish(batch, dtype, out)
+        return convert
+
+    if type(source) is IndexSpace and type(target) is IndexSpace:
+        source._check_sizes(target)
+        return lambda batch, out: _finish(batch, dtype, out)
+
+    if (type(source) is IndexSpace and type(target) is VectorSpace and
+            not target.sparse):
+        source._check_sizes(target)
+        if source.max_labels == target.dim:
+            mode = 'merge'
+        else:
+            mode = 'concatenate'
+        # The one-hot vectors are written straight into out, and only the
+        # ones of the previous batch are cleared when out is reused. The
+        # formatter remembers that batch, so each plan needs its own.
+        formatter = OneHotFormatter(source.max_labels, dtype=dtype)
+
+        def convert(batch, out):
+            return formatter.format(batch, mode=mode, out=out)
+        convert.stateful = True
+        return convert
+
+    # Any other conversion goes through the generic implementation
+    source._check_sizes(target)
+
+    def convert(batch, out):
+        return _write(source._format_as_impl(True, batch, target), out)
+    return convert
+
+
+class FormatPlan(object):
+    """
+    Formats numeric batches of a space to another space, with the work
+    that does not depend on the batch done when the plan is built.
+
+    Use `Space.np_format_plan` to build one.
+
+    Parameters
+    ----------
+    source : Space
+        The space of the batches.
+    target : Space
+        The space to format them to.
+    trusted : bool, optional
+        If True, only the first batch is validated.
+    """
+
+    def __init__(self, source, target, trusted=False):
+        self.source = source
+        self.target = target
+        self.trusted = trusted
+        self._validated = False
+        key = None
+        if _is_planned(source) and _is_planned(target):
+            key = (str(source), str(target))
+        convert = _np_format_cache.pop(key, None)
+        if convert is None:
+            convert = _compile_np_format(source, target)
+        if key is not None and not _is_stateful(convert):
+            # (Re)inserted last, as the most recently used
+            _np_format_cache[key] = convert
+            if len(_np_format_cache) > _NP_FORMAT_CACHE_SIZE:
+                _np_format_cache.popitem(last=False)
+        self._convert = convert
+
+    def __call__(self, batch, out=None):
+        """
+        Returns `batch` formatted to the target space.
+
+        Parameters
+        ----------
+        batch : numpy.ndarray, scipy.sparse matrix or tuple
+            A numeric batch of the source space.
+        out : numpy.ndarray or tuple, optional
+            An array of the shape and dtype of the formatted batch, in
+            which to write it, instead of allocating a new array. For
+            composite target spaces, a (nested) tuple of such arrays.
+            Sparse batches can not be written to a buffer.
+
+        Returns
+        -------
+        batch : numpy.ndarray, scipy.sparse matrix or tuple
+            The formatted batch, `out` if it is specified. Like with
+            `np_format_as`, it may be a view of `batch` when `out` is not
+            specified.
+        """
+        if not (self.trusted and self._validated):
+            self.source.np_validate(batch)
+            self._validated = True
+        return self._convert(batch, out)
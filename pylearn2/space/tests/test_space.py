@@ -22,6 +22,7 @@ from pylearn2.space import (SimplyTypedSpace,
                             IndexSpace,
                             NullSpace,
                             is_symbolic_batch)
+import pylearn2.space as space_module
 from pylearn2.utils import function, safe_zip
 
 
@@ -1362,3 +1363,128 @@ def test_numeric_undo_format_as():
     new_CompS_VS_batch = CompS_VS.undo_np_format_as(new_CompS_CS_batch,
                                                     CompS_CS)
     assert_components(CompS_VS_batch, new_CompS_VS_batch)
+
+
+def test_np_format_plan():
+    """
+    Tests that format plans give the same batches as np_format_as, with
+    and without an output buffer.
+    """
+    rng = np.random.RandomState(0)
+    conv_b01c = Conv2DSpace(shape=(3, 4), num_channels=2, dtype='float64')
+    conv_c01b = Conv2DSpace(shape=(3, 4), num_channels=2,
+                            axes=('c', 0, 1, 'b'), dtype='float32')
+    conv_bc01 = Conv2DSpace(shape=(3, 4), num_channels=2,
+                            axes=('b', 'c', 0, 1), dtype='float32')
+    vector = VectorSpace(dim=24, dtype='float64')
+    vector32 = VectorSpace(dim=24, dtype='float32')
+    index = IndexSpace(max_labels=5, dim=1)
+    one_hot = VectorSpace(dim=5, dtype='float32')
+    composite = CompositeSpace((conv_c01b, CompositeSpace((vector,))))
+    pairs = [(vector, vector32), (vector, conv_c01b), (vector, conv_bc01),
+             (conv_c01b, vector32), (conv_bc01, conv_c01b),
+             (conv_b01c, conv_b01c), (index, one_hot),
+             (index, IndexSpace(max_labels=5, dim=1, dtype='int32')),
+             (IndexSpace(max_labels=5, dim=2), VectorSpace(dim=10)),
+             (IndexSpace(max_labels=5, dim=2), one_hot),
+             (composite, VectorSpace(dim=48, dtype='float32')),
+             (CompositeSpace((vector, CompositeSpace((vector,)))),
+              CompositeSpace((conv_bc01, CompositeSpace((vector32,))))),
+             (VectorSpace(dim=48),
+              CompositeSpace((conv_bc01, CompositeSpace((vector32,)))))]
+
+    def make_batch(space):
+        if isinstance(space, CompositeSpace):
+            return tuple(make_batch(c) for c in space.components)
+        if isinstance(space, IndexSpace):
+            return rng.randint(5, size=(6, space.dim)).astype(space.dtype)
+        return rng.uniform(size=space.get_origin_batch(6).shape).astype(
+            space.dtype)
+
+    def assert_same(batch, expected):
+        if isinstance(expected, tuple):
+            assert isinstance(batch, tuple)
+            for b, e in safe_zip(batch, expected):
+                assert_same(b, e)
+        else:
+            assert batch.dtype == expected.dtype
+            np.testing.assert_equal(batch, expected)
+
+    def make_out(batch):
+        if isinstance(batch, tuple):
+            return tuple(make_out(b) for b in batch)
+        return np.empty_like(batch)
+
+    def assert_written(batch, out):
+        if isinstance(out, tuple):
+            for b, o in safe_zip(batch, out):
+                assert_written(b, o)
+        else:
+            assert batch is out
+
+    for source, target in pairs:
+        batch = make_batch(source)
+        expected = source.np_format_as(batch, target)
+        plan = source.np_format_plan(target)
+        assert_same(plan(batch), expected)
+        out = make_out(expected)
+        assert_written(plan(batch, out=out), out)
+        assert_same(out, expected)
+        # Reusing the buffer for the next batch
+        batch = make_batch(source)
+        assert_written(plan(batch, out=out), out)
+        assert_same(out, source.np_format_as(batch, target))
+
+    # Invalid batches are rejected, unless the plan is trusted
+    plan = vector.np_format_plan(conv_c01b)
+    np.testing.assert_raises(ValueError, plan, np.zeros((6, 23)))
+    plan = vector.np_format_plan(conv_c01b, trusted=True)
+    plan(np.zeros((6, 24)))
+    plan(np.zeros((6, 4, 6)))
+
+    np.testing.assert_raises(ValueError, vector.np_format_plan,
+                             VectorSpace(dim=23))
+
+    # Batches are cast to the dtype of the space even when it does not
+    # change
+    plan = vector32.np_format_plan(vector32)
+    assert plan(np.zeros((6, 24))).dtype == 'float32'
+
+
+def test_np_format_plan_one_hot_not_shared():
+    """
+    Tests that plans one-hot encoding the same IndexSpace don't share
+    their formatter, which remembers the last batch it wrote.
+    """
+    index = IndexSpace(max_labels=5, dim=1)
+    one_hot = VectorSpace(dim=5, dtype='float32')
+    first = index.np_format_plan(one_hot)
+    second = index.np_format_plan(one_hot)
+    assert first._convert is not second._convert
+    # Stateless conversions are shared
+    vector = VectorSpace(dim=5)
+    assert (vector.np_format_plan(one_hot)._convert is
+            vector.np_format_plan(one_hot)._convert)
+    first_out = np.empty((3, 5), dtype='float32')
+    second_out = np.empty((3, 5), dtype='float32')
+    batches = [np.array([[0], [1], [2]]), np.array([[3], [4], [0]]),
+               np.array([[4], [4], [1]])]
+    for first_batch, second_batch in zip(batches, batches[::-1]):
+        first(first_batch, out=first_out)
+        second(second_batch, out=second_out)
+        np.testing.assert_equal(first_out,
+                                index.np_format_as(first_batch, one_hot))
+        np.testing.assert_equal(second_out,
+                                index.np_format_as(second_batch, one_hot))
+
+
+def test_np_format_plan_cache_size():
+    """
+    Tests that the cache of resolved conversions is bounded.
+    """
+    vector = VectorSpace(dim=2)
+    for dim in xrange(space_module._NP_FORMAT_CACHE_SIZE + 10):
+        VectorSpace(dim=dim + 3).np_format_plan(
+            CompositeSpace((VectorSpace(dim=dim + 1), vector)))
+    assert (len(space_module._np_format_cache) ==
+            space_module._NP_FORMAT_CACHE_SIZE)
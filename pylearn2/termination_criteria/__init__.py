@@ -10,8 +10,14 @@ __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 
 import functools
+import logging
 import numpy as np
 
+from pylearn2.utils import safe_zip
+from pylearn2.utils.checkpoint import get_plain_state, set_plain_state
+
+log = logging.getLogger(__name__)
+
 class TerminationCriterion(object):
     """
     A callable used to determine if a TrainingAlgorithm should quit
@@ -36,6 +42,34 @@ class TerminationCriterion(object):
         raise NotImplementedError(str(type(self)) + " does not implement " +
                                   "continue_learning.")
 
+    def get_state(self):
+        """
+        Returns the progress of this criterion, to be saved in training
+        checkpoints.
+
+        By default, this is every attribute holding plain data (numbers,
+        strings, arrays), which covers counters and best values seen so
+        far. Criteria with other kinds of state should override this
+        method and `set_state`.
+
+        Returns
+        -------
+        state : object
+            A picklable description of the criterion's progress.
+        """
+        return get_plain_state(self)
+
+    def set_state(self, state):
+        """
+        Restores progress returned by `get_state`.
+
+        Parameters
+        ----------
+        state : object
+            The return value of `get_state`.
+        """
+        set_plain_state(self, state)
+
 
 class MonitorBased(TerminationCriterion):
     """
@@ -43,6 +77,11 @@ class MonitorBased(TerminationCriterion):
     the model's monitor and checks to see if it has decreased by a
     certain proportion of the lowest value in the last N epochs.
 
+    If the channel is not computed at every epoch (see
+    `pylearn2.monitor.MonitorSchedule`), N counts the records of the
+    channel rather than epochs, and epochs without a new record are
+    ignored.
+
     Parameters
     ----------
     prop_decrease : float
@@ -61,6 +100,7 @@ class MonitorBased(TerminationCriterion):
         self.N = N
         self.countdown = N
         self.best_value = np.inf
+        self._num_records = 0
 
     def continue_learning(self, model):
         """
@@ -88,6 +128,11 @@ class MonitorBased(TerminationCriterion):
         else:
             v = monitor.channels[self._channel_name].val_record
 
+        # Nothing to do if the channel was not computed since last time
+        if len(v) == self._num_records:
+            return self.countdown > 0
+        self._num_records = len(v)
+
         # The countdown decreases every time the termination criterion is
         # called unless the channel value is lower than the best value times
         # the prop_decrease factor, in which case the countdown is reset to N
@@ -106,6 +151,92 @@ class MonitorBased(TerminationCriterion):
         return self.countdown > 0
 
 
+class ThroughputRegression(TerminationCriterion):
+    """
+    Watches a throughput channel, by default the `examples_per_second`
+    channel reported by `Train`, and warns or stops training when it
+    stays below a proportion of a reference throughput for N records.
+
+    Like `MonitorBased`, it only looks at new records of the channel. To
+    use it alongside the criterion deciding when training is done,
+    combine them with `And`.
+
+    Parameters
+    ----------
+    prop_decrease : float, optional
+        A record is a regression if it is lower than the reference by
+        more than this proportion of the reference.
+    N : int, optional
+        Number of regressions in a row that trigger the alert.
+    channel_name : str, optional
+        Name of the channel to examine. Higher values must be better.
+    baseline : float, optional
+        The reference throughput, e.g. measured on other hardware or with
+        another data format. Defaults to the best record of the channel
+        so far.
+    terminate : bool, optional
+        If `True`, training stops when the alert is triggered. Otherwise
+        a warning is logged and training goes on.
+    skip : int, optional
+        Number of first records to ignore. The default ignores the record
+        made before training starts, when no example has been seen.
+    """
+    def __init__(self, prop_decrease=.2, N=1,
+                 channel_name='examples_per_second', baseline=None,
+                 terminate=False, skip=1):
+        if not 0. < prop_decrease < 1.:
+            raise ValueError("prop_decrease must be in (0, 1), got %s"
+                             % prop_decrease)
+        if N < 1:
+            raise ValueError("N must be at least 1, got %s" % N)
+        self._channel_name = channel_name
+        self.prop_decrease = prop_decrease
+        self.N = N
+        self.baseline = baseline
+        self.terminate = terminate
+        self.skip = skip
+        self.countdown = N
+        self.best_value = 0.
+        self._num_records = 0
+
+    @functools.wraps(TerminationCriterion.continue_learning)
+    def continue_learning(self, model):
+        v = model.monitor.channels[self._channel_name].val_record
+
+        # Nothing to do if the channel was not computed since last time
+        if len(v) > self._num_records:
+            self._num_records = len(v)
+            if self._num_records > self.skip:
+                self._check(float(v[-1]))
+        return not (self.terminate and self.countdown <= 0)
+
+    def _check(self, value):
+        """
+        Compares a new record of the channel to the reference, and warns
+        the first time there have been N regressions in a row.
+
+        Parameters
+        ----------
+        value : float
+            The new record.
+        """
+        if self.baseline is not None:
+            reference = self.baseline
+        else:
+            reference = self.best_value
+        if value < (1. - self.prop_decrease) * reference:
+            self.countdown -= 1
+            if self.countdown == 0:
+                log.warning("Throughput regression: %s has been below "
+                            "%.0f%% of %g for %d record(s), last value %g.",
+                            self._channel_name,
+                            100 * (1. - self.prop_decrease), reference,
+                            self.N, value)
+        else:
+            self.countdown = self.N
+        self.best_value = max(self.best_value, value)
+
+
 class MatchChannel(TerminationCriterion):
     """
     Stop training when a cost function reaches the same value as a cost
@@ -232,6 +363,16 @@ class EpochCounter(TerminationCriterion):
         self._epochs_done += 1
         return self._epochs_done < self._max_epochs
 
+    def get_state(self):
+        """
+        Returns the number of epochs done. Unlike the default state, it
+        leaves out `max_epochs`, so that a resumed job can be given a
+        different number of epochs to train for.
+        """
+        if not hasattr(self, "_epochs_done"):
+            return {}
+        return {'_epochs_done': self._epochs_done}
+
 
 class And(TerminationCriterion):
     """
@@ -253,6 +394,15 @@ class And(TerminationCriterion):
         assert all(isinstance(x, TerminationCriterion) for x in list(criteria))
         self._criteria = list(criteria)
 
+    @functools.wraps(TerminationCriterion.get_state)
+    def get_state(self):
+        return [criterion.get_state() for criterion in self._criteria]
+
+    @functools.wraps(TerminationCriterion.set_state)
+    def set_state(self, state):
+        for criterion, criterion_state in safe_zip(self._criteria, state):
+            criterion.set_state(criterion_state)
+
     @functools.wraps(TerminationCriterion.continue_learning)
     def continue_learning(self, model):
         return all(criterion.continue_learning(model)
@@ -279,6 +429,15 @@ class Or(TerminationCriterion):
         assert all(isinstance(x, TerminationCriterion) for x in list(criteria))
         self._criteria = list(criteria)
 
+    @functools.wraps(TerminationCriterion.get_state)
+    def get_state(self):
+        return [criterion.get_state() for criterion in self._criteria]
+
+    @functools.wraps(TerminationCriterion.set_state)
+    def set_state(self, state):
+        for criterion, criterion_state in safe_zip(self._criteria, state):
+            criterion.set_state(criterion_state)
+
     @functools.wraps(TerminationCriterion.continue_learning)
     def continue_learning(self, model):
         return any(criterion.continue_learning(model)
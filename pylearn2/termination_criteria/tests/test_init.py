@@ -3,7 +3,8 @@ Tests for pylearn2.termination_criteria.__init__ functions and classes.
 """
 
 
-from pylearn2.termination_criteria import EpochCounter
+from pylearn2.termination_criteria import (EpochCounter, MonitorBased,
+                                           ThroughputRegression)
 
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
 from pylearn2.models.mlp import MLP, Softmax
@@ -66,3 +67,70 @@ def test_epoch_counter():
     train_obj = produce_train_obj(new_epochs=False, model=train_obj.model)
     train_obj.main_loop()
     test_epochs(train_obj.model.monitor.get_epochs_seen(), N+1)
+
+
+def test_monitor_based_sparse_records():
+    """
+    Test that MonitorBased only counts epochs in which the channel got a
+    new record.
+    """
+
+    class Record(object):
+        val_record = []
+
+    class Holder(object):
+        pass
+
+    model = Holder()
+    model.monitor = Holder()
+    channel = Record()
+    model.monitor.channels = {'objective': channel}
+
+    criterion = MonitorBased(prop_decrease=.1, N=2)
+    channel.val_record = [1.]
+    assert criterion.continue_learning(model)
+    for i in range(5):
+        # The channel was not computed in these epochs
+        assert criterion.continue_learning(model)
+    channel.val_record.append(1.)
+    assert criterion.continue_learning(model)
+    assert criterion.continue_learning(model)
+    channel.val_record.append(1.)
+    assert not criterion.continue_learning(model)
+
+
+def test_throughput_regression():
+    """
+    Test that ThroughputRegression only stops training on N regressions
+    in a row when asked to.
+    """
+
+    class Record(object):
+        val_record = []
+
+    class Holder(object):
+        pass
+
+    model = Holder()
+    model.monitor = Holder()
+    channel = Record()
+    model.monitor.channels = {'examples_per_second': channel}
+
+    for terminate in [False, True]:
+        criterion = ThroughputRegression(prop_decrease=.2, N=2,
+                                         terminate=terminate)
+        channel.val_record = [0., 100.]
+        assert criterion.continue_learning(model)
+        for value in [90., 70., 100., 90., 70.]:
+            channel.val_record.append(value)
+            assert criterion.continue_learning(model)
+        channel.val_record.append(70.)
+        assert criterion.continue_learning(model) != terminate
+        # No new record
+        assert criterion.continue_learning(model) != terminate
+        channel.val_record.append(100.)
+        assert criterion.continue_learning(model)
+
+    criterion = ThroughputRegression(N=1, baseline=200., terminate=True)
+    channel.val_record = [0., 150.]
+    assert not criterion.continue_learning(model)
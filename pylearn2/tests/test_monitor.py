@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+import threading
 import numpy as np
 import warnings
 from nose.tools import assert_raises
@@ -17,8 +18,12 @@ from pylearn2.models.s3c import S3C, E_Step, Grad_M_Step
 from pylearn2.monitor import _err_ambig_data
 from pylearn2.monitor import _err_no_data
 from pylearn2.monitor import Monitor
+from pylearn2.monitor import ChannelRecord
+from pylearn2.monitor import AdaptiveMonitorSchedule
+from pylearn2.monitor import PeriodicMonitorSchedule
 from pylearn2.monitor import push_monitor
-from pylearn2.space import VectorSpace
+from pylearn2.monitor import register_fork_lock, unregister_fork_lock
+from pylearn2.space import NullSpace, VectorSpace
 from pylearn2.testing.datasets import ArangeDataset
 from pylearn2.training_algorithms.default import DefaultTrainingAlgorithm
 from pylearn2.utils.iteration import _iteration_schemes, has_uniform_batch_size
@@ -608,5 +613,284 @@ def test_extra_costs():
                   extra_costs=extra_costs)
 
 
+def add_mean_channel(monitor, model, dataset, name):
+    """
+    Adds a channel computing the mean of the first feature of `dataset`.
+    """
+    X = model.input_space.make_theano_batch()
+    monitor.add_channel(name=name,
+                        ipt=X,
+                        val=X[:, 0].mean(),
+                        dataset=dataset,
+                        data_specs=(model.get_input_space(),
+                                    model.get_input_source()))
+
+
+def test_subsample():
+
+    # Makes sure channels are computed on a subset of the examples, which
+    # stays the same unless resampling is requested
+
+    num_features = 3
+    dataset = DummyDataset(num_examples=40, num_features=num_features)
+    full_mean = dataset.X[:, 0].mean()
+
+    def records(resample):
+        model = DummyModel(num_features)
+        monitor = Monitor.get_monitor(model)
+        monitor.add_dataset(dataset, 'sequential', batch_size=4,
+                            subsample=10, resample=resample)
+        add_mean_channel(monitor, model, dataset, 'mean')
+        for i in xrange(3):
+            monitor()
+        return monitor.channels['mean'].val_record
+
+    fixed = records(False)
+    # 10 is rounded down to 2 batches of 4 examples
+    assert not np.allclose(fixed[0], full_mean)
+    assert np.allclose(fixed, fixed[0])
+    resampled = records(True)
+    assert not np.allclose(resampled, resampled[0])
+
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    assert_raises(ValueError, monitor.add_dataset, dataset, 'random_slice',
+                  batch_size=4, subsample=10, seed=1)
+    assert_raises(ValueError, monitor.add_dataset, dataset, 'sequential',
+                  batch_size=4, resample=True)
+
+
+def test_periodic_schedule():
+
+    # Makes sure a scheduled dataset only gets records when it is due,
+    # while the other datasets are monitored at every call
+
+    num_features = 3
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    train = DummyDataset(num_examples=4, num_features=num_features)
+    valid = DummyDataset(num_examples=6, num_features=num_features)
+    monitor.add_dataset([train, valid], ['sequential'] * 2,
+                        batch_size=[2, 2], num_batches=[None, None],
+                        schedule=[None, PeriodicMonitorSchedule(epochs=2)])
+    add_mean_channel(monitor, model, train, 'train_mean')
+    add_mean_channel(monitor, model, valid, 'valid_mean')
+
+    for i in xrange(5):
+        monitor()
+        monitor.report_epoch()
+    assert monitor.channels['train_mean'].epoch_record == [0, 1, 2, 3, 4]
+    assert monitor.channels['valid_mean'].epoch_record == [0, 2, 4]
+    assert len(monitor.channels['valid_mean'].val_record) == 3
+
+
+def test_adaptive_schedule():
+
+    # Makes sure the monitoring period grows while the channels are steady
+    # and shrinks back when they move
+
+    num_features = 3
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    dataset = DummyDataset(num_examples=4, num_features=num_features)
+    schedule = AdaptiveMonitorSchedule(min_epochs=1, max_epochs=4,
+                                       threshold=.1)
+    monitor.add_dataset(dataset, 'sequential', batch_size=2,
+                        schedule=schedule)
+    value = sharedX(1.)
+    monitor.add_channel(name='value', ipt=None, val=value, dataset=dataset,
+                        data_specs=(NullSpace(), ''))
+
+    def run(num_epochs):
+        for i in xrange(num_epochs):
+            monitor()
+            monitor.report_epoch()
+
+    run(8)
+    assert monitor.channels['value'].epoch_record == [0, 1, 3, 7]
+    assert schedule.epochs == 4
+    value.set_value(2.)
+    run(4)
+    assert monitor.channels['value'].epoch_record[-1] == 11
+    assert schedule.epochs == 2
+
+
+def test_call_async():
+
+    # Makes sure call_async computes the channels on the values the model
+    # had when it was called, and records them with the counts of that time
+
+    num_features = 3
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    dataset = DummyDataset(num_examples=4, num_features=num_features)
+    monitor.add_dataset(dataset, 'sequential', batch_size=2)
+    param = sharedX(1.)
+    X = model.input_space.make_theano_batch()
+    monitor.add_channel(name='scaled_sum', ipt=X, val=param * X.sum(),
+                        dataset=dataset,
+                        data_specs=(model.get_input_space(),
+                                    model.get_input_source()))
+    expected = dataset.X.sum() / 2.
+
+    monitor()
+    monitor.call_async()
+    param.set_value(2.)
+    monitor.report_epoch()
+    monitor.wait()
+    monitor.call_async()
+    # A synchronous call waits for the pending results first
+    monitor()
+    channel = monitor.channels['scaled_sum']
+    assert channel.epoch_record == [0, 0, 1, 1]
+    assert np.allclose(channel.val_record,
+                       [expected, expected, 2 * expected, 2 * expected])
+    # The thread cannot be pickled
+    from_string(to_string(monitor))
+
+
+def test_call_async_threads():
+
+    # Makes sure call_async computes the channels right away while a
+    # thread that is not a daemon runs, and holds the registered locks
+    # while it forks
+
+    model = DummyModel(3)
+    monitor = Monitor.get_monitor(model)
+    value = sharedX(1.)
+    monitor.add_data_independent_channel(name='value', val=value)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        monitor.call_async()
+        assert monitor._async_job is None
+        assert monitor.channels['value'].val_record == [1.]
+    finally:
+        stop.set()
+        thread.join()
+
+    class Lock(object):
+        """
+        Counts how many times it is acquired and released.
+        """
+        acquired = released = 0
+
+        def acquire(self):
+            self.acquired += 1
+
+        def release(self):
+            self.released += 1
+
+    lock = Lock()
+    register_fork_lock(lock)
+    try:
+        monitor.call_async()
+    finally:
+        unregister_fork_lock(lock)
+    assert lock.acquired == lock.released == 1
+    monitor.wait()
+    assert monitor.channels['value'].val_record == [1., 1.]
+
+
+def test_data_independent_channel():
+
+    # Makes sure channels that do not depend on data are recorded at every
+    # call, with or without datasets, and whatever the schedules
+
+    num_features = 3
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    value = sharedX(1.)
+    monitor.add_data_independent_channel(name='value', val=2. * value)
+    monitor()
+    monitor.report_epoch()
+    value.set_value(2.)
+    monitor()
+    channel = monitor.channels['value']
+    assert channel.epoch_record == [0, 1]
+    assert np.allclose(channel.val_record, [2., 4.])
+
+    dataset = DummyDataset(num_examples=4, num_features=num_features)
+    monitor.add_dataset(dataset, 'sequential', batch_size=2,
+                        schedule=PeriodicMonitorSchedule(epochs=2))
+    add_mean_channel(monitor, model, dataset, 'mean')
+    for i in xrange(3):
+        monitor.report_epoch()
+        monitor.call_async()
+        value.set_value(3.)
+        monitor.wait()
+    assert channel.epoch_record == [0, 1, 2, 3, 4]
+    assert np.allclose(channel.val_record, [2., 4., 4., 6., 6.])
+    assert monitor.channels['mean'].epoch_record == [2, 4]
+
+    X = model.input_space.make_theano_batch()
+    assert_raises(ValueError, monitor.add_data_independent_channel,
+                  'needs_data', X.sum())
+    # The channel does not refer to a dataset in the pickle
+    from_string(to_string(monitor))
+
+
+def test_channel_record():
+
+    # Makes sure ChannelRecord behaves like the list it replaces
+
+    record = ChannelRecord(dtype='int64')
+    for i in xrange(100):
+        record.append(i)
+    assert len(record) == 100
+    assert record == list(range(100))
+    assert record != list(range(99))
+    assert record[-1] == 99
+    assert list(record[10:13]) == [10, 11, 12]
+    head = record[:-1]
+    head.append(-1)
+    assert head[-1] == -1 and record[-1] == 99
+    record[-1] = 7
+    assert record[-1] == 7
+    record += [1, 2]
+    assert len(record) == 102
+    values = np.asarray(record)
+    assert values.dtype == 'int64' and values.shape == (102,)
+    assert np.argmin(record) == 0
+
+    # Elements that do not fit the type switch to object storage
+    record.append(None)
+    assert record[-1] is None and record[0] == 0
+
+    # The record pickles as one array without the spare capacity
+    record = ChannelRecord(np.arange(1000.))
+    copy = from_string(to_string(record))
+    assert copy == record
+    assert len(to_string(record)) < 2 * len(to_string(np.arange(1000.)))
+    copy.append(1.)
+    assert len(copy) == 1001
+
+
+def test_old_records():
+
+    # Makes sure channels pickled with list records are converted
+
+    num_features = 3
+    model = DummyModel(num_features)
+    monitor = Monitor.get_monitor(model)
+    dataset = DummyDataset(num_examples=2, num_features=num_features)
+    monitor.add_dataset(dataset, 'sequential', batch_size=2)
+    monitor.add_channel(name='zero', ipt=None, val=0., dataset=dataset,
+                        data_specs=(NullSpace(), ''))
+    channel = monitor.channels['zero']
+    state = channel.__getstate__()
+    state['val_record'] = [np.asarray(1.), np.asarray(2.)]
+    state['epoch_record'] = [0, 1]
+    del state['batch_record']
+    channel.__setstate__(state)
+    assert isinstance(channel.val_record, ChannelRecord)
+    assert channel.val_record == [1., 2.]
+    assert channel.epoch_record == [0, 1]
+    assert channel.batch_record == [None, None]
+    channel.batch_record.append(3)
+
+
 if __name__ == '__main__':
     test_revisit()
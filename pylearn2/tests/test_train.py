@@ -5,6 +5,10 @@ __license__ = "3-clause BSD"
 __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 
+import json
+import os
+import shutil
+import tempfile
 from types import MethodType
 import numpy as np
 from pylearn2.monitor import Monitor
@@ -15,8 +19,11 @@ from pylearn2.space import VectorSpace
 from pylearn2.training_algorithms.training_algorithm import TrainingAlgorithm
 from pylearn2.train_extensions import TrainExtension
 from pylearn2.models.mlp import MLP, Softmax
-from pylearn2.training_algorithms.sgd import SGD
+from pylearn2.training_algorithms.sgd import SGD, LinearDecayOverEpoch
+from pylearn2.training_algorithms.learning_rule import (Momentum,
+                                                        MomentumAdjustor)
 from pylearn2.termination_criteria import EpochCounter
+from pylearn2.utils import serial
 
 class DummyModel(Model):
 
@@ -50,6 +57,23 @@ class ParamMonitor(TrainExtension):
         """
         self.params_on_monitor = np.asarray(model.get_param_values())
 
+class RecordsOnSave(TrainExtension):
+    """
+    Mock train extension remembering the last epoch recorded by the
+    monitor every time the model is saved
+    """
+
+    def __init__(self):
+        self.saved = []
+
+    def on_save(self, model, dataset, algorithm):
+        """
+        Store the last epoch recorded and the number of epochs seen
+        """
+        record = model.monitor.channels['train_objective'].epoch_record
+        self.saved.append((record[-1], model.monitor.get_epochs_seen()))
+
+
 def only_run_extensions(self):
     for extension in self.extensions:
         extension.on_save(self.model, self.dataset, self.algorithm)
@@ -114,3 +138,235 @@ def test_serialization_guard():
     except RuntimeError:
         return
     assert False # train did not complain, this is a bug
+
+
+class Crash(Exception):
+    """
+    Raised to simulate a job being killed in the middle of training.
+    """
+
+
+def make_train(save_path, checkpoint_path, max_epochs, save_freq=1,
+               **kwargs):
+    """
+    Builds the same Train object every time it is called, like a YAML
+    file loaded by train.py.
+    """
+    rng = np.random.RandomState([2014, 11, 3])
+    X = rng.normal(size=(20, 3))
+    y = np.zeros((20, 2))
+    y[np.arange(20), rng.randint(2, size=20)] = 1
+    dataset = DenseDesignMatrix(X=X, y=y)
+
+    model = MLP(layers=[Softmax(layer_name='y', n_classes=2, irange=0.1)],
+                nvis=3, seed=[2014, 11, 3])
+    algorithm = SGD(batch_size=5, learning_rate=0.1,
+                    learning_rule=Momentum(init_momentum=0.5),
+                    train_iteration_mode='shuffled_sequential',
+                    monitoring_dataset={'train': dataset},
+                    termination_criterion=EpochCounter(max_epochs),
+                    seed=[2014, 11, 4])
+    extensions = [MomentumAdjustor(final_momentum=0.9, start=1, saturate=3),
+                  LinearDecayOverEpoch(start=1, saturate=3,
+                                       decay_factor=0.1)]
+    return Train(dataset=dataset, model=model, algorithm=algorithm,
+                 extensions=extensions, save_path=save_path,
+                 save_freq=save_freq,
+                 checkpoint_path=checkpoint_path, **kwargs)
+
+
+def test_checkpoint_resume():
+
+    # tests that a job resumed from a checkpoint ends up in the same state
+    # as a job that was never interrupted
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        save_path = os.path.join(tmp_dir, 'model.pkl')
+        checkpoint_path = os.path.join(tmp_dir, 'checkpoint.pkl')
+
+        reference = make_train(os.path.join(tmp_dir, 'reference.pkl'), None,
+                               max_epochs=4)
+        reference.main_loop()
+
+        interrupted = make_train(save_path, checkpoint_path, max_epochs=4)
+        train_epoch = interrupted.algorithm.train
+
+        def crash_after_two_epochs(dataset):
+            if interrupted.model.monitor.get_epochs_seen() == 2:
+                raise Crash()
+            train_epoch(dataset=dataset)
+
+        interrupted.algorithm.train = crash_after_two_epochs
+        try:
+            interrupted.main_loop()
+        except Crash:
+            pass
+        else:
+            assert False
+
+        resumed = make_train(save_path, checkpoint_path, max_epochs=4)
+        resumed.resume()
+        resumed.main_loop()
+
+        for param, ref_param in zip(resumed.model.get_params(),
+                                    reference.model.get_params()):
+            assert np.array_equal(param.get_value(), ref_param.get_value())
+        for var, ref_var in zip(resumed.algorithm._get_state_variables(),
+                                reference.algorithm._get_state_variables()):
+            assert np.array_equal(var.get_value(), ref_var.get_value())
+        monitor = resumed.model.monitor
+        ref_monitor = reference.model.monitor
+        assert monitor.get_epochs_seen() == 4
+        assert monitor.get_batches_seen() == ref_monitor.get_batches_seen()
+        for name in ref_monitor.channels:
+            assert (monitor.channels[name].epoch_record ==
+                    ref_monitor.channels[name].epoch_record)
+            if 'second' in name:
+                continue
+            assert np.allclose(monitor.channels[name].val_record,
+                               ref_monitor.channels[name].val_record), name
+
+        # The final checkpoint records that training is over
+        finished = make_train(save_path, checkpoint_path, max_epochs=4)
+        finished.resume()
+        finished.main_loop()
+        assert not hasattr(finished.model, 'monitor')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_async_save():
+
+    # tests that saving in the background writes the same model and
+    # checkpoint as saving in the training loop
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        reference = make_train(os.path.join(tmp_dir, 'reference.pkl'),
+                               os.path.join(tmp_dir, 'reference_ckpt.pkl'),
+                               max_epochs=3)
+        reference.main_loop()
+        train = make_train(os.path.join(tmp_dir, 'model.pkl'),
+                           os.path.join(tmp_dir, 'ckpt.pkl'),
+                           max_epochs=3, async_save=True,
+                           max_pending_saves=2)
+        train.main_loop()
+
+        model = serial.load(os.path.join(tmp_dir, 'model.pkl'))
+        ref_model = serial.load(os.path.join(tmp_dir, 'reference.pkl'))
+        for value, ref_value in zip(model.get_param_values(),
+                                    ref_model.get_param_values()):
+            assert np.array_equal(value, ref_value)
+        assert model.monitor.get_epochs_seen() == 3
+        assert model.monitor.training_succeeded
+
+        checkpoint = serial.load(os.path.join(tmp_dir, 'ckpt.pkl'))
+        ref_checkpoint = serial.load(os.path.join(tmp_dir,
+                                                  'reference_ckpt.pkl'))
+        for value, ref_value in zip(checkpoint['algorithm']['shared'],
+                                    ref_checkpoint['algorithm']['shared']):
+            assert np.array_equal(value, ref_value)
+        assert not [name for name in os.listdir(tmp_dir)
+                    if name.startswith('.tmp')]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_async_serialization_guard():
+
+    # tests that background saves also refuse to include the dataset
+
+    rng = np.random.RandomState([28, 9, 2012])
+    dataset = DenseDesignMatrix(X=rng.randn(11, 2))
+    model = DummyModel(2)
+    model.dataset = dataset
+    train = Train(dataset, model, DummyAlgorithm(),
+                  save_path='_tmp_unit_test.pkl', async_save=True)
+    train.save()
+    try:
+        train._saver.wait()
+    except IOError:
+        return
+    assert False  # the dataset was copied into the snapshot
+
+
+def test_overlap_monitoring():
+
+    # tests that computing the monitoring channels in the background
+    # gives the same records as computing them in the training loop, and
+    # that saves wait for the records of their epoch
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        records = []
+        for overlap in [False, True]:
+            train = make_train(os.path.join(tmp_dir, 'model.pkl'), None,
+                               max_epochs=4, save_freq=3,
+                               overlap_monitoring=overlap)
+            # The extensions would act one epoch later with overlap, and
+            # thus change training
+            on_save = RecordsOnSave()
+            train.extensions = [on_save]
+            train.main_loop()
+            assert on_save.saved == [(3, 3), (4, 4)]
+            monitor = train.model.monitor
+            records.append(dict(
+                (name, (channel.epoch_record, channel.val_record))
+                for name, channel in monitor.channels.items()
+                if 'second' not in name))
+            # The saved model is complete, including the last epoch
+            model = serial.load(os.path.join(tmp_dir, 'model.pkl'))
+            assert model.monitor.channels['train_objective'].epoch_record == \
+                [0, 1, 2, 3, 4]
+        reference, overlapped = records
+        assert sorted(reference.keys()) == sorted(overlapped.keys())
+        for name in reference:
+            assert reference[name][0] == overlapped[name][0]
+            assert np.allclose(reference[name][1], overlapped[name][1])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_profile():
+
+    # tests that the time spent in each phase of training is reported by
+    # monitoring channels and written to the trace
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        trace_path = os.path.join(tmp_dir, 'trace.json')
+        train = make_train(os.path.join(tmp_dir, 'model.pkl'), None,
+                           max_epochs=2, profile_trace_path=trace_path)
+        train.main_loop()
+        channels = train.model.monitor.channels
+        for phase in ['fetch', 'convert', 'on_load_batch', 'update',
+                      'update_callbacks', 'monitor', 'extensions', 'save']:
+            record = channels['profile_%s_seconds' % phase].val_record
+            assert len(record) == 3
+            assert record[0] == 0
+            assert all(seconds >= 0 for seconds in record)
+        for phase in ['fetch', 'update']:
+            assert channels['profile_%s_seconds' % phase].val_record[1] > 0
+        for name in ['examples_per_second', 'update_latency_p50_seconds',
+                     'update_latency_p95_seconds',
+                     'update_latency_p99_seconds']:
+            record = channels[name].val_record
+            assert record[0] == 0
+            assert record[1] > 0 and record[2] > 0
+        # Saving and monitoring are reported one epoch late
+        assert channels['profile_save_seconds'].val_record[1] == 0
+        assert channels['profile_save_seconds'].val_record[2] > 0
+        assert channels['profile_monitor_seconds'].val_record[1] > 0
+
+        with open(trace_path) as f:
+            events = json.load(f)['traceEvents']
+        names = set(event['name'] for event in events if event['ph'] == 'X')
+        assert names == set(['fetch', 'convert', 'update', 'on_load_batch',
+                             'update_callbacks', 'monitor', 'extensions',
+                             'save'])
+        # 4 batches per epoch
+        assert len([event for event in events
+                    if event['name'] == 'update']) == 8
+    finally:
+        shutil.rmtree(tmp_dir)
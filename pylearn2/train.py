@@ -10,16 +10,22 @@ import os
 import sys
 import logging
 import warnings
+from pylearn2.compat import OrderedDict
 from pylearn2.utils import serial
 from pylearn2.utils.string_utils import preprocess
 from pylearn2.monitor import Monitor
 from pylearn2.space import NullSpace
 from pylearn2.utils.timing import log_timing, total_seconds
-from pylearn2.utils import sharedX
+from pylearn2.utils import safe_zip, sharedX
+from pylearn2.utils.checkpoint import set_shared_values
+from pylearn2.utils.profiling import NullProfiler, Profiler
 
 
 log = logging.getLogger(__name__)
 
+# The percentiles of the latency of parameter updates reported as channels
+UPDATE_LATENCY_PERCENTILES = (50, 95, 99)
+
 
 class Train(object):
     """
@@ -52,10 +58,60 @@ class Train(object):
         If `True`, will save the model to save_path even if there is
         already something there. Otherwise, will raise an error if the
         `save_path` is already occupied.
+    checkpoint_path : str, optional
+        If specified, every save also writes a checkpoint of the full
+        training state to this path: the model and its monitor, the
+        state of the training algorithm (learning rule accumulators,
+        random number generators, termination criterion) and the state
+        of the extensions. Training can then be continued from the
+        checkpoint with `resume`, or `train.py --resume`.
+    async_save : bool, optional
+        If `True`, saving only copies the model (and the checkpoint) in
+        the training loop. Serializing the copy and writing it to disk
+        happen in a background thread while training continues.
+        `main_loop` waits for pending saves before returning.
+    max_pending_saves : int, optional
+        With `async_save`, the number of saves that may be in progress
+        at once. Saving blocks once this many are pending, so at most
+        this many snapshots are held in memory.
+    keep_versions : int, optional
+        If specified, every save goes to a new numbered version of
+        `save_path` (and of `checkpoint_path`), `save_path` itself
+        becomes a symbolic link to the latest version, and only the
+        `keep_versions` most recent versions are kept. See
+        `pylearn2.utils.serial.save`.
+    overlap_monitoring : bool, optional
+        If `True`, the monitoring channels of each epoch are computed in
+        a forked process, which sees the parameters as they were at the
+        end of the epoch, while training goes on with the next epoch (see
+        `Monitor.call_async`). The records keep the counts of the epoch
+        they were computed for, but the extensions and the termination
+        criterion only see them at the end of the next epoch, so they act
+        one epoch late; for instance `MonitorBasedSaveBest` saves the
+        model one epoch after the one that got the best record. At the
+        epochs where the model is saved, the channels are waited for
+        before saving instead, so that the saved model and checkpoint
+        hold the records of the epoch. With `async_save`, the pending
+        saves are waited for before forking, and the channels are
+        computed right away, without overlap, if other threads that are
+        not daemon threads are running.
+    profile : bool, optional
+        If `True`, the time spent in each phase of training (reading and
+        converting minibatches, callbacks, parameter updates, monitoring,
+        extensions and saving) is reported by the monitoring channels
+        `profile_<phase>_seconds`. See `pylearn2.utils.profiling`.
+    profile_trace_path : str, optional
+        If specified, enables `profile` and writes every measured phase
+        to this file at the end of `main_loop`, in the Chrome trace event
+        format.
     """
 
     def __init__(self, dataset, model, algorithm=None, save_path=None,
-                 save_freq=0, extensions=None, allow_overwrite=True):
+                 save_freq=0, extensions=None, allow_overwrite=True,
+                 checkpoint_path=None, async_save=False,
+                 max_pending_saves=1, keep_versions=None,
+                 overlap_monitoring=False, profile=False,
+                 profile_trace_path=None):
         self.allow_overwrite = allow_overwrite
         self.first_save = True
         self.dataset = dataset
@@ -77,6 +133,24 @@ class Train(object):
                     tokens = os.environ['PYLEARN2_TRAIN_FILE_FULL_STEM'], 'pkl'
                 self.save_path = '.'.join(tokens)
         self.save_freq = save_freq
+        if checkpoint_path is not None:
+            if save_freq == 0:
+                warnings.warn('checkpoint_path specified but save_freq is 0 '
+                              '(never save). Is this intentional?')
+            checkpoint_path = preprocess(checkpoint_path)
+        self.checkpoint_path = checkpoint_path
+        self._checkpoint = None
+        self.keep_versions = keep_versions
+        if async_save:
+            self._saver = serial.AsyncSaver(max_pending_saves)
+        else:
+            self._saver = None
+        self.overlap_monitoring = overlap_monitoring
+        self._monitoring_pending = False
+        if profile or profile_trace_path is not None:
+            self.profiler = Profiler(profile_trace_path)
+        else:
+            self.profiler = NullProfiler()
 
         if hasattr(self.dataset, 'yaml_src'):
             self.model.dataset_yaml_src = self.dataset.yaml_src
@@ -88,6 +162,11 @@ class Train(object):
         self.training_seconds = sharedX(value=0,
                                         name='training_seconds_this_epoch')
         self.total_seconds = sharedX(value=0, name='total_seconds_last_epoch')
+        self.examples_per_second = sharedX(value=0,
+                                           name='examples_per_second')
+        self.update_latency = OrderedDict(
+            (q, sharedX(value=0, name='update_latency_p%d_seconds' % q))
+            for q in UPDATE_LATENCY_PERCENTILES)
 
     def setup_extensions(self):
         """ Calls setup on all extensions."""
@@ -118,6 +197,7 @@ class Train(object):
         self.model.monitor = Monitor.get_monitor(self.model)
         self.model.monitor.time_budget_exceeded = False
         if self.algorithm is not None:
+            self.algorithm.profiler = self.profiler
             self.algorithm.setup(model=self.model, dataset=self.dataset)
         self.setup_extensions()
 
@@ -138,10 +218,22 @@ class Train(object):
             training. Default is `None`, no time limit.
         """
         t0 = datetime.now()
+        if self._checkpoint is not None and \
+           self._checkpoint['model'].monitor.training_succeeded:
+            log.info("The checkpoint was taken after training finished, "
+                     "there is nothing left to do.")
+            return
         self.setup()
         if self.algorithm is None:
-            self.run_callbacks_and_monitoring()
-            while True:
+            continue_learning = True
+            if self._checkpoint is not None:
+                # The checkpoint was saved at the end of an epoch, before
+                # deciding whether to continue learning.
+                self.restore_checkpoint()
+                continue_learning = self.model.continue_learning()
+            else:
+                self.run_callbacks_and_monitoring()
+            while continue_learning:
                 if self.exceeded_time_budget(t0, time_budget):
                     break
 
@@ -193,14 +285,47 @@ already been reported."""
                     val=self.total_seconds,
                     data_specs=(NullSpace(), ''),
                     dataset=self.model.monitor._datasets[0])
-            self.run_callbacks_and_monitoring()
+                self.examples_per_second.__doc__ = """\
+The number of examples trained on per second of actual training during the
+most recent epoch."""
+                self.model.monitor.add_channel(
+                    name="examples_per_second",
+                    ipt=None,
+                    val=self.examples_per_second,
+                    data_specs=(NullSpace(), ''),
+                    dataset=self.model.monitor._datasets[0])
+                if self.algorithm.update_latency is not None:
+                    for q, shared in self.update_latency.items():
+                        shared.__doc__ = """\
+The %dth percentile of the time in seconds taken by the updates of the
+parameters during the most recent epoch, estimated from a random sample
+of the updates. Updates of several stacked minibatches count as one update
+per minibatch, each taking its share of the time.""" % q
+                        self.model.monitor.add_channel(
+                            name=shared.name,
+                            ipt=None,
+                            val=shared,
+                            data_specs=(NullSpace(), ''),
+                            dataset=self.model.monitor._datasets[0])
+                self.profiler.add_channels(self.model.monitor)
+            continue_learning = True
+            if self._checkpoint is not None:
+                # The checkpoint was saved at the end of an epoch, after
+                # monitoring but before deciding whether to continue
+                # learning.
+                self.restore_checkpoint()
+                continue_learning = self.algorithm.continue_learning(
+                    self.model)
+            else:
+                self.run_callbacks_and_monitoring()
 
-            while True:
+            while continue_learning:
                 if self.exceeded_time_budget(t0, time_budget):
                     break
 
                 with log_timing(log, None, level=logging.DEBUG,
                                 callbacks=[self.total_seconds.set_value]):
+                    examples_seen = self.model.monitor.get_examples_seen()
                     with log_timing(
                             log, None, final_msg='Time this epoch:',
                             callbacks=[self.training_seconds.set_value]):
@@ -211,10 +336,14 @@ already been reported."""
                                          "TrainingAlgorithm.continue_learning "
                                          "to control whether learning "
                                          "continues.")
+                    self._set_throughput(examples_seen)
                     self.model.monitor.report_epoch()
                     extension_continue = self.run_callbacks_and_monitoring()
                     if self.save_freq > 0 and \
                        self.model.monitor.get_epochs_seen() % self.save_freq == 0:
+                        # The saved records must include this epoch
+                        extension_continue = (self.finish_monitoring() and
+                                              extension_continue)
                         self.save()
                 continue_learning = (
                     self.algorithm.continue_learning(self.model) and
@@ -224,41 +353,132 @@ already been reported."""
                 if not continue_learning:
                     break
 
+        self.finish_monitoring()
         self.model.monitor.training_succeeded = True
 
         if self.save_freq > 0:
             self.save()
+        if self._saver is not None:
+            with log_timing(log, 'Waiting for pending saves'):
+                self._saver.wait()
+        self.profiler.write_trace()
+
+    def _set_throughput(self, examples_seen):
+        """
+        Sets the throughput and latency channels after an epoch.
+
+        Parameters
+        ----------
+        examples_seen : int
+            The number of examples seen by the monitor before the epoch.
+        """
+        seconds = float(self.training_seconds.get_value())
+        examples = self.model.monitor.get_examples_seen() - examples_seen
+        if seconds > 0:
+            self.examples_per_second.set_value(examples / seconds)
+        else:
+            self.examples_per_second.set_value(0)
+        update_latency = self.algorithm.update_latency
+        if update_latency is not None and len(update_latency) > 0:
+            for q, shared in self.update_latency.items():
+                shared.set_value(update_latency.percentile(q))
 
     def run_callbacks_and_monitoring(self):
         """
         Runs the monitor, then calls Extension.on_monitor for all extensions.
 
+        With `overlap_monitoring`, this instead records the channels
+        computed in the background during the last epoch, calls the
+        extensions on them, and starts computing the channels for the
+        current state of the model.
+
         Returns
         -------
         continue_learning : bool
             If `False`, signals that at least one train
             extension wants to stop learning.
         """
-        self.model.monitor()
+        monitor = self.model.monitor
+        profiler = self.profiler
+        profiler.publish()
+        if not self.overlap_monitoring:
+            with profiler.phase('monitor'):
+                monitor()
+            return self._call_on_monitor()
         continue_learning = True
-        for extension in self.extensions:
-            try:
-                extension.on_monitor(self.model, self.dataset, self.algorithm)
-            except TypeError:
-                logging.warning('Failure during callback ' + str(extension))
-                raise
-            # We catch an exception here instead of relying on return
-            # values for backward compatibility. Lots of extensions
-            # exist that don't return anything, currently.
-            except StopIteration:
-                log.info("Extension requested training halt.")
-                continue_learning = False
+        if self._monitoring_pending:
+            with profiler.phase('monitor'):
+                monitor.wait()
+            continue_learning = self._call_on_monitor()
+        if self._saver is not None:
+            # The process computing the channels is only forked while no
+            # save thread runs, see Monitor.call_async
+            with profiler.phase('save'):
+                self._saver.wait()
+        with profiler.phase('monitor'):
+            monitor.call_async()
+        self._monitoring_pending = True
+        return continue_learning
+
+    def finish_monitoring(self):
+        """
+        With `overlap_monitoring`, waits for the channels that are being
+        computed in the background, records them and calls the extensions
+        on them. Does nothing otherwise.
+
+        Returns
+        -------
+        continue_learning : bool
+            If `False`, signals that at least one train
+            extension wants to stop learning.
+        """
+        if not self._monitoring_pending:
+            return True
+        self._monitoring_pending = False
+        with self.profiler.phase('monitor'):
+            self.model.monitor.wait()
+        return self._call_on_monitor()
+
+    def _call_on_monitor(self):
+        """
+        Calls Extension.on_monitor for all extensions.
+
+        Returns
+        -------
+        continue_learning : bool
+            If `False`, signals that at least one train
+            extension wants to stop learning.
+        """
+        continue_learning = True
+        with self.profiler.phase('extensions'):
+            for extension in self.extensions:
+                try:
+                    extension.on_monitor(self.model, self.dataset,
+                                         self.algorithm)
+                except TypeError:
+                    logging.warning('Failure during callback ' +
+                                    str(extension))
+                    raise
+                # We catch an exception here instead of relying on return
+                # values for backward compatibility. Lots of extensions
+                # exist that don't return anything, currently.
+                except StopIteration:
+                    log.info("Extension requested training halt.")
+                    continue_learning = False
         return continue_learning
 
     def save(self):
-        """Saves the model."""
-        #TODO-- save state of training algorithm so training can be
-        # resumed after a crash
+        """
+        Saves the model, and the checkpoint if `checkpoint_path` is
+        specified.
+        """
+        with self.profiler.phase('save'):
+            self._save()
+
+    def _save(self):
+        """
+        Implements `save`.
+        """
         for extension in self.extensions:
             extension.on_save(self.model, self.dataset, self.algorithm)
         if self.save_path is not None:
@@ -269,14 +489,114 @@ already been reported."""
                     # and every save thereafter. The "allow_overwrite" flag
                     # only pertains to overwriting the output of previous jobs.
                     raise IOError("Trying to overwrite file when not allowed.")
-                try:
-                    # Make sure that saving does not serialize the dataset
-                    self.dataset._serialization_guard = SerializationGuard()
-                    serial.save(self.save_path, self.model,
-                                on_overwrite='backup')
-                finally:
-                    self.dataset._serialization_guard = None
+                self._save_object(self.save_path, self.model)
             self.first_save = False
+        if self.checkpoint_path is not None:
+            self.save_checkpoint()
+
+    def get_checkpoint(self):
+        """
+        Returns the full state of training, to be restored by
+        `restore_checkpoint`.
+
+        Returns
+        -------
+        checkpoint : dict
+            Holds the model (with its monitor), the state of the
+            training algorithm, the states of the extensions and the
+            timing channels of the Train object.
+        """
+        if self.algorithm is None:
+            algorithm_state = None
+        else:
+            algorithm_state = self.algorithm.get_state()
+        return {
+            'model': self.model,
+            'algorithm': algorithm_state,
+            'extensions': [extension.get_state()
+                           for extension in self.extensions],
+            'training_seconds': self.training_seconds.get_value(),
+            'total_seconds': self.total_seconds.get_value()
+        }
+
+    def save_checkpoint(self):
+        """
+        Saves the full state of training to `checkpoint_path`.
+        """
+        with log_timing(log, 'Saving checkpoint to ' + self.checkpoint_path):
+            self._save_object(self.checkpoint_path, self.get_checkpoint())
+
+    def _save_object(self, path, obj):
+        """
+        Saves `obj` to `path`, either right away or, with `async_save`,
+        by handing a copy of it to the background saver.
+
+        Parameters
+        ----------
+        path : str
+            The destination file.
+        obj : object
+            The object to save.
+        """
+        try:
+            # Make sure that saving does not serialize the dataset
+            self.dataset._serialization_guard = SerializationGuard()
+            if self._saver is None:
+                serial.save(path, obj, keep_versions=self.keep_versions)
+            else:
+                # The object is copied before training goes on, so that
+                # its state is consistent. The copy gets a guard in place
+                # of the dataset, since the guard above is removed before
+                # the copy is written.
+                self._saver.save(path, obj, keep_versions=self.keep_versions,
+                                 replace={self.dataset: SerializationGuard()})
+        finally:
+            self.dataset._serialization_guard = None
+
+    def resume(self, checkpoint_path=None):
+        """
+        Makes the next call to `main_loop` continue training from a
+        checkpoint rather than from scratch.
+
+        The checkpoint is restored into the objects this Train was built
+        with, so they must be configured the same way as when the
+        checkpoint was saved; usually they come from the same YAML file.
+
+        Parameters
+        ----------
+        checkpoint_path : str, optional
+            The checkpoint to resume from. Defaults to `checkpoint_path`.
+        """
+        if checkpoint_path is None:
+            checkpoint_path = self.checkpoint_path
+        if checkpoint_path is None:
+            raise ValueError("No checkpoint to resume from: "
+                             "checkpoint_path was not specified.")
+        with log_timing(log, 'Loading checkpoint from ' + checkpoint_path):
+            self._checkpoint = serial.load(checkpoint_path)
+        # A resumed job overwrites the output of the interrupted one.
+        self.first_save = False
+
+    def restore_checkpoint(self):
+        """
+        Restores the state loaded by `resume`. Called by `main_loop`
+        after `setup`, in place of the initial round of monitoring.
+        """
+        checkpoint = self._checkpoint
+        saved_model = checkpoint['model']
+        set_shared_values(self.model.get_params(),
+                          saved_model.get_param_values())
+        self.model.monitor.restore_records(saved_model.monitor)
+        if self.algorithm is not None:
+            self.algorithm.set_state(checkpoint['algorithm'])
+        for extension, state in safe_zip(self.extensions,
+                                         checkpoint['extensions']):
+            extension.set_state(state)
+        self.training_seconds.set_value(checkpoint['training_seconds'])
+        self.total_seconds.set_value(checkpoint['total_seconds'])
+        self._checkpoint = None
+        log.info("Resuming training after %d epochs.",
+                 self.model.monitor.get_epochs_seen())
 
 
 class SerializationGuard(object):
@@ -10,6 +10,8 @@ import functools
 import logging
 import numpy as np
 
+from pylearn2.utils.checkpoint import get_plain_state, set_plain_state
+
 logger = logging.getLogger(__name__)
 
 
@@ -78,6 +80,36 @@ class TrainExtension(object):
             used to train the model.
         """
 
+    def get_state(self):
+        """
+        Returns the progress of this extension, to be saved in training
+        checkpoints so that it can be restored by `set_state` when
+        training is resumed.
+
+        By default, this is every attribute holding plain data (numbers,
+        strings, arrays), which covers counters, initial values and best
+        values seen so far. Extensions with other kinds of state should
+        override this method and `set_state`.
+
+        Returns
+        -------
+        state : object
+            A picklable description of the extension's progress.
+        """
+        return get_plain_state(self)
+
+    def set_state(self, state):
+        """
+        Restores progress returned by `get_state`. Train calls this after
+        `setup` when resuming from a checkpoint.
+
+        Parameters
+        ----------
+        state : object
+            The return value of `get_state`.
+        """
+        set_plain_state(self, state)
+
 class SharedSetter(TrainExtension):
     """
     Sets shared variables to take on the specified values after the
@@ -171,8 +203,7 @@ class ChannelSmoother(TrainExtension):
         val_record = self.in_ch.val_record
 
         start = max(0, len(val_record) - self.k + 1)
-        values = val_record[start:]
-        mean = sum(values) / float(len(values))
+        mean = float(np.asarray(val_record)[start:].mean())
 
         self.out_ch.val_record[-1] = mean
         logger.info('\t{0}: {1}'.format(self.channel_to_publish, mean))
@@ -146,6 +146,7 @@ class MonitorBasedSaveBest(TrainExtension):
         # placeholders
         self.best_cost = self.coeff * np.inf
         self.best_model = None
+        self._num_records = 0
 
     def setup(self, model, dataset, algorithm):
         """
@@ -194,6 +195,11 @@ class MonitorBasedSaveBest(TrainExtension):
         channels = monitor.channels
         channel = channels[self.channel_name]
         val_record = channel.val_record
+        # The channel may not be computed at every monitoring step, in
+        # which case its last record is not about the current model.
+        if len(val_record) == self._num_records:
+            return
+        self._num_records = len(val_record)
         new_cost = val_record[-1]
 
         if self.coeff * new_cost < self.coeff * self.best_cost and \
@@ -0,0 +1,164 @@
+"""
+A TrainExtension reporting where the memory of a training job goes.
+"""
+import logging
+import threading
+import weakref
+
+from pylearn2.compat import OrderedDict
+from pylearn2.monitor import register_fork_lock, unregister_fork_lock
+from pylearn2.train_extensions import TrainExtension
+from pylearn2.utils import sharedX, wraps
+from pylearn2.utils.mem import (get_peak_rss, get_resident_bytes, get_rss,
+                                get_shared_bytes)
+from pylearn2.utils.profiling import PHASES, Profiler
+
+
+log = logging.getLogger(__name__)
+
+
+def _sample(extension_ref, profiler, interval, stop, lock):
+    """
+    Samples the resident set size in the phase of training being run,
+    until `stop` is set or the extension is garbage collected.
+
+    Parameters
+    ----------
+    extension_ref : weakref
+        A weak reference to the `MemoryMonitor` holding the peaks, so
+        that this thread does not keep it alive.
+    profiler : Profiler
+        Tells in which phase training is.
+    interval : float
+        Seconds between two samples.
+    stop : threading.Event
+        Set to stop sampling.
+    lock : threading.Lock
+        Held while sampling. It is registered with
+        `pylearn2.monitor.register_fork_lock` until sampling stops, so
+        that monitoring in a forked process waits for the sample in
+        progress.
+    """
+    try:
+        while not stop.wait(interval):
+            extension = extension_ref()
+            if extension is None:
+                return
+            with lock:
+                phase = profiler.current_phase
+                if phase is not None:
+                    rss = get_rss()
+                    if rss > extension._phase_peaks[phase]:
+                        extension._phase_peaks[phase] = rss
+            del extension
+    finally:
+        unregister_fork_lock(lock)
+
+
+class MemoryMonitor(TrainExtension):
+    """
+    Records the memory used by training as monitoring channels:
+
+    - `memory_rss_bytes`: the resident set size of the process.
+    - `memory_peak_rss_bytes`: the largest resident set size so far.
+    - `memory_params_bytes`: the bytes held by the parameters of the
+      model.
+    - `memory_dataset_bytes`: the bytes of the arrays the training
+      dataset holds in memory (see `pylearn2.utils.mem.get_resident_bytes`).
+    - `memory_peak_<phase>_bytes`: for each phase of training (see
+      `pylearn2.utils.profiling.PHASES`), the largest resident set size
+      sampled during that phase since the previous record, or 0 if the
+      phase was not sampled.
+
+    The per-phase peaks need the phases measured by `Train` when it is
+    built with `profile=True`; without it, they are left out. A
+    background thread samples the resident set size every `interval`
+    seconds, so spikes shorter than that may be missed. Like the
+    `profile_<phase>_seconds` channels, the peaks of the monitoring,
+    extension and saving phases are those of the previous epoch.
+
+    The channels do not depend on data, and are set by the training
+    process at the start of each monitoring step, even when the
+    channels are computed in a forked process (see
+    `pylearn2.monitor.Monitor.call_async`).
+
+    Parameters
+    ----------
+    interval : float, optional
+        Seconds between two samples for the per-phase peaks. If None, the
+        per-phase peaks are not reported.
+    """
+
+    def __init__(self, interval=.05):
+        if interval is not None and interval <= 0:
+            raise ValueError("interval must be positive, got %s" % interval)
+        self.interval = interval
+        self._channels = OrderedDict()
+        self._phase_peaks = dict((phase, 0) for phase in PHASES)
+        self._stop = threading.Event()
+
+    @wraps(TrainExtension.setup)
+    def setup(self, model, dataset, algorithm):
+        monitor = model.monitor
+        self._model = model
+        self._dataset = dataset
+        names = ['rss', 'peak_rss', 'params', 'dataset']
+        profiler = getattr(algorithm, 'profiler', None)
+        per_phase = isinstance(profiler, Profiler)
+        if self.interval is not None:
+            if per_phase:
+                names.extend('peak_%s' % phase for phase in PHASES)
+            else:
+                log.warning("The per-phase memory peaks are only reported "
+                            "when training is profiled (Train with "
+                            "profile=True).")
+        for name in names:
+            shared = sharedX(0, name='memory_%s_bytes' % name)
+            self._channels[name] = shared
+            monitor.add_data_independent_channel(shared.name, shared)
+        monitor.add_record_callback(self._update)
+        if self.interval is not None and per_phase:
+            lock = threading.Lock()
+            register_fork_lock(lock)
+            thread = threading.Thread(target=_sample,
+                                      args=(weakref.ref(self), profiler,
+                                            self.interval, self._stop,
+                                            lock),
+                                      name='MemoryMonitor')
+            thread.daemon = True
+            thread.start()
+
+    def _update(self):
+        """
+        Sets the channels to the current memory usage. The monitor calls
+        it at the start of each monitoring step, see
+        `pylearn2.monitor.Monitor.add_record_callback`.
+        """
+        channels = self._channels
+        channels['rss'].set_value(get_rss())
+        channels['peak_rss'].set_value(get_peak_rss())
+        channels['params'].set_value(
+            get_shared_bytes(self._model.get_params()))
+        channels['dataset'].set_value(get_resident_bytes(self._dataset))
+        for phase in PHASES:
+            name = 'peak_%s' % phase
+            if name in channels:
+                channels[name].set_value(self._phase_peaks[phase])
+                self._phase_peaks[phase] = 0
+
+    def stop(self):
+        """
+        Stops sampling the per-phase peaks. Sampling also stops when the
+        extension is garbage collected.
+        """
+        self._stop.set()
+
+    def get_state(self):
+        """
+        Returns None: memory usage is not carried over to a resumed job.
+        """
+        return None
+
+    @wraps(TrainExtension.set_state)
+    def set_state(self, state):
+        pass
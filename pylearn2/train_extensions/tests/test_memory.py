@@ -0,0 +1,109 @@
+"""
+Tests for pylearn2.train_extensions.memory
+"""
+import os
+
+import numpy as np
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.models.mlp import MLP, Softmax
+from pylearn2.termination_criteria import EpochCounter
+from pylearn2.train import Train
+from pylearn2.train_extensions.memory import MemoryMonitor
+from pylearn2.training_algorithms.sgd import SGD
+from pylearn2.utils.profiling import PHASES
+
+
+def make_train(extension, profile, overlap_monitoring=False):
+    """
+    Builds a small training job.
+
+    Parameters
+    ----------
+    extension : MemoryMonitor
+        The extension to train with.
+    profile : bool
+        Whether to profile training.
+    overlap_monitoring : bool, optional
+        Whether to monitor in a forked process.
+
+    Returns
+    -------
+    train : Train
+        The training job.
+    """
+    rng = np.random.RandomState([2015, 3, 18])
+    X = rng.normal(size=(20, 3))
+    y = np.zeros((20, 2))
+    y[np.arange(20), rng.randint(2, size=20)] = 1
+    dataset = DenseDesignMatrix(X=X, y=y)
+    model = MLP(layers=[Softmax(layer_name='y', n_classes=2, irange=0.1)],
+                nvis=3)
+    algorithm = SGD(batch_size=5, learning_rate=0.1,
+                    monitoring_dataset={'train': dataset},
+                    termination_criterion=EpochCounter(2))
+    return Train(dataset=dataset, model=model, algorithm=algorithm,
+                 extensions=[extension], profile=profile,
+                 overlap_monitoring=overlap_monitoring)
+
+
+def test_memory_monitor():
+    """
+    Tests that the memory channels are recorded at every epoch.
+    """
+    extension = MemoryMonitor(interval=.001)
+    train = make_train(extension, profile=True)
+    train.main_loop()
+    extension.stop()
+    channels = train.model.monitor.channels
+    for name in ['rss', 'peak_rss', 'params', 'dataset']:
+        assert len(channels['memory_%s_bytes' % name].val_record) == 3
+    rss = channels['memory_rss_bytes'].val_record
+    assert all(value > 0 for value in rss)
+    params_bytes = sum(param.get_value().nbytes
+                       for param in train.model.get_params())
+    assert channels['memory_params_bytes'].val_record[-1] == params_bytes
+    dataset = train.dataset
+    assert (channels['memory_dataset_bytes'].val_record[-1] ==
+            dataset.X.nbytes + dataset.y.nbytes)
+    for phase in PHASES:
+        assert 'memory_peak_%s_bytes' % phase in channels
+
+
+def test_memory_monitor_without_profile():
+    """
+    Tests that the per-phase peaks are left out when training is not
+    profiled.
+    """
+    train = make_train(MemoryMonitor(), profile=False)
+    train.main_loop()
+    channels = train.model.monitor.channels
+    assert 'memory_rss_bytes' in channels
+    assert not any(name.startswith('memory_peak_') and
+                   name != 'memory_peak_rss_bytes' for name in channels)
+
+
+def test_memory_monitor_overlap_monitoring():
+    """
+    Tests that the memory channels are measured in the training process,
+    not in the process monitoring is forked to.
+    """
+    pids = []
+
+    class PidMemoryMonitor(MemoryMonitor):
+        def _update(self):
+            pids.append(os.getpid())
+            super(PidMemoryMonitor, self)._update()
+
+    extension = PidMemoryMonitor(interval=.001)
+    train = make_train(extension, profile=True, overlap_monitoring=True)
+    train.main_loop()
+    extension.stop()
+    assert pids == [os.getpid()] * 3
+    channels = train.model.monitor.channels
+    rss = channels['memory_rss_bytes'].val_record
+    assert len(rss) == 3
+    assert all(value > 0 for value in rss)
+    params_bytes = sum(param.get_value().nbytes
+                       for param in train.model.get_params())
+    assert channels['memory_params_bytes'].val_record[-1] == params_bytes
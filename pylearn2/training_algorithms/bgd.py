@@ -26,6 +26,7 @@ from pylearn2.utils import safe_zip
 from pylearn2.train_extensions import TrainExtension
 from pylearn2.termination_criteria import TerminationCriterion
 from pylearn2.utils import sharedX
+from pylearn2.utils.checkpoint import get_plain_state, set_plain_state
 from pylearn2.space import CompositeSpace, NullSpace
 from pylearn2.utils.data_specs import DataSpecsMapping
 from pylearn2.utils.rng import make_np_rng
@@ -80,6 +81,15 @@ class BGD(TrainingAlgorithm):
     reset_conjugate : bool, optional
         Passed through to the optimization.BatchGradientDescent's
         `reset_conjugate` parameter
+    lbfgs : bool, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `lbfgs` parameter
+    lbfgs_memory : int, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `lbfgs_memory` parameter
+    reset_lbfgs : bool, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `reset_lbfgs` parameter
     line_search_mode : WRITEME
     verbose_optimization : bool, optional
         WRITEME
@@ -88,6 +98,19 @@ class BGD(TrainingAlgorithm):
     theano_function_mode : WRITEME
     init_alpha : WRITEME
     seed : WRITEME
+    monitoring_subsample : int or dict, optional
+        If specified, the monitoring channels are computed on a random
+        subset of this many examples of each monitoring dataset, or of
+        the datasets named in the dictionary. See
+        `pylearn2.monitor.Monitor.add_dataset`.
+    monitoring_resample : bool or dict, optional
+        Whether a new subset is drawn every time the channels are
+        computed, rather than using the same subset throughout training.
+    monitoring_schedule : MonitorSchedule or dict, optional
+        Decides when the channels of each monitoring dataset are
+        computed, e.g. `pylearn2.monitor.PeriodicMonitorSchedule` or
+        `pylearn2.monitor.AdaptiveMonitorSchedule`. If not specified,
+        they are computed at every monitoring step.
     """
 
     def __init__(self, cost=None, batch_size=None, batches_per_iter=None,
@@ -97,7 +120,10 @@ class BGD(TrainingAlgorithm):
                  reset_alpha=True, conjugate=False, min_init_alpha=.001,
                  reset_conjugate=True, line_search_mode=None,
                  verbose_optimization=False, scale_step=1.,
-                 theano_function_mode=None, init_alpha=None, seed=None):
+                 theano_function_mode=None, init_alpha=None, seed=None,
+                 lbfgs=False, lbfgs_memory=10, reset_lbfgs=True,
+                 monitoring_subsample=None, monitoring_resample=False,
+                 monitoring_schedule=None):
 
         self.__dict__.update(locals())
         del self.self
@@ -213,7 +239,10 @@ class BGD(TrainingAlgorithm):
                 batch_size=self.monitoring_batch_size,
                 num_batches=self.monitoring_batches,
                 obj_prereqs=obj_prereqs,
-                cost_monitoring_args=fixed_var_descr.fixed_vars)
+                cost_monitoring_args=fixed_var_descr.fixed_vars,
+                subsample=self.monitoring_subsample,
+                resample=self.monitoring_resample,
+                schedule=self.monitoring_schedule)
 
         params = model.get_params()
 
@@ -233,7 +262,10 @@ class BGD(TrainingAlgorithm):
             min_init_alpha=self.min_init_alpha,
             line_search_mode=self.line_search_mode,
             theano_function_mode=self.theano_function_mode,
-            init_alpha=self.init_alpha)
+            init_alpha=self.init_alpha,
+            lbfgs=self.lbfgs,
+            lbfgs_memory=self.lbfgs_memory,
+            reset_lbfgs=self.reset_lbfgs)
 
         # These monitoring channels keep track of shared variables,
         # which do not need inputs nor data.
@@ -327,6 +359,51 @@ class BGD(TrainingAlgorithm):
             assert rval in [True, False, 0, 1]
             return rval
 
+    def get_state(self):
+        """
+        Returns the state of BGD that is not stored in the model: the
+        state of the random number generator used to draw batches, the
+        progress of the termination criterion, the step scale and, when
+        `lbfgs` is used without `reset_lbfgs`, the L-BFGS history.
+
+        Returns
+        -------
+        state : dict
+            A picklable description of the algorithm's progress.
+        """
+        if self.termination_criterion is None:
+            termination_state = None
+        else:
+            termination_state = self.termination_criterion.get_state()
+        if self.lbfgs and not self.reset_lbfgs:
+            lbfgs_state = get_plain_state(self.optimizer._lbfgs_history)
+        else:
+            lbfgs_state = None
+        return {'rng': self.rng.get_state(),
+                'first': self.first,
+                'scale_step': self.scale_step,
+                'termination_criterion': termination_state,
+                'lbfgs_history': lbfgs_state}
+
+    def set_state(self, state):
+        """
+        Restores the state returned by `get_state`.
+
+        Parameters
+        ----------
+        state : dict
+            The return value of `get_state`.
+        """
+        self.rng.set_state(state['rng'])
+        self.first = state['first']
+        self.scale_step = state['scale_step']
+        if state['termination_criterion'] is not None:
+            self.termination_criterion.set_state(
+                state['termination_criterion'])
+        if state['lbfgs_history'] is not None:
+            set_plain_state(self.optimizer._lbfgs_history,
+                            state['lbfgs_history'])
+
     def before_step(self, model):
         """
         .. todo::
@@ -350,7 +427,24 @@ class BGD(TrainingAlgorithm):
                 param.set_value(value)
 
 
-class StepShrinker(TrainExtension, TerminationCriterion):
+class _StepExtension(TrainExtension):
+    """
+    Base class of the extensions that adjust `BGD.scale_step` and report
+    it in a `scale_step` channel, which they add to the monitor when
+    their `first` flag is set.
+    """
+
+    def get_state(self):
+        """
+        Returns the progress of this extension, except for the `first`
+        flag.
+        """
+        # The scale_step channel is added to the monitor again after
+        # resuming, on the first call to on_monitor.
+        return get_plain_state(self, exclude=['first'])
+
+
+class StepShrinker(_StepExtension, TerminationCriterion):
 
     """
     .. todo::
@@ -426,7 +520,7 @@ class StepShrinker(TrainExtension, TerminationCriterion):
         return self.continue_learning
 
 
-class ScaleStep(TrainExtension):
+class ScaleStep(_StepExtension):
 
     """
     .. todo::
@@ -462,7 +556,7 @@ class ScaleStep(TrainExtension):
         self.monitor_channel.set_value(np.cast[config.floatX](cur))
 
 
-class BacktrackingStepShrinker(TrainExtension, TerminationCriterion):
+class BacktrackingStepShrinker(_StepExtension, TerminationCriterion):
 
     """
     .. todo::
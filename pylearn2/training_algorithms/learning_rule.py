@@ -5,9 +5,11 @@ algorithm.
 import numpy as np
 import warnings
 
+import theano
 from theano.compat import six
 from theano import config
 from theano import tensor as T
+from theano.tensor.subtensor import AdvancedIncSubtensor1
 
 from pylearn2.compat import OrderedDict
 from pylearn2.space import NullSpace
@@ -17,6 +19,130 @@ from pylearn2.utils import wraps
 from pylearn2.monitor import Monitor
 
 
+def row_sparse_terms(grad):
+    """
+    Recognizes gradients that are nonzero on only a few rows, such as the
+    gradient of a cost with respect to an embedding matrix `W` that is
+    only used through a lookup `W[indices]`, and returns their nonzero
+    rows.
+
+    Parameters
+    ----------
+    grad : theano variable
+        A gradient, as returned by `theano.tensor.grad`
+
+    Returns
+    -------
+    terms : tuple or None
+        None if `grad` is not recognized as row-sparse. Otherwise, a pair
+        `(indices, rows)`: `grad` is the sum of the `rows` (a matrix with
+        the same number of dimensions as `grad`), each added to the row
+        of `grad` given by the integer vector `indices`, which may
+        contain repetitions.
+    """
+    if grad.owner is None:
+        return None
+    op = grad.owner.op
+    if isinstance(op, AdvancedIncSubtensor1) and not op.set_instead_of_inc:
+        x, y, indices = grad.owner.inputs
+        if y.ndim != grad.ndim:
+            return None
+        try:
+            if T.get_scalar_constant_value(x) == 0:
+                return indices, y
+        except T.NotScalarConstantError:
+            pass
+        return None
+    # The gradient of a matrix indexed several times is a sum
+    if (isinstance(op, T.Elemwise) and
+            isinstance(op.scalar_op, T.scal.Add)):
+        terms = [row_sparse_terms(term) for term in grad.owner.inputs]
+        if any(term is None for term in terms):
+            return None
+        return (T.concatenate([indices for indices, rows in terms]),
+                T.concatenate([rows for indices, rows in terms]))
+    return None
+
+
+def row_sparse_indices(grad):
+    """
+    Recognizes gradients that are nonzero on only a few rows, such as the
+    gradient of a cost with respect to an embedding matrix `W` that is
+    only used through a lookup `W[indices]`.
+
+    Parameters
+    ----------
+    grad : theano variable
+        A gradient, as returned by `theano.tensor.grad`
+
+    Returns
+    -------
+    indices : theano variable or None
+        An integer vector containing the indices of all the rows of
+        `grad` that can be nonzero (possibly with repetitions), or None if
+        `grad` is not recognized as row-sparse.
+    """
+    terms = row_sparse_terms(grad)
+    if terms is None:
+        return None
+    return terms[0]
+
+
+def unique_row_sparse_terms(grad):
+    """
+    Like `row_sparse_terms`, but with the rows given for the same index
+    summed, so that the indices have no repetitions.
+
+    Parameters
+    ----------
+    grad : theano variable
+        A gradient, as returned by `theano.tensor.grad`
+
+    Returns
+    -------
+    terms : tuple or None
+        None if `grad` is not recognized as row-sparse. Otherwise, a pair
+        `(indices, rows)`: `indices` is a sorted integer vector without
+        repetitions, and `rows` holds the rows of `grad` at `indices`.
+    """
+    terms = row_sparse_terms(grad)
+    if terms is None:
+        return None
+    indices, rows = terms
+    order = T.argsort(indices)
+    indices = indices[order]
+    # 1 where a run of equal indices starts
+    starts = T.cast(T.neq(indices, T.roll(indices, 1)), 'int64')
+    starts = T.set_subtensor(starts[:1], 1)
+    positions = T.extra_ops.cumsum(starts) - 1
+    unique_indices = indices[starts.nonzero()[0]]
+    summed = T.alloc(T.constant(0, dtype=rows.dtype),
+                     unique_indices.shape[0],
+                     *[rows.shape[i] for i in range(1, rows.ndim)])
+    summed = T.inc_subtensor(summed[positions], rows[order])
+    return unique_indices, summed
+
+
+def _rows(var, indices):
+    """
+    Returns the rows of `var` selected by `indices`, or `var` itself if
+    `indices` is None.
+    """
+    if indices is None:
+        return var
+    return var[indices]
+
+
+def _set_rows(var, new_rows, indices):
+    """
+    Returns the value of `var` after replacing the rows selected by
+    `indices` by `new_rows`, or `new_rows` itself if `indices` is None.
+    """
+    if indices is None:
+        return new_rows
+    return T.set_subtensor(var[indices], new_rows)
+
+
 class LearningRule():
     """
     A pylearn2 learning rule is an object which computes new parameter values
@@ -24,6 +150,31 @@ class LearningRule():
     estimated gradient.
     """
 
+    def _get_sparse_terms(self, grad):
+        """
+        Returns the indices of the rows to update for a parameter with
+        gradient `grad`, and the gradient of these rows. The indices are
+        None if all of the parameter must be updated, the gradient being
+        then `grad` itself.
+
+        Only rules constructed with `sparse_updates=True` restrict their
+        updates to rows. The indices have no repetitions, the gradients
+        of a row looked up several times being summed (see
+        `unique_row_sparse_terms`), so that each row is read and written
+        once, and the dense gradient is never built.
+
+        Parameters
+        ----------
+        grad : theano variable
+            The gradient of the parameter
+        """
+        # getattr for learning rules pickled before sparse_updates existed
+        if getattr(self, 'sparse_updates', False):
+            terms = unique_row_sparse_terms(grad)
+            if terms is not None:
+                return terms
+        return None, grad
+
     def add_channels_to_monitor(self, monitor, monitoring_dataset):
         """
         Method called by the training algorithm, which allows LearningRules to
@@ -79,7 +230,164 @@ class LearningRule():
                                   "get_updates.")
 
 
-class Momentum(LearningRule):
+class ElementwiseLearningRule(LearningRule):
+    """
+    Base class for learning rules that update each parameter elementwise,
+    from its gradient and from accumulators of the same shape as the
+    parameter (e.g. a velocity or moving averages of the gradient).
+
+    Subclasses list the names of their accumulators in
+    `accumulator_names` and implement `_step`. The accumulators are
+    initialized to zero.
+
+    Parameters
+    ----------
+    fused : bool, optional
+        If True, each accumulator is stored for all the parameters in a
+        single flat shared variable, and the updates of all the parameters
+        are computed by a single elementwise graph on the concatenation
+        of the flattened gradients. This makes the graph, and the
+        overhead of each update, much smaller for models with many
+        parameter tensors. All the parameters must have the same dtype.
+    sparse_updates : bool, optional
+        If True, parameters with row-sparse gradients (e.g. embedding
+        matrices, see `row_sparse_indices`) only have the rows in the
+        gradient and the corresponding rows of their accumulators
+        updated. The accumulators of the other rows are then left
+        unchanged. Not supported together with `fused`.
+    """
+
+    accumulator_names = ()
+
+    def __init__(self, fused=False, sparse_updates=False):
+        if fused and sparse_updates:
+            raise ValueError("fused and sparse_updates can not be used "
+                             "together.")
+        self.fused = fused
+        self.sparse_updates = sparse_updates
+
+    def _step(self, grad, accumulators, scaled_lr):
+        """
+        Symbolic description of the update of a parameter.
+
+        Parameters
+        ----------
+        grad : theano variable
+            The gradient of the parameter
+        accumulators : list
+            The current values of the accumulators of the parameter, in
+            the order of `accumulator_names`
+        scaled_lr : theano variable
+            The learning rate of the parameter, multiplied by its learning
+            rate scaler. When `fused` is True, this is a vector holding
+            the learning rate of each element.
+
+        Returns
+        -------
+        increment : theano variable
+            The value to add to the parameter
+        new_accumulators : list
+            The new values of the accumulators
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "_step.")
+
+    def get_updates(self, learning_rate, grads, lr_scalers=None):
+        """
+        Provides the symbolic (theano) description of the updates needed to
+        perform this learning rule.
+
+        Parameters
+        ----------
+        learning_rate : float
+            Learning rate coefficient.
+        grads : dict
+            A dictionary mapping from the model's parameters to their
+            gradients.
+        lr_scalers : dict
+            A dictionary mapping from the model's parameters to a learning
+            rate multiplier.
+
+        Returns
+        -------
+        updates : OrderdDict
+            A dictionary mapping from the old model parameters and the
+            accumulators, to their new values after a single iteration of
+            the learning rule.
+        """
+        if lr_scalers is None:
+            lr_scalers = {}
+        # getattr for learning rules pickled before fused existed
+        if getattr(self, 'fused', False):
+            return self._get_fused_updates(learning_rate, grads, lr_scalers)
+
+        updates = OrderedDict()
+        for (param, grad) in six.iteritems(grads):
+            assert grad.dtype == param.dtype
+            accumulators = []
+            for name in self.accumulator_names:
+                accumulator = sharedX(np.zeros_like(param.get_value()))
+                assert param.dtype == accumulator.dtype
+                if param.name is not None:
+                    accumulator.name = name + '_' + param.name
+                accumulators.append(accumulator)
+
+            indices, grad = self._get_sparse_terms(grad)
+            scaled_lr = learning_rate * lr_scalers.get(param, 1.)
+            increment, new_accumulators = self._step(
+                grad,
+                [_rows(acc, indices) for acc in accumulators],
+                scaled_lr)
+
+            for accumulator, new_accumulator in zip(accumulators,
+                                                    new_accumulators):
+                updates[accumulator] = _set_rows(accumulator,
+                                                 new_accumulator, indices)
+            assert increment.dtype == param.dtype
+            updates[param] = _set_rows(param,
+                                       _rows(param, indices) + increment,
+                                       indices)
+
+        return updates
+
+    def _get_fused_updates(self, learning_rate, grads, lr_scalers):
+        """
+        Implementation of `get_updates` when `fused` is True.
+        """
+        params = list(grads.keys())
+        dtypes = set(param.dtype for param in params)
+        if len(dtypes) != 1:
+            raise ValueError("fused learning rules need all the parameters "
+                             "to have the same dtype, got " + str(dtypes))
+        dtype, = dtypes
+        shapes = [param.get_value(borrow=True).shape for param in params]
+        sizes = [int(np.prod(shape)) for shape in shapes]
+
+        # The dtype of the parameters, which need not be floatX
+        accumulators = [theano.shared(np.zeros(sum(sizes), dtype=dtype),
+                                      'fused_' + name)
+                        for name in self.accumulator_names]
+        flat_grad = T.concatenate([grads[param].flatten()
+                                   for param in params])
+        scales = T.concatenate([T.alloc(T.cast(lr_scalers.get(param, 1.),
+                                               dtype), size)
+                                for param, size in zip(params, sizes)])
+        increment, new_accumulators = self._step(flat_grad, accumulators,
+                                                 learning_rate * scales)
+
+        updates = OrderedDict((accumulator, T.cast(new_accumulator, dtype))
+                              for accumulator, new_accumulator
+                              in zip(accumulators, new_accumulators))
+        offset = 0
+        for param, shape, size in zip(params, shapes, sizes):
+            param_increment = increment[offset:offset + size].reshape(shape)
+            updates[param] = param + T.cast(param_increment, dtype)
+            offset += size
+
+        return updates
+
+
+class Momentum(ElementwiseLearningRule):
     """
     Implements momentum as described in Section 9 of
     "A Practical Guide to Training Restricted Boltzmann Machines",
@@ -98,12 +406,24 @@ class Momentum(LearningRule):
     nesterov_momentum: bool
         Use the accelerated momentum technique described in:
         "Advances in Optimizing Recurrent Networks", Yoshua Bengio, et al.
-
+    fused : bool, optional
+        Store the velocities of all the parameters in a single flat
+        shared variable. See `ElementwiseLearningRule`.
+    sparse_updates : bool, optional
+        If True, parameters with row-sparse gradients (e.g. embedding
+        matrices, see `row_sparse_indices`) only have the rows in the
+        gradient and the corresponding rows of their velocity updated.
+        The velocity of the other rows is then not decayed, and they do
+        not move.
     """
 
-    def __init__(self, init_momentum, nesterov_momentum=False):
+    accumulator_names = ('vel',)
+
+    def __init__(self, init_momentum, nesterov_momentum=False, fused=False,
+                 sparse_updates=False):
         assert init_momentum >= 0.
         assert init_momentum < 1.
+        ElementwiseLearningRule.__init__(self, fused, sparse_updates)
         self.momentum = sharedX(init_momentum, 'momentum')
         self.nesterov_momentum = nesterov_momentum
 
@@ -126,42 +446,16 @@ class Momentum(LearningRule):
             data_specs=(NullSpace(), ''),
             dataset=monitoring_dataset)
 
-    def get_updates(self, learning_rate, grads, lr_scalers=None):
-        """
-        Provides the updates for learning with gradient descent + momentum.
+    @wraps(ElementwiseLearningRule._step)
+    def _step(self, grad, accumulators, scaled_lr):
+        vel, = accumulators
+        new_vel = self.momentum * vel - scaled_lr * grad
 
-        Parameters
-        ----------
-        learning_rate : float
-            Learning rate coefficient.
-        grads : dict
-            A dictionary mapping from the model's parameters to their
-            gradients.
-        lr_scalers : dict
-            A dictionary mapping from the model's parameters to a learning
-            rate multiplier.
-        """
-
-        updates = OrderedDict()
-
-        for (param, grad) in six.iteritems(grads):
-            vel = sharedX(param.get_value() * 0.)
-            assert param.dtype == vel.dtype
-            assert grad.dtype == param.dtype
-            if param.name is not None:
-                vel.name = 'vel_' + param.name
-
-            scaled_lr = learning_rate * lr_scalers.get(param, 1.)
-            updates[vel] = self.momentum * vel - scaled_lr * grad
+        inc = new_vel
+        if self.nesterov_momentum:
+            inc = self.momentum * inc - scaled_lr * grad
 
-            inc = updates[vel]
-            if self.nesterov_momentum:
-                inc = self.momentum * inc - scaled_lr * grad
-
-            assert inc.dtype == vel.dtype
-            updates[param] = param + inc
-
-        return updates
+        return inc, [new_vel]
 
 
 class MomentumAdjustor(TrainExtension):
@@ -265,12 +559,18 @@ class AdaDelta(LearningRule):
     decay : float, optional
         Decay rate :math:`\\rho` in Algorithm 1 of the aforementioned
         paper.
+    sparse_updates : bool, optional
+        If True, parameters with row-sparse gradients (e.g. embedding
+        matrices, see `row_sparse_indices`) only have the rows in the
+        gradient and the corresponding rows of their accumulators updated.
+        The accumulators of the other rows are then not decayed.
     """
 
-    def __init__(self, decay=0.95):
+    def __init__(self, decay=0.95, sparse_updates=False):
         assert decay >= 0.
         assert decay < 1.
         self.decay = decay
+        self.sparse_updates = sparse_updates
 
     def get_updates(self, learning_rate, grads, lr_scalers=None):
         """
@@ -299,28 +599,35 @@ class AdaDelta(LearningRule):
                 mean_square_grad.name = 'mean_square_grad_' + param.name
                 mean_square_dx.name = 'mean_square_dx_' + param.name
 
+            indices, grad = self._get_sparse_terms(grads[param])
+
             # Accumulate gradient
             new_mean_squared_grad = (
-                self.decay * mean_square_grad +
-                (1 - self.decay) * T.sqr(grads[param])
+                self.decay * _rows(mean_square_grad, indices) +
+                (1 - self.decay) * T.sqr(grad)
             )
 
             # Compute update
             epsilon = lr_scalers.get(param, 1.) * learning_rate
-            rms_dx_tm1 = T.sqrt(mean_square_dx + epsilon)
+            rms_dx_tm1 = T.sqrt(_rows(mean_square_dx, indices) + epsilon)
             rms_grad_t = T.sqrt(new_mean_squared_grad + epsilon)
-            delta_x_t = - rms_dx_tm1 / rms_grad_t * grads[param]
+            delta_x_t = - rms_dx_tm1 / rms_grad_t * grad
 
             # Accumulate updates
             new_mean_square_dx = (
-                self.decay * mean_square_dx +
+                self.decay * _rows(mean_square_dx, indices) +
                 (1 - self.decay) * T.sqr(delta_x_t)
             )
 
             # Apply update
-            updates[mean_square_grad] = new_mean_squared_grad
-            updates[mean_square_dx] = new_mean_square_dx
-            updates[param] = param + delta_x_t
+            updates[mean_square_grad] = _set_rows(mean_square_grad,
+                                                  new_mean_squared_grad,
+                                                  indices)
+            updates[mean_square_dx] = _set_rows(mean_square_dx,
+                                                new_mean_square_dx, indices)
+            updates[param] = _set_rows(param,
+                                       _rows(param, indices) + delta_x_t,
+                                       indices)
 
         return updates
 
@@ -330,8 +637,21 @@ class AdaGrad(LearningRule):
     Implements the AdaGrad learning rule as described in:
     "Adaptive subgradient methods for online learning and
     stochastic optimization", Duchi J, Hazan E, Singer Y.
+
+    Parameters
+    ----------
+    sparse_updates : bool, optional
+        If True, parameters with row-sparse gradients (e.g. embedding
+        matrices, see `row_sparse_indices`) only have the rows in the
+        gradient and the corresponding rows of their accumulator updated.
+        This gives the same result as the dense updates, except that rows
+        whose gradient has always been zero stay unchanged rather than
+        becoming NaN.
     """
 
+    def __init__(self, sparse_updates=False):
+        self.sparse_updates = sparse_updates
+
     def get_updates(self, learning_rate, grads, lr_scalers=None):
         """
         Compute the AdaGrad updates
@@ -356,19 +676,25 @@ class AdaGrad(LearningRule):
             if param.name is not None:
                 sum_square_grad.name = 'sum_square_grad_' + param.name
 
+            indices, grad = self._get_sparse_terms(grads[param])
+
             # Accumulate gradient
             new_sum_squared_grad = (
-                sum_square_grad + T.sqr(grads[param])
+                _rows(sum_square_grad, indices) + T.sqr(grad)
             )
 
             # Compute update
             epsilon = lr_scalers.get(param, 1.) * learning_rate
             delta_x_t = (- epsilon / T.sqrt(new_sum_squared_grad)
-                         * grads[param])
+                         * grad)
 
             # Apply update
-            updates[sum_square_grad] = new_sum_squared_grad
-            updates[param] = param + delta_x_t
+            updates[sum_square_grad] = _set_rows(sum_square_grad,
+                                                 new_sum_squared_grad,
+                                                 indices)
+            updates[param] = _set_rows(param,
+                                       _rows(param, indices) + delta_x_t,
+                                       indices)
 
         return updates
 
@@ -395,6 +721,11 @@ class RMSProp(LearningRule):
     max_scaling: float, optional
         Restrict the RMSProp gradient scaling coefficient to values
         below `max_scaling`.
+    sparse_updates : bool, optional
+        If True, parameters with row-sparse gradients (e.g. embedding
+        matrices, see `row_sparse_indices`) only have the rows in the
+        gradient and the corresponding rows of their accumulator updated.
+        The accumulator of the other rows is then not decayed.
 
     Notes
     -----
@@ -404,12 +735,13 @@ class RMSProp(LearningRule):
     channels correctly report the moving averages.
     """
 
-    def __init__(self, decay=0.9, max_scaling=1e5):
+    def __init__(self, decay=0.9, max_scaling=1e5, sparse_updates=False):
         assert 0. <= decay < 1.
         assert max_scaling > 0
         self.decay = sharedX(decay, 'decay')
         self.epsilon = 1. / max_scaling
         self.mean_square_grads = OrderedDict()
+        self.sparse_updates = sparse_updates
 
     @wraps(LearningRule.add_channels_to_monitor)
     def add_channels_to_monitor(self, monitor, monitoring_dataset):
@@ -483,18 +815,166 @@ class RMSProp(LearningRule):
             # Store variable in self.mean_square_grads for monitoring.
             self.mean_square_grads[param.name] = mean_square_grad
 
+            indices, grad = self._get_sparse_terms(grads[param])
+
             # Accumulate gradient
-            new_mean_squared_grad = (self.decay * mean_square_grad +
-                                     (1 - self.decay) * T.sqr(grads[param]))
+            new_mean_squared_grad = (
+                self.decay * _rows(mean_square_grad, indices) +
+                (1 - self.decay) * T.sqr(grad))
 
             # Compute update
             scaled_lr = lr_scalers.get(param, 1.) * learning_rate
             rms_grad_t = T.sqrt(new_mean_squared_grad)
             rms_grad_t = T.maximum(rms_grad_t, self.epsilon)
-            delta_x_t = - scaled_lr * grads[param] / rms_grad_t
+            delta_x_t = - scaled_lr * grad / rms_grad_t
 
             # Apply update
-            updates[mean_square_grad] = new_mean_squared_grad
-            updates[param] = param + delta_x_t
+            updates[mean_square_grad] = _set_rows(mean_square_grad,
+                                                  new_mean_squared_grad,
+                                                  indices)
+            updates[param] = _set_rows(param,
+                                       _rows(param, indices) + delta_x_t,
+                                       indices)
+
+        return updates
+
+
+class Adam(ElementwiseLearningRule):
+    """
+    Implements the Adam learning rule as described in:
+    "Adam: A Method for Stochastic Optimization", Diederik P. Kingma,
+    Jimmy Ba.
+
+    Parameters are updated by the formula:
+    m := beta1 * m + (1 - beta1) * d cost / d param
+    v := beta2 * v + (1 - beta2) * (d cost / d param) ** 2
+    param := param - learning_rate * sqrt(1 - beta2 ** t) /
+             (1 - beta1 ** t) * m / (sqrt(v) + epsilon)
+
+    where t is the number of updates done so far, including this one.
+
+    Parameters
+    ----------
+    beta1 : float, optional
+        Decay rate of the moving average of the gradient.
+    beta2 : float, optional
+        Decay rate of the moving average of the squared gradient.
+    epsilon : float, optional
+        Constant added to the denominator for numerical stability.
+    fused : bool, optional
+        Store the moving averages of all the parameters in single flat
+        shared variables. See `ElementwiseLearningRule`.
+    sparse_updates : bool, optional
+        Only update the rows of the parameters that are in their
+        gradients, if it is row-sparse. See `ElementwiseLearningRule`.
+
+    Notes
+    -----
+    The number of updates is a shared variable of the learning rule, so
+    an instance of this LearningRule should only be used with one
+    TrainingAlgorithm.
+    """
+
+    accumulator_names = ('mean_grad', 'mean_square_grad')
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8, fused=False,
+                 sparse_updates=False):
+        assert 0. <= beta1 < 1.
+        assert 0. <= beta2 < 1.
+        assert epsilon > 0.
+        ElementwiseLearningRule.__init__(self, fused, sparse_updates)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.num_updates = sharedX(0., 'adam_num_updates')
+
+    @wraps(ElementwiseLearningRule._step)
+    def _step(self, grad, accumulators, scaled_lr):
+        mean_grad, mean_square_grad = accumulators
+        new_mean_grad = self.beta1 * mean_grad + (1. - self.beta1) * grad
+        new_mean_square_grad = (self.beta2 * mean_square_grad +
+                                (1. - self.beta2) * T.sqr(grad))
+
+        t = self.num_updates + 1.
+        correction = (T.sqrt(1. - self.beta2 ** t) /
+                      (1. - self.beta1 ** t))
+        inc = (- scaled_lr * correction * new_mean_grad /
+               (T.sqrt(new_mean_square_grad) + self.epsilon))
+
+        return inc, [new_mean_grad, new_mean_square_grad]
+
+    @wraps(ElementwiseLearningRule.get_updates)
+    def get_updates(self, learning_rate, grads, lr_scalers=None):
+        updates = ElementwiseLearningRule.get_updates(self, learning_rate,
+                                                      grads, lr_scalers)
+        updates[self.num_updates] = self.num_updates + 1.
+        return updates
 
+
+class Adamax(ElementwiseLearningRule):
+    """
+    Implements the Adamax learning rule, the variant of Adam based on the
+    infinity norm described in Section 7 of:
+    "Adam: A Method for Stochastic Optimization", Diederik P. Kingma,
+    Jimmy Ba.
+
+    Parameters are updated by the formula:
+    m := beta1 * m + (1 - beta1) * d cost / d param
+    u := max(beta2 * u, abs(d cost / d param))
+    param := param - learning_rate / (1 - beta1 ** t) * m / (u + epsilon)
+
+    where t is the number of updates done so far, including this one.
+
+    Parameters
+    ----------
+    beta1 : float, optional
+        Decay rate of the moving average of the gradient.
+    beta2 : float, optional
+        Decay rate of the infinity norm of the gradients.
+    epsilon : float, optional
+        Constant added to the denominator for numerical stability.
+    fused : bool, optional
+        Store the accumulators of all the parameters in single flat
+        shared variables. See `ElementwiseLearningRule`.
+    sparse_updates : bool, optional
+        Only update the rows of the parameters that are in their
+        gradients, if it is row-sparse. See `ElementwiseLearningRule`.
+
+    Notes
+    -----
+    The number of updates is a shared variable of the learning rule, so
+    an instance of this LearningRule should only be used with one
+    TrainingAlgorithm.
+    """
+
+    accumulator_names = ('mean_grad', 'max_abs_grad')
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8, fused=False,
+                 sparse_updates=False):
+        assert 0. <= beta1 < 1.
+        assert 0. <= beta2 < 1.
+        assert epsilon > 0.
+        ElementwiseLearningRule.__init__(self, fused, sparse_updates)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.num_updates = sharedX(0., 'adamax_num_updates')
+
+    @wraps(ElementwiseLearningRule._step)
+    def _step(self, grad, accumulators, scaled_lr):
+        mean_grad, max_abs_grad = accumulators
+        new_mean_grad = self.beta1 * mean_grad + (1. - self.beta1) * grad
+        new_max_abs_grad = T.maximum(self.beta2 * max_abs_grad, abs(grad))
+
+        t = self.num_updates + 1.
+        inc = (- scaled_lr / (1. - self.beta1 ** t) * new_mean_grad /
+               (new_max_abs_grad + self.epsilon))
+
+        return inc, [new_mean_grad, new_max_abs_grad]
+
+    @wraps(ElementwiseLearningRule.get_updates)
+    def get_updates(self, learning_rate, grads, lr_scalers=None):
+        updates = ElementwiseLearningRule.get_updates(self, learning_rate,
+                                                      grads, lr_scalers)
+        updates[self.num_updates] = self.num_updates + 1.
         return updates
@@ -0,0 +1,514 @@
+"""
+Multi-process training on a single machine.
+
+The functionality in this module relies on the worker processes being
+forked from the training process, so that they inherit the compiled
+Theano functions, the model and the dataset without any serialization.
+It is therefore only available on platforms supporting `os.fork`, and
+only for models whose shared variables live in host memory.
+"""
+from __future__ import division
+
+import ctypes
+import itertools
+import multiprocessing
+import traceback
+
+import numpy as np
+from theano.compat.six.moves import queue, xrange
+from theano.sandbox.rng_mrg import MRG_RandomStreams, mrg_uniform_base
+from theano.tensor import TensorType
+
+from pylearn2.utils.rng import make_np_rng
+
+
+def shared_memory_array(shape, dtype):
+    """
+    Allocates a zero-filled array in memory that is shared with the
+    processes forked after the allocation.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the array
+    dtype : str or numpy dtype
+        The dtype of the array
+
+    Returns
+    -------
+    array : numpy.ndarray
+        A view of the shared memory
+    """
+    dtype = np.dtype(dtype)
+    num_bytes = int(np.prod(shape)) * dtype.itemsize
+    raw = multiprocessing.RawArray(ctypes.c_char, max(num_bytes, 1))
+    array = np.frombuffer(raw, dtype=np.uint8)[:num_bytes]
+    return array.view(dtype).reshape(shape)
+
+
+class SharedValues(object):
+    """
+    Several copies of the values of a list of shared variables, stored in
+    shared memory.
+
+    Parameters
+    ----------
+    variables : list
+        Theano shared variables with numpy values
+    num_copies : int
+        Number of copies of each value to allocate
+    """
+
+    def __init__(self, variables, num_copies):
+        self.variables = list(variables)
+        self.arrays = []
+        for var in self.variables:
+            value = np.asarray(var.get_value(borrow=True))
+            self.arrays.append(shared_memory_array((num_copies,) +
+                                                   value.shape,
+                                                   value.dtype))
+
+    def store(self, copy):
+        """
+        Copies the current values of the variables into shared memory.
+
+        Parameters
+        ----------
+        copy : int
+            Index of the copy to write
+        """
+        for var, array in zip(self.variables, self.arrays):
+            array[copy] = var.get_value(borrow=True)
+
+    def load(self, copy):
+        """
+        Sets the values of the variables from shared memory.
+
+        Parameters
+        ----------
+        copy : int
+            Index of the copy to read
+        """
+        for var, array in zip(self.variables, self.arrays):
+            var.set_value(array[copy, ...].copy(), borrow=True)
+
+    def bind(self, copy):
+        """
+        Makes the variables use the shared memory itself as their value,
+        so that changes made to it by other processes are seen by the
+        variables, and vice versa.
+
+        Parameters
+        ----------
+        copy : int
+            Index of the copy to use
+        """
+        for var, array in zip(self.variables, self.arrays):
+            var.set_value(array[copy, ...], borrow=True)
+
+
+def _random_states(function):
+    """
+    Returns the shared variables holding the states of the MRG random
+    streams (e.g. the dropout masks) that `function` updates.
+    """
+    return [i.variable for i in function.maker.expanded_inputs
+            if i.update is not None and i.update.owner is not None and
+            isinstance(i.update.owner.op, mrg_uniform_base)]
+
+
+def _worker_seeds(algorithm, states):
+    """
+    Draws from `algorithm.rng` the seeds of the random streams of the
+    workers, so that they draw different numbers. The first worker keeps
+    the streams of this process, its seed is None. Nothing is drawn if
+    there are no `states` to seed.
+    """
+    num_workers = algorithm.num_workers
+    if len(states) == 0:
+        return [None] * num_workers
+    return [None] + list(algorithm.rng.randint(1, 2 ** 30,
+                                               size=num_workers - 1))
+
+
+def _reseed(states, seed):
+    """
+    Gives new streams, drawn from `seed`, to the MRG random `states`.
+    """
+    if seed is None:
+        return
+    streams = MRG_RandomStreams(int(seed))
+    for var in states:
+        value = var.get_value(borrow=True)
+        rstates = streams.get_substream_rstates(value.size // 6)
+        var.set_value(rstates.reshape(value.shape).astype(value.dtype),
+                      borrow=True)
+
+
+def _worker_loop(algorithm, iterator, space, worker, num_workers, averaged,
+                 others, broadcast, results, resume, stop, states, seed):
+    """
+    Main loop of a data-parallel worker process.
+
+    Alternates between running `algorithm.sync_freq` SGD updates on the
+    batches of its shard, and synchronizing its values with the ones
+    averaged by the coordinator. See `train_data_parallel`.
+    """
+    try:
+        _reseed(states, seed)
+        batches = iter(iterator)
+        on_load_batch = algorithm.on_load_batch
+        while True:
+            batch_sizes = []
+            for batch in itertools.islice(batches, algorithm.sync_freq):
+                for callback in on_load_batch:
+                    callback(*batch)
+                algorithm.sgd_update(*batch)
+                batch_sizes.append(space.np_batch_size(batch))
+            averaged.store(worker)
+            if worker == 0:
+                others.store(0)
+            results.put((worker, batch_sizes, None))
+            resume[worker].acquire()
+            if stop.value:
+                break
+            averaged.load(num_workers)
+            broadcast.load(0)
+    except Exception:
+        results.put((worker, None, traceback.format_exc()))
+
+
+def _get_result(results, workers):
+    """
+    Waits for the next message of a worker, making sure the workers are
+    still alive.
+    """
+    while True:
+        try:
+            return results.get(timeout=1.)
+        except queue.Empty:
+            dead = [p for p in workers if p.exitcode not in (None, 0)]
+            if len(dead) > 0:
+                raise RuntimeError("Data-parallel worker %s died with exit "
+                                   "code %d" % (dead[0].name,
+                                                dead[0].exitcode))
+
+
+def _shard_iterators(dataset, iterator_kwargs, rng, num_shards):
+    """
+    Returns `num_shards` iterators over disjoint shards of the batches of
+    one epoch. Batch `i` goes to shard `i % num_shards`.
+    """
+    seed = None
+    if rng is not None:
+        seed = rng.randint(2 ** 30)
+    iterators = []
+    for shard in xrange(num_shards):
+        shard_rng = None
+        if seed is not None:
+            shard_rng = make_np_rng(seed, which_method=["randn", "randint"])
+        iterator = dataset.iterator(rng=shard_rng, **iterator_kwargs)
+        if hasattr(iterator, 'shard'):
+            iterator.shard(shard, num_shards)
+        else:
+            iterator = itertools.islice(iterator, shard, None, num_shards)
+        iterators.append(iterator)
+    return iterators
+
+
+def train_data_parallel(algorithm, dataset, iterator_kwargs, rng):
+    """
+    Runs one epoch of data-parallel SGD training.
+
+    `algorithm.num_workers` processes are forked. Each of them iterates
+    over its own disjoint shard of the batches of the epoch (batch
+    `i` goes to worker `i % num_workers`) and calls `sgd_update` on them.
+    Every `algorithm.sync_freq` batches, all the shared variables updated
+    by `sgd_update` (the model parameters, but also e.g. learning rule
+    accumulators) are averaged across the workers, weighted by the number
+    of examples each worker has just learned on. The averaging is done by
+    this process through shared-memory buffers, which is also where the
+    batches are reported to the monitor and where the update callbacks
+    are run. The learning rate they set is sent back to the workers.
+
+    Variables updated by `sgd_update` that are not floating point (such
+    as the state of random number generators) are not averaged, the
+    values of the first worker are kept. The other workers draw new
+    streams for the MRG random number generators from `algorithm.rng`
+    every epoch, so that e.g. their dropout masks differ. Variables that
+    are not tensors are only updated in the workers. The accumulators of
+    the running channels count the examples and sum the values of the
+    batches, so they are not averaged either: the increments made by all
+    the workers since the last synchronization are summed.
+
+    Parameters
+    ----------
+    algorithm : pylearn2.training_algorithms.sgd.SGD
+        The training algorithm, already set up
+    dataset : Dataset
+        The training dataset
+    iterator_kwargs : dict
+        Keyword arguments for `dataset.iterator`, except for `rng`
+    rng : numpy.random.RandomState or None
+        The random number generator used to draw the seed of the
+        iterators of the workers, so that they all iterate over the
+        batches in the same order. None if the iteration mode is not
+        stochastic.
+    """
+    num_workers = algorithm.num_workers
+    space = iterator_kwargs['data_specs'][0]
+    # Variables that are not tensors (e.g. the RandomStates of
+    # theano.tensor.shared_randomstreams) can not be put in shared memory
+    variables = [var for var in algorithm._updated_variables
+                 if isinstance(var.type, TensorType)]
+    float_variables = [var for var in variables
+                       if str(var.dtype).startswith('float')]
+    other_variables = [var for var in variables
+                       if var not in float_variables]
+    accumulators = set(algorithm._running_accumulators)
+    summed = [var in accumulators for var in float_variables]
+    averaged = SharedValues(float_variables, num_workers + 1)
+    averaged.store(num_workers)
+    others = SharedValues(other_variables, 1)
+    broadcast = SharedValues([algorithm.learning_rate], 1)
+    results = multiprocessing.Queue()
+    resume = [multiprocessing.Semaphore(0) for i in xrange(num_workers)]
+    stop = multiprocessing.RawValue(ctypes.c_bool, False)
+
+    states = _random_states(algorithm.sgd_update)
+    seeds = _worker_seeds(algorithm, states)
+
+    workers = []
+    iterators = _shard_iterators(dataset, iterator_kwargs, rng, num_workers)
+    for worker, iterator in enumerate(iterators):
+        process = multiprocessing.Process(
+            target=_worker_loop,
+            name='sgd_worker_%d' % worker,
+            args=(algorithm, iterator, space, worker, num_workers, averaged,
+                  others, broadcast, results, resume, stop, states,
+                  seeds[worker]))
+        process.daemon = True
+        workers.append(process)
+
+    for process in workers:
+        process.start()
+    try:
+        while True:
+            batch_sizes = [None] * num_workers
+            for i in xrange(num_workers):
+                worker, sizes, error = _get_result(results, workers)
+                if error is not None:
+                    raise RuntimeError("Data-parallel worker %d failed:\n%s"
+                                       % (worker, error))
+                batch_sizes[worker] = sizes
+            if all(len(sizes) == 0 for sizes in batch_sizes):
+                break
+            weights = np.array([sum(sizes) for sizes in batch_sizes],
+                               dtype='float64')
+            if weights.sum() == 0:
+                # The batches have no examples (e.g. NullSpace data), so
+                # only count them
+                weights = np.array([len(sizes) for sizes in batch_sizes],
+                                   dtype='float64')
+            weights /= weights.sum()
+            for array, is_summed in zip(averaged.arrays, summed):
+                flat = array.reshape((num_workers + 1,
+                                      int(np.prod(array.shape[1:]))))
+                if is_summed:
+                    # The workers started from the last combined value
+                    flat[num_workers] += (flat[:num_workers] -
+                                          flat[num_workers]).sum(axis=0)
+                else:
+                    flat[num_workers] = np.dot(weights,
+                                               flat[:num_workers])
+            for sizes in batch_sizes:
+                for size in sizes:
+                    algorithm.monitor.report_batch(size)
+                    for callback in algorithm.update_callbacks:
+                        callback(algorithm)
+            broadcast.store(0)
+            for semaphore in resume:
+                semaphore.release()
+        stop.value = True
+        for semaphore in resume:
+            semaphore.release()
+        for process in workers:
+            process.join()
+    except:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        raise
+    averaged.load(num_workers)
+    others.load(0)
+
+
+def _add_increment(array, increment, rows=None, sum_repeated=True):
+    """
+    Adds `increment` to `array` in place, without any locking.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        The array to increment
+    increment : numpy.ndarray
+        The increment of `array`, or of its `rows` if they are given
+    rows : numpy.ndarray, optional
+        The indices of the rows (slices along the first axis) of `array`
+        that `increment` holds the increments of. Only these rows are
+        written to, so that updates of e.g. word embeddings only touch
+        the rows of the words seen.
+    sum_repeated : bool, optional
+        Whether the increments of a row given several times in `rows` are
+        summed. Otherwise, they are all the same and added once.
+    """
+    if rows is None:
+        array += increment
+        return
+    if len(rows) == 0:
+        return
+    order = np.argsort(rows, kind='mergesort')
+    rows = rows[order]
+    increment = increment[order]
+    starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+    if sum_repeated:
+        increment = np.add.reduceat(increment, starts, axis=0)
+    else:
+        increment = increment[starts]
+    array[rows[starts]] += increment
+
+
+def _async_worker_loop(algorithm, iterator, space, worker, values,
+                       others, results, states, seed):
+    """
+    Main loop of an asynchronous worker process.
+
+    See `train_asynchronous`.
+    """
+    try:
+        _reseed(states, seed)
+        on_load_batch = algorithm.on_load_batch
+        arrays = [array[0, ...] for array in values.arrays]
+        layout = algorithm._async_layout
+        for batch in iterator:
+            for callback in on_load_batch:
+                callback(*batch)
+            outputs = iter(algorithm.sgd_async_update(*batch))
+            for array, kind in zip(arrays, layout):
+                if kind == 'dense':
+                    _add_increment(array, next(outputs))
+                else:
+                    rows = next(outputs)
+                    _add_increment(array, next(outputs), rows,
+                                   sum_repeated=kind == 'sum')
+            results.put((worker, space.np_batch_size(batch), None))
+        if worker == 0:
+            others.store(0)
+        results.put((worker, None, None))
+    except Exception:
+        results.put((worker, None, traceback.format_exc()))
+
+
+def train_asynchronous(algorithm, dataset, iterator_kwargs, rng):
+    """
+    Runs one epoch of asynchronous, lock-free ("Hogwild") SGD training.
+
+    The floating point shared variables updated by `sgd_update` (the
+    model parameters, but also e.g. learning rule accumulators) and the
+    learning rate are moved to shared memory, and `algorithm.num_workers`
+    processes are forked. Each of them iterates over its own disjoint
+    shard of the batches of the epoch (batch `i` goes to worker
+    `i % num_workers`), and for every batch computes the increments of
+    these variables with `algorithm.sgd_async_update` from their current
+    values, and adds them to the shared memory without any locking.
+    When the update of a variable only changes a few rows, as for word
+    embeddings trained by plain SGD or by a learning rule with
+    `sparse_updates=True`, only the increments of these rows are computed
+    and written to, so that workers rarely interfere and the cost of a
+    batch does not grow with the size of the variable.
+
+    This process acts as the coordinator: it reports the batches to the
+    monitor as the workers process them and runs the update callbacks.
+    The learning rate they set is seen by the workers from their next
+    batch on.
+
+    Variables updated by `sgd_update` that are not floating point (such
+    as the state of random number generators) are updated by each worker
+    independently, and the values of the first worker are kept at the
+    end of the epoch. The other workers draw new streams for the MRG
+    random number generators from `algorithm.rng` every epoch, so that
+    e.g. their dropout masks differ.
+
+    Parameters
+    ----------
+    algorithm : pylearn2.training_algorithms.sgd.SGD
+        The training algorithm, already set up
+    dataset : Dataset
+        The training dataset
+    iterator_kwargs : dict
+        Keyword arguments for `dataset.iterator`, except for `rng`
+    rng : numpy.random.RandomState or None
+        The random number generator used to draw the seed of the
+        iterators of the workers, so that they all iterate over the
+        batches in the same order. None if the iteration mode is not
+        stochastic.
+    """
+    num_workers = algorithm.num_workers
+    space = iterator_kwargs['data_specs'][0]
+    values = SharedValues(algorithm._async_variables, 1)
+    values.store(0)
+    learning_rate = SharedValues([algorithm.learning_rate], 1)
+    learning_rate.store(0)
+    others = SharedValues([i.variable for i
+                           in algorithm.sgd_async_update.maker.expanded_inputs
+                           if i.update is not None and
+                           isinstance(i.variable.type, TensorType)], 1)
+    results = multiprocessing.Queue()
+    states = _random_states(algorithm.sgd_async_update)
+    seeds = _worker_seeds(algorithm, states)
+
+    workers = []
+    iterators = _shard_iterators(dataset, iterator_kwargs, rng, num_workers)
+    for worker, iterator in enumerate(iterators):
+        process = multiprocessing.Process(
+            target=_async_worker_loop,
+            name='sgd_async_worker_%d' % worker,
+            args=(algorithm, iterator, space, worker, values, others,
+                  results, states, seeds[worker]))
+        process.daemon = True
+        workers.append(process)
+
+    # The variables of the workers must use the shared memory, so they
+    # are bound while forking only.
+    values.bind(0)
+    learning_rate.bind(0)
+    try:
+        for process in workers:
+            process.start()
+    finally:
+        values.load(0)
+        learning_rate.load(0)
+
+    try:
+        running = num_workers
+        while running > 0:
+            worker, size, error = _get_result(results, workers)
+            if error is not None:
+                raise RuntimeError("Asynchronous worker %d failed:\n%s"
+                                   % (worker, error))
+            if size is None:
+                running -= 1
+                continue
+            algorithm.monitor.report_batch(size)
+            for callback in algorithm.update_callbacks:
+                callback(algorithm)
+            learning_rate.store(0)
+        for process in workers:
+            process.join()
+    except:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        raise
+    values.load(0)
+    others.load(0)
@@ -12,22 +12,31 @@ __maintainer__ = "David Warde-Farley"
 __email__ = "pylearn-dev@googlegroups"
 
 import logging
+import time
 import warnings
 
 import numpy as np
 from theano.compat import six
 from theano import config
 from theano import function
+from theano import clone
+from theano import scan
 from theano.gof.op import get_debug_values
+from theano import tensor as T
+from theano.tensor import TensorType
+from theano.tensor.subtensor import AdvancedIncSubtensor1
 
 from pylearn2.compat import OrderedDict, first_key
 from pylearn2.monitor import Monitor
 from pylearn2.space import CompositeSpace, NullSpace
 from pylearn2.train_extensions import TrainExtension
 from pylearn2.training_algorithms.training_algorithm import TrainingAlgorithm
-from pylearn2.training_algorithms.learning_rule import Momentum
+from pylearn2.training_algorithms.learning_rule import (Momentum,
+                                                        row_sparse_terms)
 from pylearn2.training_algorithms.learning_rule import (
     MomentumAdjustor as LRMomentumAdjustor)
+from pylearn2.training_algorithms.parallel import (train_asynchronous,
+                                                   train_data_parallel)
 from pylearn2.utils.iteration import is_stochastic, has_uniform_batch_size
 from pylearn2.utils import py_integer_types, py_float_types
 from pylearn2.utils import safe_zip
@@ -36,8 +45,11 @@ from pylearn2.utils import sharedX
 from pylearn2.utils import contains_nan
 from pylearn2.utils import contains_inf
 from pylearn2.utils import isfinite
+from pylearn2.utils.checkpoint import get_shared_values, set_shared_values
 from pylearn2.utils.data_specs import DataSpecsMapping
 from pylearn2.utils.exc import reraise_as
+from pylearn2.utils.function_cache import get_mode
+from pylearn2.utils.profiling import Reservoir
 from pylearn2.utils.timing import log_timing
 from pylearn2.utils.rng import make_np_rng
 
@@ -149,6 +161,72 @@ class SGD(TrainingAlgorithm):
     seed : valid argument to np.random.RandomState, optional
         The seed used for the random number generate to be passed to the
         training dataset iterator (if any)
+    batches_per_update : int, optional
+        Defaults to 1.
+        If greater than 1, an additional update function is compiled that
+        takes a stack of `batches_per_update` minibatches and applies the
+        corresponding sequential SGD steps in a single call (using
+        `theano.scan`). This reduces the Python and function dispatch
+        overhead per minibatch, which dominates for small models. The
+        Monitor is still told about every minibatch, and the update
+        callbacks are still called once per minibatch, but only after the
+        whole stack has been processed, so changes they make (e.g. to the
+        learning rate) take effect at the granularity of the stack.
+        Batches that cannot be stacked (e.g. a smaller last batch) fall
+        back to the single-minibatch update function, and so do all the
+        batches when an updated shared variable is not a tensor (e.g. the
+        random state of `theano.tensor.shared_randomstreams`), since it
+        cannot be threaded through `scan`.
+    num_workers : int, optional
+        Defaults to 1.
+        If greater than 1, each epoch is run by `num_workers` processes
+        forked from the training process (this requires a platform
+        supporting fork, and a model stored in host memory). Each of them
+        runs `sgd_update` on a disjoint shard of the batches of the epoch,
+        and the shared variables updated by `sgd_update` are averaged
+        across them through shared memory every `sync_freq` batches.
+        See `pylearn2.training_algorithms.parallel.train_data_parallel`.
+    sync_freq : int, optional
+        Defaults to 1.
+        When `num_workers` is greater than 1, the number of batches each
+        worker processes between two averagings of the parameters.
+    asynchronous : bool, optional
+        Defaults to False.
+        If True, each epoch is run by `num_workers` forked processes that
+        update the parameters in shared memory asynchronously, without
+        any locking or averaging ("Hogwild" training). This works best
+        when each batch only updates a few rows of the parameters, e.g.
+        word embeddings trained by plain SGD or by a learning rule with
+        `sparse_updates=True`. `sync_freq` is not used in this mode.
+        See `pylearn2.training_algorithms.parallel.train_asynchronous`.
+    running_channels : bool, optional
+        Defaults to False.
+        If True, the objective, the monitoring channels of the cost, and
+        those of the model (when the data they need is part of the
+        training batches) are also computed as extra outputs of
+        `sgd_update`, on the training batches. They are averaged over
+        each epoch in shared variables and reported as
+        `train_<name>_running` channels, which gives approximate
+        training curves without a second pass over the training set by
+        the Monitor. Each value is computed with the parameters from
+        before the update of its batch, so they lag slightly behind the
+        model reached at the end of the epoch. The channels do not belong
+        to any monitoring dataset, so they are recorded at every
+        monitoring step even without a `monitoring_dataset`, in which
+        case the Monitor does not iterate over any data.
+    monitoring_subsample : int or dict, optional
+        If specified, the monitoring channels are computed on a random
+        subset of this many examples of each monitoring dataset, or of
+        the datasets named in the dictionary. See
+        `pylearn2.monitor.Monitor.add_dataset`.
+    monitoring_resample : bool or dict, optional
+        Whether a new subset is drawn every time the channels are
+        computed, rather than using the same subset throughout training.
+    monitoring_schedule : MonitorSchedule or dict, optional
+        Decides when the channels of each monitoring dataset are
+        computed, e.g. `pylearn2.monitor.PeriodicMonitorSchedule` or
+        `pylearn2.monitor.AdaptiveMonitorSchedule`. If not specified,
+        they are computed at every monitoring step.
     """
     def __init__(self, learning_rate, cost=None, batch_size=None,
                  monitoring_batch_size=None, monitoring_batches=None,
@@ -158,7 +236,10 @@ class SGD(TrainingAlgorithm):
                  learning_rule=None, set_batch_size=False,
                  train_iteration_mode=None, batches_per_iter=None,
                  theano_function_mode=None, monitoring_costs=None,
-                 seed=[2012, 10, 5]):
+                 seed=[2012, 10, 5], batches_per_update=1, num_workers=1,
+                 sync_freq=1, asynchronous=False, running_channels=False,
+                 monitoring_subsample=None, monitoring_resample=False,
+                 monitoring_schedule=None):
 
         if isinstance(cost, (list, tuple, set)):
             raise TypeError("SGD no longer supports using collections of " +
@@ -176,6 +257,9 @@ class SGD(TrainingAlgorithm):
         self.monitoring_batch_size = monitoring_batch_size
         self.monitoring_batches = monitoring_batches
         self.monitor_iteration_mode = monitor_iteration_mode
+        self.monitoring_subsample = monitoring_subsample
+        self.monitoring_resample = monitoring_resample
+        self.monitoring_schedule = monitoring_schedule
         if monitoring_dataset is None:
             if monitoring_batch_size is not None:
                 raise ValueError("Specified a monitoring batch size " +
@@ -192,6 +276,29 @@ class SGD(TrainingAlgorithm):
         self.rng = make_np_rng(seed, which_method=["randn", "randint"])
         self.theano_function_mode = theano_function_mode
         self.monitoring_costs = monitoring_costs
+        if batches_per_update < 1:
+            raise ValueError("batches_per_update must be at least 1, got " +
+                             str(batches_per_update))
+        self.batches_per_update = batches_per_update
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1, got " +
+                             str(num_workers))
+        if sync_freq < 1:
+            raise ValueError("sync_freq must be at least 1, got " +
+                             str(sync_freq))
+        if (num_workers > 1 or asynchronous) and batches_per_update > 1:
+            raise ValueError("batches_per_update > 1 is not supported "
+                             "together with multi-process training.")
+        self.num_workers = num_workers
+        self.sync_freq = sync_freq
+        self.asynchronous = asynchronous
+        self.running_channels = running_channels
+        self._running_accumulators = []
+        if num_workers > 1 or asynchronous:
+            # The updates are done by the workers, which do not time them
+            self.update_latency = None
+        else:
+            self.update_latency = Reservoir()
 
     def _setup_monitor(self):
         """
@@ -213,7 +320,10 @@ class SGD(TrainingAlgorithm):
                                batch_size=self.monitoring_batch_size,
                                num_batches=self.monitoring_batches,
                                extra_costs=self.monitoring_costs,
-                               mode=self.monitor_iteration_mode)
+                               mode=self.monitor_iteration_mode,
+                               subsample=self.monitoring_subsample,
+                               resample=self.monitoring_resample,
+                               schedule=self.monitoring_schedule)
             dataset_name = first_key(self.monitoring_dataset)
             monitoring_dataset = self.monitoring_dataset[dataset_name]
             # TODO: have Monitor support non-data-dependent channels
@@ -311,6 +421,11 @@ class SGD(TrainingAlgorithm):
         nested_args = mapping.nest(theano_args)
         fixed_var_descr = self.cost.get_fixed_var_descr(model, nested_args)
         self.on_load_batch = fixed_var_descr.on_load_batch
+        if self.batches_per_update > 1 and len(self.on_load_batch) > 0:
+            raise ValueError("batches_per_update > 1 is not supported for "
+                             "costs with on_load_batch callbacks, since "
+                             "the fixed variables they set would only "
+                             "reflect the last batch of each stack.")
 
         cost_value = self.cost.expr(model, nested_args,
                                     ** fixed_var_descr.fixed_vars)
@@ -361,14 +476,17 @@ class SGD(TrainingAlgorithm):
             lr = learning_rate.get_value() * lr_scalers.get(param, 1.)
             log.info('\t' + param_name + ': ' + str(lr))
 
+        # The plain SGD updates, with their learning rates and gradients
+        sgd_steps = OrderedDict()
         if self.learning_rule:
             updates.update(self.learning_rule.get_updates(
                 learning_rate, grads, lr_scalers))
         else:
             # Use standard SGD updates with fixed learning rate.
-            updates.update(dict(safe_zip(params, [param - learning_rate *
-                           lr_scalers.get(param, 1.) * grads[param]
-                           for param in params])))
+            for param in params:
+                scaled_lr = learning_rate * lr_scalers.get(param, 1.)
+                updates[param] = param - scaled_lr * grads[param]
+                sgd_steps[param] = (updates[param], scaled_lr, grads[param])
 
         for param in params:
             if updates[param].name is None:
@@ -394,14 +512,270 @@ class SGD(TrainingAlgorithm):
         # learning_rule.add_channels_to_monitor (that is currently the case
         # for AdaDelta and RMSProp).
         self._setup_monitor()
+        if self.running_channels:
+            self._setup_running_channels(theano_args, nested_args,
+                                         cost_value, updates)
 
         with log_timing(log, 'Compiling sgd_update'):
             self.sgd_update = function(theano_args,
                                        updates=updates,
                                        name='sgd_update',
                                        on_unused_input='ignore',
-                                       mode=self.theano_function_mode)
+                                       mode=get_mode(
+                                           self.theano_function_mode))
+        if self.batches_per_update > 1:
+            with log_timing(log, 'Compiling sgd_multi_update'):
+                self.sgd_multi_update = self._make_multi_update(theano_args,
+                                                                updates)
+        if self.asynchronous:
+            self._make_async_update(theano_args, updates, sgd_steps)
         self.params = params
+        # Including the shared variables with a default update, such as
+        # the states of random streams
+        self._updated_variables = [
+            i.variable for i in self.sgd_update.maker.expanded_inputs
+            if i.update is not None]
+
+    def _setup_running_channels(self, theano_args, nested_args, cost_value,
+                                updates):
+        """
+        Adds to `updates` the accumulation of the running channels over
+        the training batches, and adds these channels to the monitor.
+
+        Parameters
+        ----------
+        theano_args : tuple
+            The flat symbolic inputs of `sgd_update`
+        nested_args : tuple
+            `theano_args` nested according to the data specs of the cost
+        cost_value : Variable or None
+            The value of the cost on `nested_args`
+        updates : OrderedDict
+            The updates of `sgd_update`, modified in place
+        """
+        channels = OrderedDict()
+        if cost_value is not None:
+            channels['objective'] = cost_value
+        channels.update(self.cost.get_monitoring_channels(self.model,
+                                                          nested_args))
+
+        # The model's channels can only be computed if the training
+        # batches contain the data they need.
+        data_specs = self.cost.get_data_specs(self.model)
+        mapping = DataSpecsMapping(data_specs)
+        space_tuple = mapping.flatten(data_specs[0], return_tuple=True)
+        source_tuple = mapping.flatten(data_specs[1], return_tuple=True)
+        m_space, m_source = self.model.get_monitoring_data_specs()
+        m_mapping = DataSpecsMapping((m_space, m_source))
+        m_args = []
+        for space, source in safe_zip(
+                m_mapping.flatten(m_space, return_tuple=True),
+                m_mapping.flatten(m_source, return_tuple=True)):
+            matches = [arg for arg, arg_space, arg_source
+                       in safe_zip(theano_args, space_tuple, source_tuple)
+                       if arg_source == source and arg_space == space]
+            if not matches:
+                log.warning("The model's monitoring channels need %s, "
+                            "which is not part of the training batches, "
+                            "so they are not computed as running "
+                            "channels.", source)
+                break
+            m_args.append(matches[0])
+        else:
+            channels.update(self.model.get_monitoring_channels(
+                m_mapping.nest(tuple(m_args))))
+
+        batch_size = T.cast(CompositeSpace(space_tuple).batch_size(
+            theano_args), config.floatX)
+        count = sharedX(0., 'running_num_examples')
+        updates[count] = count + batch_size
+        self._running_accumulators = [count]
+        nan = np.cast[config.floatX](np.nan)
+        for name, value in six.iteritems(channels):
+            total = sharedX(0., 'running_total_' + name)
+            updates[total] = total + T.cast(value, config.floatX) * batch_size
+            self._running_accumulators.append(total)
+            # Not a number until the first batch has been seen
+            mean = T.switch(T.gt(count, 0.), total / count, nan)
+            mean.__doc__ = ("The average of %s over the training batches "
+                            "of the last epoch, accumulated during the "
+                            "updates." % name)
+            self.monitor.add_data_independent_channel(
+                name='train_' + name + '_running', val=mean)
+
+    def _make_async_update(self, theano_args, updates, sgd_steps):
+        """
+        Compiles `sgd_async_update`, the function used by the workers of
+        asynchronous training. Rather than updating the floating point
+        variables in `updates`, it returns their increments, which the
+        workers add to the values in shared memory.
+
+        The increments of the variables whose updates only change a few
+        rows are returned as the indices of these rows and their
+        increments, so that neither computing nor adding them costs as
+        much as the whole variable. These are the updates of the learning
+        rules built with `sparse_updates=True`, and the plain SGD updates
+        of parameters with row-sparse gradients (see
+        `pylearn2.training_algorithms.learning_rule.row_sparse_terms`).
+        `self._async_layout` tells, for each variable, whether its
+        increment is 'dense', or the rows of a 'sum' (where repeated rows
+        must be summed) or of a 'set' (where repeated rows hold the same
+        increment, to add once).
+
+        Parameters
+        ----------
+        theano_args : tuple
+            The symbolic inputs of `sgd_update`
+        updates : OrderedDict
+            The updates of `sgd_update`
+        sgd_steps : OrderedDict
+            Maps the parameters updated by plain SGD to their update
+            before `model.modify_updates`, their learning rate and their
+            gradient.
+        """
+        async_variables = [var for var in updates
+                           if str(getattr(var, 'dtype', '')).startswith(
+                               'float')]
+        outputs = []
+        layout = []
+        for var in async_variables:
+            update = updates[var]
+            owner = update.owner
+            terms = None
+            if var in sgd_steps and sgd_steps[var][0] is update:
+                terms = row_sparse_terms(sgd_steps[var][2])
+            if (owner is not None and
+                    isinstance(owner.op, AdvancedIncSubtensor1) and
+                    owner.op.set_instead_of_inc and owner.inputs[0] is var):
+                new_rows, indices = owner.inputs[1:]
+                outputs.extend([indices, new_rows - var[indices]])
+                layout.append('set')
+            elif terms is not None:
+                indices, rows = terms
+                outputs.extend([indices, -sgd_steps[var][1] * rows])
+                layout.append('sum')
+            else:
+                outputs.append(update - var)
+                layout.append('dense')
+        other_updates = OrderedDict((var, updates[var]) for var in updates
+                                    if var not in async_variables)
+        with log_timing(log, 'Compiling sgd_async_update'):
+            self.sgd_async_update = function(theano_args,
+                                             outputs,
+                                             updates=other_updates,
+                                             name='sgd_async_update',
+                                             on_unused_input='ignore',
+                                             mode=get_mode(
+                                                 self.theano_function_mode))
+        self._async_variables = async_variables
+        self._async_layout = layout
+
+    def _make_multi_update(self, theano_args, updates):
+        """
+        Compiles a function applying the SGD updates for a whole stack of
+        minibatches.
+
+        Each argument of the returned function is the stack (along a new
+        leading axis) of the corresponding argument of `sgd_update`.
+        The updated shared variables are threaded through a `scan`, so
+        the result is the same as calling `sgd_update` on each minibatch
+        in turn.
+
+        Parameters
+        ----------
+        theano_args : tuple
+            The symbolic inputs of `sgd_update`
+        updates : OrderedDict
+            The updates of `sgd_update`
+
+        Returns
+        -------
+        f : theano function or None
+            The compiled multi-minibatch update function, or None if some
+            updated shared variable is not a tensor.
+        """
+        others = [var for var in updates
+                  if not isinstance(var.type, TensorType)]
+        if len(others) > 0:
+            log.warning("batches_per_update > 1 can only thread tensors "
+                        "through scan, but the updated variables %s are "
+                        "not tensors. Each minibatch will be applied by "
+                        "its own call to sgd_update." % others)
+            return None
+        for arg in theano_args:
+            if not isinstance(arg.type, TensorType):
+                raise TypeError("batches_per_update > 1 requires dense "
+                                "inputs, but " + str(arg) + " has type " +
+                                str(arg.type))
+        stacked_args = [TensorType(arg.dtype, (False,) + arg.broadcastable)(
+                        name='stacked_' + str(arg.name))
+                        for arg in theano_args]
+        shared_vars = list(updates.keys())
+        num_args = len(theano_args)
+
+        def step(*args):
+            replace = OrderedDict(safe_zip(theano_args, args[:num_args]))
+            replace.update(safe_zip(shared_vars, args[num_args:]))
+            new_values = clone([updates[var] for var in shared_vars],
+                               replace=replace)
+            return [var.type.filter_variable(new_value)
+                    for var, new_value in safe_zip(shared_vars, new_values)]
+
+        outputs, scan_updates = scan(step,
+                                     sequences=stacked_args,
+                                     outputs_info=shared_vars,
+                                     name='sgd_multi_update_scan')
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        multi_updates = OrderedDict((var, output[-1])
+                                    for var, output
+                                    in safe_zip(shared_vars, outputs))
+        multi_updates.update(scan_updates)
+
+        return function(stacked_args,
+                        updates=multi_updates,
+                        name='sgd_multi_update',
+                        on_unused_input='ignore',
+                        mode=get_mode(self.theano_function_mode))
+
+    def _apply_stacked_updates(self, batches, flat_data_specs):
+        """
+        Applies the SGD updates for a list of minibatches, using a single
+        call to `sgd_multi_update` whenever the minibatches can be stacked,
+        and reports them to the monitor and update callbacks.
+
+        Parameters
+        ----------
+        batches : list
+            The minibatches, each a tuple of arrays in `flat_data_specs`
+        flat_data_specs : tuple
+            The flat data specs of the minibatches
+        """
+        if len(batches) == 0:
+            return
+        profiler = self.profiler
+        with profiler.phase('update'):
+            if (len(batches) == self.batches_per_update and
+                    self.sgd_multi_update is not None):
+                stacked = [np.asarray(arrays)
+                           for arrays in safe_zip(*batches)]
+                start = time.time()
+                self.sgd_multi_update(*stacked)
+                # Each batch counts for its share of the stacked update
+                latency = (time.time() - start) / len(batches)
+                for batch in batches:
+                    self.update_latency.add(latency)
+            else:
+                for batch in batches:
+                    start = time.time()
+                    self.sgd_update(*batch)
+                    self.update_latency.add(time.time() - start)
+        for batch in batches:
+            actual_batch_size = flat_data_specs[0].np_batch_size(batch)
+            self.monitor.report_batch(actual_batch_size)
+            with profiler.phase('update_callbacks'):
+                for callback in self.update_callbacks:
+                    callback(self)
 
     def train(self, dataset):
         """
@@ -442,26 +816,66 @@ class SGD(TrainingAlgorithm):
                 "data_specs: %s" % str(data_specs))
         flat_data_specs = (CompositeSpace(space_tuple), source_tuple)
 
-        iterator = dataset.iterator(mode=self.train_iteration_mode,
-                                    batch_size=self.batch_size,
-                                    data_specs=flat_data_specs,
-                                    return_tuple=True, rng=rng,
-                                    num_batches=self.batches_per_iter)
-
+        iterator_kwargs = dict(mode=self.train_iteration_mode,
+                               batch_size=self.batch_size,
+                               data_specs=flat_data_specs,
+                               return_tuple=True,
+                               num_batches=self.batches_per_iter)
         on_load_batch = self.on_load_batch
-        for batch in iterator:
-            for callback in on_load_batch:
-                callback(*batch)
-            self.sgd_update(*batch)
-            # iterator might return a smaller batch if dataset size
-            # isn't divisible by batch_size
-            # Note: if data_specs[0] is a NullSpace, there is no way to know
-            # how many examples would actually have been in the batch,
-            # since it was empty, so actual_batch_size would be reported as 0.
-            actual_batch_size = flat_data_specs[0].np_batch_size(batch)
-            self.monitor.report_batch(actual_batch_size)
-            for callback in self.update_callbacks:
-                callback(self)
+        profiler = self.profiler
+        update_latency = self.update_latency
+        if update_latency is not None:
+            update_latency.clear()
+        for accumulator in self._running_accumulators:
+            accumulator.set_value(np.cast[config.floatX](0.))
+        if self.asynchronous or self.num_workers > 1:
+            # The workers fetch minibatches and update the parameters
+            # concurrently, so their phases cannot be told apart here.
+            with profiler.phase('update'):
+                if self.asynchronous:
+                    train_asynchronous(self, dataset, iterator_kwargs, rng)
+                else:
+                    train_data_parallel(self, dataset, iterator_kwargs,
+                                        rng)
+        elif self.batches_per_update > 1:
+            iterator = dataset.iterator(rng=rng, **iterator_kwargs)
+            if hasattr(iterator, 'profiler'):
+                iterator.profiler = profiler
+            pending = []
+            for batch in profiler.iterate(iterator, 'fetch'):
+                # Only batches of identical shapes can be stacked
+                if pending and any(a.shape != b.shape for a, b
+                                   in safe_zip(pending[0], batch)):
+                    self._apply_stacked_updates(pending, flat_data_specs)
+                    pending = []
+                pending.append(batch)
+                if len(pending) == self.batches_per_update:
+                    self._apply_stacked_updates(pending, flat_data_specs)
+                    pending = []
+            self._apply_stacked_updates(pending, flat_data_specs)
+        else:
+            iterator = dataset.iterator(rng=rng, **iterator_kwargs)
+            if hasattr(iterator, 'profiler'):
+                iterator.profiler = profiler
+            for batch in profiler.iterate(iterator, 'fetch'):
+                with profiler.phase('on_load_batch'):
+                    for callback in on_load_batch:
+                        callback(*batch)
+                with profiler.phase('update'):
+                    start = time.time()
+                    self.sgd_update(*batch)
+                    update_latency.add(time.time() - start)
+                # iterator might return a smaller batch if dataset size
+                # isn't divisible by batch_size
+                # Note: if data_specs[0] is a NullSpace, there is no way to
+                # know how many examples would actually have been in the
+                # batch, since it was empty, so actual_batch_size would be
+                # reported as 0.
+                actual_batch_size = flat_data_specs[0].np_batch_size(batch)
+                self.monitor.report_batch(actual_batch_size)
+                with profiler.phase('update_callbacks'):
+                    for callback in self.update_callbacks:
+                        callback(self)
 
         # Make sure none of the parameters have bad values
         for param in self.params:
@@ -484,6 +898,64 @@ class SGD(TrainingAlgorithm):
         else:
             return self.termination_criterion.continue_learning(self.model)
 
+    def _get_state_variables(self):
+        """
+        Returns the shared variables read by `sgd_update` that are not
+        parameters of the model: the learning rate, the accumulators of
+        the learning rule, the states of the Theano random streams used
+        by the cost, etc.
+        """
+        params = set(self.params)
+        return [ipt.variable for ipt in self.sgd_update.maker.inputs
+                if ipt.implicit and ipt.variable not in params]
+
+    def get_state(self):
+        """
+        Returns the state of SGD that is not stored in the model: the
+        values of the shared variables returned by `_get_state_variables`,
+        the state of the random number generator used to shuffle the
+        training set, and the progress of the termination criterion.
+
+        Returns
+        -------
+        state : dict
+            A picklable description of the algorithm's progress.
+
+        Notes
+        -----
+        Checkpoints are taken between epochs, when no iterator over the
+        training set is alive, so the state of the random number
+        generator is enough to reproduce the order of the next epochs.
+        """
+        if not hasattr(self, 'sgd_update'):
+            raise Exception("get_state called without first calling setup")
+        if self.termination_criterion is None:
+            termination_state = None
+        else:
+            termination_state = self.termination_criterion.get_state()
+        return {'shared': get_shared_values(self._get_state_variables()),
+                'rng': self.rng.get_state(),
+                'first': self.first,
+                'termination_criterion': termination_state}
+
+    def set_state(self, state):
+        """
+        Restores the state returned by `get_state`.
+
+        Parameters
+        ----------
+        state : dict
+            The return value of `get_state`.
+        """
+        if not hasattr(self, 'sgd_update'):
+            raise Exception("set_state called without first calling setup")
+        set_shared_values(self._get_state_variables(), state['shared'])
+        self.rng.set_state(state['rng'])
+        self.first = state['first']
+        if state['termination_criterion'] is not None:
+            self.termination_criterion.set_state(
+                state['termination_criterion'])
+
 
 class MonitorBasedLRAdjuster(TrainExtension):
     """
@@ -546,6 +1018,7 @@ class MonitorBasedLRAdjuster(TrainExtension):
                 self.dataset_name = dataset_name
             else:
                 self.channel_name = None
+        self._num_records = 0
 
     def on_monitor(self, model, dataset, algorithm):
         """
@@ -633,6 +1106,12 @@ class MonitorBasedLRAdjuster(TrainExtension):
             # just do nothing
             return
 
+        # The channel may not be computed at every monitoring step; only
+        # adjust the learning rate once for each new record.
+        if len(v) == self._num_records:
+            return
+        self._num_records = len(v)
+
         rval = current_learning_rate
 
         log.info("monitoring channel is {0}".format(self.channel_name))
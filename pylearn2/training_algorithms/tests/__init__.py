@@ -0,0 +1,3 @@
+"""
+Training algorithm testing classes
+"""
@@ -58,7 +58,7 @@ class SoftmaxModel(Model):
 
 
 
-def test_bgd_unsup():
+def test_bgd_unsup(**kwargs):
 
     # tests that we can run the bgd algorithm
     # on an supervised cost.
@@ -104,13 +104,21 @@ def test_bgd_unsup():
 
     algorithm = BGD(cost, batch_size=5,
                 monitoring_batches=2, monitoring_dataset= monitoring_dataset,
-                termination_criterion = termination_criterion)
+                termination_criterion = termination_criterion, **kwargs)
 
     train = Train(dataset, model, algorithm, save_path=None,
                  save_freq=0, extensions=None)
 
     train.main_loop()
 
+
+def test_bgd_lbfgs():
+
+    # tests that we can run the bgd algorithm with L-BFGS search
+    # directions
+    test_bgd_unsup(lbfgs=True, lbfgs_memory=3)
+
+
 def test_determinism():
 
     """
@@ -1,5 +1,7 @@
 import numpy as np
 
+import theano
+import theano.tensor as T
 from theano.compat.six.moves import zip as izip
 
 from pylearn2.costs.cost import SumOfCosts
@@ -11,6 +13,11 @@ from pylearn2.training_algorithms.learning_rule import Momentum
 from pylearn2.training_algorithms.learning_rule import AdaDelta
 from pylearn2.training_algorithms.learning_rule import AdaGrad
 from pylearn2.training_algorithms.learning_rule import RMSProp
+from pylearn2.training_algorithms.learning_rule import Adam
+from pylearn2.training_algorithms.learning_rule import Adamax
+from pylearn2.training_algorithms.learning_rule import row_sparse_indices
+from pylearn2.training_algorithms.learning_rule import unique_row_sparse_terms
+from pylearn2.utils import sharedX
 
 from test_sgd import DummyCost, DummyModel
 
@@ -280,3 +287,233 @@ def test_rmsprop():
     assert all(np.allclose(manual_param, sgd_param.get_value())
                for manual_param, sgd_param
                in izip(manual, model.get_params()))
+
+
+def test_row_sparse_indices():
+    """
+    Checks that gradients through row lookups are recognized as
+    row-sparse, and that other gradients are not.
+    """
+    W = sharedX(np.ones((5, 3)))
+    indices = T.ivector()
+    sparse_grad = T.grad(T.sqr(W[indices]).sum(), W)
+    assert row_sparse_indices(sparse_grad) is not None
+    summed_grad = T.grad(W[indices].sum() + W[indices[:1]].sum(), W)
+    assert row_sparse_indices(summed_grad) is not None
+    dense_grad = T.grad(W[indices].sum() + T.sqr(W).sum(), W)
+    assert row_sparse_indices(dense_grad) is None
+
+
+def test_unique_row_sparse_terms():
+    """
+    Checks that the rows of the indices looked up several times are
+    summed.
+    """
+    W = sharedX(np.ones((5, 3)))
+    indices = T.ivector()
+    grad = T.grad(W[indices].sum() + W[indices[:1]].sum(), W)
+    f = theano.function([indices], unique_row_sparse_terms(grad))
+    unique, rows = f(np.array([3, 1, 3], dtype='int32'))
+    assert np.all(unique == [1, 3])
+    assert np.allclose(rows, [[1.] * 3, [3.] * 3])
+    assert np.allclose(f(np.array([2], dtype='int32'))[1], [[2.] * 3])
+
+
+def test_sparse_updates():
+    """
+    Checks that learning rules with sparse_updates=True only change the
+    rows of the parameters and accumulators that are in the gradient,
+    and that these rows get the same values as with dense updates.
+    AdaGrad should give the dense result, except for rows whose gradient
+    has always been zero, where the dense update gives NaN.
+    """
+    rng = np.random.RandomState([2014, 11, 9])
+    init_W = rng.randn(10, 4).astype(theano.config.floatX)
+    batches = [np.array([1, 3, 3], dtype='int32'),
+               np.array([3, 7], dtype='int32')]
+    lr = sharedX(.1)
+
+    def run(rule):
+        W = sharedX(init_W, name='W')
+        indices = T.ivector()
+        cost = T.sqr(W[indices] - 1.).sum()
+        updates = rule.get_updates(lr, {W: T.grad(cost, W)}, {})
+        f = theano.function([indices], updates=updates)
+        values = []
+        for batch in batches:
+            f(batch)
+            values.append([var.get_value() for var in updates])
+        return values
+
+    touched = [[1, 3], [3, 7]]
+    for make_rule in [lambda sparse: Momentum(.5, sparse_updates=sparse),
+                      lambda sparse: AdaDelta(sparse_updates=sparse),
+                      lambda sparse: RMSProp(sparse_updates=sparse)]:
+        dense = run(make_rule(False))
+        sparse = run(make_rule(True))
+        # After the first update, everything that changes in the dense
+        # case changes identically in the sparse one
+        for dense_value, sparse_value in izip(dense[0], sparse[0]):
+            assert np.allclose(dense_value[touched[0]],
+                               sparse_value[touched[0]])
+        for sparse_value in sparse[-1]:
+            untouched = [i for i in range(10) if i not in [1, 3, 7]]
+            initial = sparse_value[untouched]
+            assert np.all((initial == 0) | (initial == init_W[untouched]))
+
+    dense = run(AdaGrad())
+    sparse = run(AdaGrad(sparse_updates=True))
+    for dense_values, sparse_values in izip(dense, sparse):
+        for dense_value, sparse_value in izip(dense_values, sparse_values):
+            assert np.all(np.isfinite(sparse_value))
+            finite = np.isfinite(dense_value)
+            assert np.allclose(dense_value[finite], sparse_value[finite])
+
+
+def test_adam():
+    """
+    Make sure that learning_rule.Adam obtains the same parameter values as
+    with a hand-crafted Adam implementation, given a dummy model and
+    learning rate scaler for each parameter.
+    """
+    cost = SumOfCosts([SumOfOneHalfParamsSquared(), (0., DummyCost())])
+    model = DummyModel(shapes, lr_scalers=scales)
+    dataset = ArangeDataset(1)
+    beta1 = 0.8
+    beta2 = 0.9
+    epsilon = 1e-8
+
+    sgd = SGD(cost=cost,
+              learning_rate=learning_rate,
+              learning_rule=Adam(beta1, beta2, epsilon),
+              batch_size=1)
+
+    sgd.setup(model=model, dataset=dataset)
+
+    state = {}
+    for param in model.get_params():
+        param_shape = param.get_value().shape
+        state[param] = {}
+        state[param]['m'] = np.zeros(param_shape)
+        state[param]['v'] = np.zeros(param_shape)
+
+    def adam_manual(model, state, t):
+        rval = []
+        for scale, param in izip(scales, model.get_params()):
+            pstate = state[param]
+            param_val = param.get_value()
+            pstate['m'] = beta1 * pstate['m'] + (1 - beta1) * param_val
+            pstate['v'] = beta2 * pstate['v'] + (1 - beta2) * param_val ** 2
+            lr_t = (scale * learning_rate * np.sqrt(1 - beta2 ** t) /
+                    (1 - beta1 ** t))
+            dx_t = - lr_t * pstate['m'] / (np.sqrt(pstate['v']) + epsilon)
+            rval += [param_val + dx_t]
+        return rval
+
+    for t in [1, 2, 3]:
+        manual = adam_manual(model, state, t)
+        sgd.train(dataset=dataset)
+        assert all(np.allclose(manual_param, sgd_param.get_value())
+                   for manual_param, sgd_param
+                   in izip(manual, model.get_params()))
+
+
+def test_adamax():
+    """
+    Make sure that learning_rule.Adamax obtains the same parameter values
+    as with a hand-crafted Adamax implementation, given a dummy model and
+    learning rate scaler for each parameter.
+    """
+    cost = SumOfCosts([SumOfOneHalfParamsSquared(), (0., DummyCost())])
+    model = DummyModel(shapes, lr_scalers=scales)
+    dataset = ArangeDataset(1)
+    beta1 = 0.8
+    beta2 = 0.9
+    epsilon = 1e-8
+
+    sgd = SGD(cost=cost,
+              learning_rate=learning_rate,
+              learning_rule=Adamax(beta1, beta2, epsilon),
+              batch_size=1)
+
+    sgd.setup(model=model, dataset=dataset)
+
+    state = {}
+    for param in model.get_params():
+        param_shape = param.get_value().shape
+        state[param] = {}
+        state[param]['m'] = np.zeros(param_shape)
+        state[param]['u'] = np.zeros(param_shape)
+
+    def adamax_manual(model, state, t):
+        rval = []
+        for scale, param in izip(scales, model.get_params()):
+            pstate = state[param]
+            param_val = param.get_value()
+            pstate['m'] = beta1 * pstate['m'] + (1 - beta1) * param_val
+            pstate['u'] = np.maximum(beta2 * pstate['u'], np.abs(param_val))
+            lr_t = scale * learning_rate / (1 - beta1 ** t)
+            dx_t = - lr_t * pstate['m'] / (pstate['u'] + epsilon)
+            rval += [param_val + dx_t]
+        return rval
+
+    for t in [1, 2, 3]:
+        manual = adamax_manual(model, state, t)
+        sgd.train(dataset=dataset)
+        assert all(np.allclose(manual_param, sgd_param.get_value())
+                   for manual_param, sgd_param
+                   in izip(manual, model.get_params()))
+
+
+def test_fused():
+    """
+    Checks that storing the accumulators of all the parameters in flat
+    shared variables gives the same parameter values as storing them
+    separately.
+    """
+    def run(learning_rule):
+        cost = SumOfCosts([SumOfOneHalfParamsSquared(), (0., DummyCost())])
+        model = DummyModel(shapes, lr_scalers=scales)
+        rng = np.random.RandomState([2014, 11, 10])
+        for param in model.get_params():
+            param.set_value(rng.uniform(size=param.get_value().shape)
+                            .astype(param.dtype))
+        dataset = ArangeDataset(1)
+        sgd = SGD(cost=cost,
+                  learning_rate=learning_rate,
+                  learning_rule=learning_rule,
+                  batch_size=1)
+        sgd.setup(model=model, dataset=dataset)
+        for i in range(3):
+            sgd.train(dataset=dataset)
+        return [param.get_value() for param in model.get_params()]
+
+    for make_rule in [lambda fused: Momentum(.5, nesterov_momentum=True,
+                                             fused=fused),
+                      lambda fused: Adam(fused=fused),
+                      lambda fused: Adamax(fused=fused)]:
+        separate = run(make_rule(False))
+        fused = run(make_rule(True))
+        assert all(np.allclose(separate_param, fused_param)
+                   for separate_param, fused_param in izip(separate, fused))
+
+
+def test_fused_dtype():
+    """
+    Checks that fused accumulators have the dtype of the parameters when
+    it is not floatX.
+    """
+    dtype = 'float32' if theano.config.floatX == 'float64' else 'float64'
+    for rule in [Momentum(.5, fused=True), Adam(fused=True)]:
+        W = theano.shared(np.ones((2, 3), dtype=dtype))
+        b = theano.shared(np.ones(3, dtype=dtype))
+        cost = T.sqr(W).sum() + T.sqr(b).sum()
+        updates = rule.get_updates(sharedX(.1),
+                                   dict(zip([W, b], T.grad(cost, [W, b]))))
+        f = theano.function([], updates=updates)
+        f()
+        for var in updates:
+            if var not in (W, b) and var.ndim == 1:
+                assert var.dtype == dtype
+        assert W.get_value().dtype == dtype
+        assert np.all(W.get_value() < 1.)
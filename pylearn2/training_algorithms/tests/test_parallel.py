@@ -0,0 +1,343 @@
+"""Tests for multi-process training."""
+import numpy as np
+import theano.tensor as T
+from theano.sandbox.rng_mrg import MRG_RandomStreams
+
+from pylearn2.costs.cost import Cost
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.models.model import Model
+from pylearn2.monitor import Monitor
+from pylearn2.training_algorithms.learning_rule import Momentum
+from pylearn2.training_algorithms.parallel import (_add_increment,
+                                                   _random_states, _reseed,
+                                                   shared_memory_array,
+                                                   SharedValues)
+from pylearn2.training_algorithms.sgd import SGD
+from pylearn2.training_algorithms.tests.test_sgd import (SoftmaxModel,
+                                                         SupervisedDummyCost)
+from pylearn2.utils import sharedX, wraps
+
+
+class NoisyCost(SupervisedDummyCost):
+    """
+    Squared error between the output of the model on inputs multiplied by
+    random noise, and the targets.
+    """
+
+    @wraps(Cost.expr)
+    def expr(self, model, data):
+        (X, Y) = data
+        noise = MRG_RandomStreams(1).uniform(size=X.shape, dtype=X.dtype)
+        return T.square(model(X * noise) - Y).mean()
+
+
+def test_shared_values():
+    """
+    Checks that SharedValues stores and loads the right values.
+    """
+    a = sharedX(np.arange(6).reshape((2, 3)))
+    b = sharedX(3.)
+    values = SharedValues([a, b], 2)
+    values.store(1)
+    a.set_value(np.zeros((2, 3), dtype=a.dtype))
+    b.set_value(np.cast[b.dtype](0.))
+    values.store(0)
+    values.load(1)
+    assert np.all(a.get_value() == np.arange(6).reshape((2, 3)))
+    assert b.get_value() == 3.
+    values.load(0)
+    assert np.all(a.get_value() == 0)
+    assert shared_memory_array((0, 4), 'float32').shape == (0, 4)
+
+
+def test_data_parallel_sgd():
+    """
+    Checks that averaging plain SGD updates across 2 workers after every
+    batch is the same as running SGD on twice larger batches, and that the
+    monitor is told about every batch.
+    """
+    dim = 3
+    m = 12
+    rng = np.random.RandomState([2014, 11, 5])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+
+    def run(batch_size, num_workers):
+        model = SoftmaxModel(dim)
+        algorithm = SGD(1e-1,
+                        SupervisedDummyCost(),
+                        batch_size=batch_size,
+                        train_iteration_mode='sequential',
+                        num_workers=num_workers)
+        algorithm.setup(dataset=dataset, model=model)
+        for i in range(2):
+            algorithm.train(dataset)
+        return model.P.get_value(), Monitor.get_monitor(model)
+
+    P, monitor = run(6, 1)
+    parallel_P, parallel_monitor = run(3, 2)
+    assert np.allclose(P, parallel_P)
+    assert parallel_monitor.get_batches_seen() == 8
+    assert parallel_monitor.get_examples_seen() == 2 * m
+
+
+def test_data_parallel_sgd_shuffled():
+    """
+    Checks that data-parallel SGD runs with a stochastic iteration mode,
+    a number of batches that does not divide evenly across the workers,
+    and less frequent synchronizations.
+    """
+    dim = 3
+    m = 21
+    rng = np.random.RandomState([2014, 11, 6])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+    model = SoftmaxModel(dim)
+    init_P = model.P.get_value()
+    algorithm = SGD(1e-1,
+                    SupervisedDummyCost(),
+                    batch_size=2,
+                    num_workers=3,
+                    sync_freq=2)
+    algorithm.setup(dataset=dataset, model=model)
+    algorithm.train(dataset)
+    monitor = Monitor.get_monitor(model)
+    assert monitor.get_batches_seen() == 11
+    assert monitor.get_examples_seen() == m
+    assert not np.allclose(init_P, model.P.get_value())
+    # The workers do not time their updates
+    assert algorithm.update_latency is None
+
+
+def test_data_parallel_running_channels():
+    """
+    Checks that the running channels of data-parallel SGD count the
+    examples of all the workers, and average the objective like regular
+    SGD.
+    """
+    dim = 3
+    m = 12
+    rng = np.random.RandomState([2014, 11, 8])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+
+    def run(batch_size, num_workers):
+        model = SoftmaxModel(dim)
+        algorithm = SGD(1e-1,
+                        SupervisedDummyCost(),
+                        batch_size=batch_size,
+                        train_iteration_mode='sequential',
+                        num_workers=num_workers,
+                        running_channels=True)
+        algorithm.setup(dataset=dataset, model=model)
+        algorithm.train(dataset)
+        count, total = algorithm._running_accumulators
+        return count.get_value(), total.get_value()
+
+    # Like in test_data_parallel_sgd, both go through the same parameters
+    count, total = run(6, 1)
+    parallel_count, parallel_total = run(3, 2)
+    assert count == m
+    assert parallel_count == m
+    assert np.allclose(total, parallel_total)
+
+
+def test_data_parallel_random_states():
+    """
+    Checks that the workers of data-parallel SGD are given different
+    random streams, and that the ones of this process advance from epoch
+    to epoch.
+    """
+    dim = 3
+    m = 12
+    rng = np.random.RandomState([2014, 11, 9])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+    model = SoftmaxModel(dim)
+    algorithm = SGD(1e-1,
+                    NoisyCost(),
+                    batch_size=3,
+                    num_workers=2)
+    algorithm.setup(dataset=dataset, model=model)
+    states = _random_states(algorithm.sgd_update)
+    assert len(states) == 1
+    assert states[0] in algorithm._updated_variables
+    values = [states[0].get_value()]
+    for i in range(2):
+        algorithm.train(dataset)
+        values.append(states[0].get_value())
+    assert not np.all(values[0] == values[1])
+    assert not np.all(values[1] == values[2])
+
+    before = states[0].get_value()
+    _reseed(states, 5)
+    first = states[0].get_value()
+    _reseed(states, 6)
+    assert first.shape == before.shape
+    assert not np.all(first == before)
+    assert not np.all(first == states[0].get_value())
+
+
+def test_add_increment():
+    """
+    Checks that _add_increment only writes to the rows it changes.
+    """
+    array = np.zeros((4, 2, 2))
+    # A NaN in an untouched row must stay, as the row must not be written
+    array[0, 0, 0] = np.nan
+    rows = np.array([2, 1, 2])
+    increment = np.ones((3, 2, 2))
+    _add_increment(array, increment, rows)
+    assert np.isnan(array[0, 0, 0])
+    assert np.all(array[1] == 1.)
+    assert np.all(array[2] == 2.)
+    assert np.all(array[3] == 0.)
+    # Repeated rows of a 'set' increment are added once
+    _add_increment(array, increment, rows, sum_repeated=False)
+    assert np.all(array[1] == 2.)
+    assert np.all(array[2] == 3.)
+    _add_increment(array, increment[:0], rows[:0])
+    vector = np.ones(3)
+    _add_increment(vector, np.arange(3.))
+    assert np.all(vector == np.arange(1., 4.))
+
+
+class EmbeddingModel(SoftmaxModel):
+    """
+    A dummy model multiplying its inputs by a row of an embedding matrix,
+    chosen by the first input.
+
+    Parameters
+    ----------
+    dim : int
+        The dimension of the inputs, outputs and embeddings.
+    num_rows : int
+        The number of rows of the embedding matrix.
+    """
+
+    def __init__(self, dim, num_rows):
+        super(EmbeddingModel, self).__init__(dim)
+        rng = np.random.RandomState([2014, 11, 10])
+        self.W = sharedX(rng.uniform(-1., 1., (num_rows, dim)))
+
+    @wraps(Model.get_params)
+    def get_params(self):
+        return [self.W]
+
+    def __call__(self, X):
+        rows = T.cast(abs(X[:, 0]) * 10, 'int64') % self.W.shape[0]
+        return X * self.W[rows]
+
+
+def test_asynchronous_single_worker():
+    """
+    Checks that asynchronous SGD with a single worker gives the same
+    result as regular SGD, including the learning rule accumulators.
+    """
+    dim = 3
+    m = 10
+    rng = np.random.RandomState([2014, 11, 7])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+
+    def run(asynchronous):
+        model = SoftmaxModel(dim)
+        algorithm = SGD(1e-1,
+                        SupervisedDummyCost(),
+                        batch_size=3,
+                        learning_rule=Momentum(.5),
+                        train_iteration_mode='sequential',
+                        asynchronous=asynchronous)
+        algorithm.setup(dataset=dataset, model=model)
+        for i in range(2):
+            algorithm.train(dataset)
+        return model.P.get_value(), Monitor.get_monitor(model)
+
+    P, monitor = run(False)
+    async_P, async_monitor = run(True)
+    assert np.allclose(P, async_P)
+    assert async_monitor.get_batches_seen() == monitor.get_batches_seen()
+    assert async_monitor.get_examples_seen() == monitor.get_examples_seen()
+
+
+def test_asynchronous_sgd():
+    """
+    Checks that asynchronous SGD with several workers learns on every
+    batch.
+    """
+    dim = 3
+    m = 21
+    rng = np.random.RandomState([2014, 11, 8])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+    model = SoftmaxModel(dim)
+    init_P = model.P.get_value()
+    algorithm = SGD(1e-1,
+                    SupervisedDummyCost(),
+                    batch_size=2,
+                    num_workers=3,
+                    asynchronous=True)
+    algorithm.setup(dataset=dataset, model=model)
+    algorithm.train(dataset)
+    monitor = Monitor.get_monitor(model)
+    assert monitor.get_batches_seen() == 11
+    assert monitor.get_examples_seen() == m
+    assert not np.allclose(init_P, model.P.get_value())
+    assert algorithm.update_latency is None
+
+
+def test_asynchronous_sparse_increments():
+    """
+    Checks that asynchronous SGD only computes the increments of the rows
+    of an embedding matrix seen in a batch, and gives the same result as
+    regular SGD with a single worker, including when a batch looks up the
+    same row several times.
+    """
+    dim = 3
+    m = 10
+    rng = np.random.RandomState([2014, 11, 11])
+    X = rng.randn(m, dim)
+    # The batches look up rows 0 to 2 only, so most repeat a row
+    X[:, 0] = rng.randint(3, size=m) / 10. + .05
+    dataset = DenseDesignMatrix(X=X, y=rng.randn(m, dim))
+
+    def run(asynchronous, learning_rule, layout):
+        model = EmbeddingModel(dim, 50)
+        algorithm = SGD(1e-1,
+                        SupervisedDummyCost(),
+                        batch_size=3,
+                        learning_rule=learning_rule,
+                        train_iteration_mode='sequential',
+                        asynchronous=asynchronous)
+        algorithm.setup(dataset=dataset, model=model)
+        if asynchronous:
+            assert algorithm._async_layout == layout
+        for i in range(2):
+            algorithm.train(dataset)
+        return model.W.get_value()
+
+    for learning_rule, layout in [(None, ['sum']),
+                                  (Momentum(.5, sparse_updates=True),
+                                   ['set', 'set']),
+                                  (Momentum(.5), ['dense', 'dense'])]:
+        W = run(False, learning_rule, layout)
+        assert np.allclose(W, run(True, learning_rule, layout))
+
+
+def test_asynchronous_random_states():
+    """
+    Checks that the random streams of this process advance from epoch to
+    epoch in asynchronous SGD.
+    """
+    dim = 3
+    m = 12
+    rng = np.random.RandomState([2014, 11, 12])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+    algorithm = SGD(1e-1,
+                    NoisyCost(),
+                    batch_size=3,
+                    num_workers=2,
+                    asynchronous=True)
+    algorithm.setup(dataset=dataset, model=SoftmaxModel(dim))
+    states = _random_states(algorithm.sgd_async_update)
+    assert len(states) == 1
+    values = [states[0].get_value()]
+    for i in range(2):
+        algorithm.train(dataset)
+        values.append(states[0].get_value())
+    assert not np.all(values[0] == values[1])
+    assert not np.all(values[1] == values[2])
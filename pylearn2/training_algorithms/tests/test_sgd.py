@@ -6,7 +6,7 @@ import theano.tensor as T
 from theano.tests import disturb_mem
 from theano.tests.record import Record, RecordMode
 
-from pylearn2.compat import first_key
+from pylearn2.compat import OrderedDict, first_key
 from pylearn2.costs.cost import Cost, SumOfCosts, DefaultDataSpecsMixin
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
 from pylearn2.models.model import Model
@@ -1973,5 +1973,147 @@ def test_epoch_monitor():
         assert len(val.val_record) == n_batches//monitor_rate
 
 
+def test_batches_per_update():
+    """
+    Checks that stacking several minibatches into a single update call
+    gives the same parameters, monitor accounting and number of update
+    latencies as updating on each minibatch in turn, including when the
+    last batch is smaller.
+    """
+    dim = 3
+    batch_size = 3
+    m = 17
+    rng = np.random.RandomState([2014, 11, 4])
+    X = rng.randn(m, dim)
+    Y = rng.randn(m, dim)
+    dataset = DenseDesignMatrix(X=X, y=Y)
+
+    def run(batches_per_update):
+        model = SoftmaxModel(dim)
+        num_callbacks = [0]
+
+        def count(algorithm):
+            num_callbacks[0] += 1
+
+        algorithm = SGD(1e-1,
+                        SupervisedDummyCost(),
+                        batch_size=batch_size,
+                        learning_rule=Momentum(.5),
+                        train_iteration_mode='sequential',
+                        update_callbacks=[count],
+                        batches_per_update=batches_per_update)
+        algorithm.setup(dataset=dataset, model=model)
+        for i in xrange(2):
+            algorithm.train(dataset)
+        monitor = Monitor.get_monitor(model)
+        return (model.P.get_value(), monitor.get_batches_seen(),
+                monitor.get_examples_seen(), num_callbacks[0],
+                len(algorithm.update_latency))
+
+    P, batches, examples, callbacks, latencies = run(1)
+    assert batches == 12
+    assert examples == 2 * m
+    assert callbacks == 12
+    # One per batch of the last epoch
+    assert latencies == 6
+    for batches_per_update in [2, 4]:
+        fused = run(batches_per_update)
+        assert np.allclose(P, fused[0])
+        assert fused[1:] == (batches, examples, callbacks, latencies)
+
+
+def test_batches_per_update_random_state():
+    """
+    Checks that batches_per_update falls back to one update call per
+    minibatch when the cost updates a RandomState, which scan can not
+    thread.
+    """
+    from theano.tensor.shared_randomstreams import RandomStreams
+
+    class NoisyCost(SupervisedDummyCost):
+        def __init__(self):
+            self.theano_rng = RandomStreams(1)
+
+        def get_gradients(self, model, data, **kwargs):
+            grads, updates = super(NoisyCost, self).get_gradients(
+                model, data, **kwargs)
+            noise = self.theano_rng.uniform(size=(1,))
+            updates.update(self.theano_rng.updates())
+            grads = OrderedDict((param, grad + 0. * noise.sum())
+                                for param, grad in grads.items())
+            return grads, updates
+
+    rng = np.random.RandomState([2014, 11, 6])
+    dataset = DenseDesignMatrix(X=rng.randn(12, 3), y=rng.randn(12, 3))
+    model = SoftmaxModel(3)
+    algorithm = SGD(1e-1, NoisyCost(), batch_size=3,
+                    train_iteration_mode='sequential',
+                    batches_per_update=2)
+    algorithm.setup(dataset=dataset, model=model)
+    assert algorithm.sgd_multi_update is None
+    algorithm.train(dataset)
+    assert Monitor.get_monitor(model).get_batches_seen() == 4
+
+
+def test_running_channels():
+    """
+    Checks that the running channels accumulated by sgd_update hold the
+    average of the objective over the training batches of the last epoch.
+    """
+    dim = 3
+    batch_size = 5
+    m = 20
+    rng = np.random.RandomState([2014, 11, 5])
+    X = rng.randn(m, dim)
+    Y = rng.randn(m, dim)
+    dataset = DenseDesignMatrix(X=X, y=Y)
+    model = SoftmaxModel(dim)
+
+    # With a learning rate of 0 the parameters stay the same, so the
+    # running average must match the objective on the whole dataset.
+    algorithm = SGD(0.,
+                    SupervisedDummyCost(),
+                    batch_size=batch_size,
+                    train_iteration_mode='sequential',
+                    monitoring_dataset=dataset,
+                    termination_criterion=EpochCounter(2),
+                    running_channels=True)
+    train = Train(dataset, model, algorithm)
+    train.main_loop()
+
+    running = model.monitor.channels['train_objective_running'].val_record
+    objective = model.monitor.channels['objective'].val_record
+    assert len(running) == 3
+    assert np.isnan(running[0])
+    assert np.allclose(running[1:], objective[1:])
+
+
+def test_running_channels_without_monitoring_dataset():
+    """
+    Checks that running channels are recorded at every epoch when there
+    is no monitoring dataset, without the monitor iterating over data.
+    """
+    dim = 3
+    batch_size = 5
+    m = 20
+    rng = np.random.RandomState([2014, 11, 5])
+    dataset = DenseDesignMatrix(X=rng.randn(m, dim), y=rng.randn(m, dim))
+    model = SoftmaxModel(dim)
+    algorithm = SGD(1e-3,
+                    SupervisedDummyCost(),
+                    batch_size=batch_size,
+                    termination_criterion=EpochCounter(3),
+                    running_channels=True)
+    train = Train(dataset, model, algorithm)
+    train.main_loop()
+
+    monitor = model.monitor
+    assert len(monitor._datasets) == 0
+    running = monitor.channels['train_objective_running']
+    assert len(running.val_record) == 4
+    assert np.all(np.isfinite(running.val_record[1:]))
+    assert list(running.epoch_record) == [0, 1, 2, 3]
+
+
 if __name__ == '__main__':
     test_monitor_based_lr()
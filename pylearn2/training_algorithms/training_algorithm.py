@@ -1,5 +1,6 @@
 """Module defining the interface for training algorithms."""
 from pylearn2.datasets.dataset import Dataset
+from pylearn2.utils.profiling import NullProfiler
 
 class TrainingAlgorithm(object):
     """
@@ -7,6 +8,16 @@ class TrainingAlgorithm(object):
     algorithms.
     """
 
+    # Measures the time spent in the phases of `train`. `Train` replaces
+    # it with a `pylearn2.utils.profiling.Profiler` when profiling is
+    # enabled.
+    profiler = NullProfiler()
+
+    # A `pylearn2.utils.profiling.Reservoir` of the durations in seconds of
+    # the parameter updates done by the last call to `train`, or None if
+    # the algorithm does not measure them.
+    update_latency = None
+
     def _register_update_callbacks(self, update_callbacks):
         """
         .. todo::
@@ -60,6 +71,41 @@ class TrainingAlgorithm(object):
         """
         raise NotImplementedError()
 
+    def get_state(self):
+        """
+        Returns the state of the training algorithm that is not stored in
+        the model, such as learning rule accumulators and random number
+        generators, to be saved in training checkpoints.
+
+        Returns
+        -------
+        state : object
+            A picklable description of the algorithm's progress, or None
+            if the algorithm keeps no such state.
+
+        Notes
+        -----
+        Called after `setup`.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the state returned by `get_state`.
+
+        Parameters
+        ----------
+        state : object
+            The return value of `get_state`.
+
+        Notes
+        -----
+        Called after `setup` when resuming training from a checkpoint.
+        """
+        if state is not None:
+            raise NotImplementedError(str(type(self)) + " does not "
+                                      "implement set_state.")
+
     def _set_monitoring_dataset(self, monitoring_dataset):
         """
         .. todo::
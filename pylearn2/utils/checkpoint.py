@@ -0,0 +1,123 @@
+"""
+Utilities for capturing and restoring the state of the objects involved
+in training, so that an interrupted job can be resumed where it left off.
+"""
+import copy
+
+import numpy as np
+from theano.compat import six
+
+from pylearn2.utils import safe_zip
+
+
+def _is_plain(value):
+    """
+    Returns True if `value` is made only of numbers, strings, arrays and
+    None, possibly nested in lists, tuples and dicts.
+
+    Parameters
+    ----------
+    value : object
+        The value to test.
+    """
+    if value is None or isinstance(value, (bool, float, complex,
+                                           np.ndarray, np.generic) +
+                                   six.integer_types + six.string_types):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_plain(elem) for elem in value)
+    if isinstance(value, dict):
+        return all(_is_plain(key) and _is_plain(elem)
+                   for key, elem in six.iteritems(value))
+    return False
+
+
+def get_plain_state(obj, exclude=()):
+    """
+    Returns a copy of the attributes of `obj` that hold plain data.
+
+    Plain data is numbers, strings, arrays and None, possibly nested in
+    lists, tuples and dicts. Attributes holding anything else (shared
+    variables, Theano expressions, models, ...) are left out.
+
+    This is the default state saved in checkpoints for train extensions
+    and termination criteria, whose progress is usually kept in counters
+    and best-values-so-far.
+
+    Parameters
+    ----------
+    obj : object
+        The object whose state to capture.
+    exclude : iterable of str, optional
+        Names of attributes that should not be captured even though they
+        hold plain data.
+
+    Returns
+    -------
+    state : dict
+        Maps attribute names to deep copies of their values.
+    """
+    return dict((name, copy.deepcopy(value))
+                for name, value in six.iteritems(vars(obj))
+                if name not in exclude and _is_plain(value))
+
+
+def set_plain_state(obj, state):
+    """
+    Restores attributes captured by `get_plain_state`.
+
+    Parameters
+    ----------
+    obj : object
+        The object whose state to restore.
+    state : dict
+        The return value of `get_plain_state`.
+    """
+    for name, value in six.iteritems(state):
+        setattr(obj, name, copy.deepcopy(value))
+
+
+def get_shared_values(variables):
+    """
+    Returns copies of the values of a list of shared variables.
+
+    Parameters
+    ----------
+    variables : list
+        Theano shared variables.
+
+    Returns
+    -------
+    values : list
+        The values of `variables`, in the same order.
+    """
+    return [var.get_value() for var in variables]
+
+
+def set_shared_values(variables, values):
+    """
+    Restores values captured by `get_shared_values` into a list of
+    shared variables, checking that they match the variables.
+
+    Parameters
+    ----------
+    variables : list
+        Theano shared variables, in the order they were captured in.
+    values : list
+        The return value of `get_shared_values`.
+    """
+    if len(variables) != len(values):
+        raise ValueError("Tried to restore %d saved values into %d shared "
+                         "variables. Was the checkpoint written with a "
+                         "different configuration?"
+                         % (len(values), len(variables)))
+    for var, value in safe_zip(variables, values):
+        if isinstance(value, np.ndarray):
+            current = var.get_value(borrow=True)
+            if np.shape(current) != value.shape:
+                raise ValueError("Saved value for %s has shape %s but the "
+                                 "variable has shape %s."
+                                 % (var.name, value.shape,
+                                    np.shape(current)))
+            value = np.asarray(value, dtype=var.dtype)
+        var.set_value(value)
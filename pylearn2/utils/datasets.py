@@ -7,22 +7,20 @@ import logging
 import os
 import functools
 from itertools import repeat
-import warnings
 
 # Third-party imports
 import numpy
 import scipy
 from theano.compat.six.moves import reduce, xrange
 import theano
-try:
-    from matplotlib import pyplot
-    from mpl_toolkits.mplot3d import Axes3D
-except ImportError:
-    warnings.warn("Could not import some dependencies.")
 
 # Local imports
+from pylearn2.utils.lazy_import import lazy_import
 from pylearn2.utils.rng import make_np_rng
 
+pyplot = lazy_import('matplotlib.pyplot')
+mplot3d = lazy_import('mpl_toolkits.mplot3d')
+
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +42,7 @@ def do_3d_scatter(x, y, z, figno=None, title=None):
     title : WRITEME
     """
     fig = pyplot.figure(figno)
-    ax = Axes3D(fig)
+    ax = mplot3d.Axes3D(fig)
     ax.scatter(x, y, z)
     ax.set_xlabel("X")
     ax.set_ylabel("Y")
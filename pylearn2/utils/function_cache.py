@@ -0,0 +1,344 @@
+"""
+A persistent cache of optimized Theano graphs, so that jobs compiling the
+same functions (e.g. the runs of a hyperparameter sweep, or a job that is
+resumed) do not pay for graph optimization every time.
+
+The cache is enabled by setting the `PYLEARN2_FUNCTION_CACHE` environment
+variable to a directory. Functions compiled with a mode returned by
+`get_mode` then look for their optimized graph in that directory before
+optimizing it, and store it there otherwise. The key of a graph is a hash
+of its structure (ops, types, constants and the properties of its inputs
+and outputs), of the optimizer and linker of the mode, and of the Theano
+version and flags. The values of shared variables are not part of the
+key and are not stored: the cached graph is linked to the shared
+variables of the function being compiled. Theano already caches the
+compiled C code of the ops, so linking a cached graph is fast.
+"""
+import copy
+import hashlib
+import logging
+import os
+import pickle
+
+import theano
+from theano import gof
+from theano.compat import six
+from theano.compat.six.moves import cPickle
+from theano.compile.builders import OpFromGraph
+from theano.compile.function_module import (Function, FunctionMaker,
+                                            std_fgraph)
+from theano.compile.mode import Mode
+from theano.compile.sharedvalue import SharedVariable
+from theano.configparser import get_config_md5
+from theano.scan_module.scan_op import Scan
+
+from pylearn2.utils.string_utils import preprocess
+
+
+log = logging.getLogger(__name__)
+
+# Changing the layout of the key or of the cache files requires changing
+# this, so that old cache files are not used.
+CACHE_VERSION = 1
+
+# Ops holding their own compiled inner function, whose shared variables
+# cannot be rebound to the ones of the function being compiled. Graphs
+# containing them are not cached.
+_INNER_GRAPH_OPS = (Scan, OpFromGraph)
+
+
+def get_cache_dir():
+    """
+    Returns the directory of the cache, or None if it is disabled.
+    """
+    cache_dir = os.environ.get('PYLEARN2_FUNCTION_CACHE', '')
+    if not cache_dir:
+        return None
+    return preprocess(cache_dir)
+
+
+def get_mode(mode=None):
+    """
+    Returns a mode that compiles functions like `mode`, but goes through
+    the cache if it is enabled.
+
+    Parameters
+    ----------
+    mode : str or theano.compile.Mode, optional
+        The mode to use. If not specified, Theano's default mode is used.
+
+    Returns
+    -------
+    mode : str or theano.compile.Mode
+        `mode` itself if the cache is disabled or if `mode` is not a plain
+        `Mode` (e.g. a DebugMode or a ProfileMode, which build functions
+        their own way), a copy of `mode` using the cache otherwise.
+    """
+    if get_cache_dir() is None:
+        return mode
+    mode = theano.compile.mode.get_mode(mode)
+    if type(mode) is not Mode:
+        return mode
+    rval = copy.copy(mode)
+    rval.function_maker = CachingFunctionMaker
+    return rval
+
+
+def _describe_optimizer(optimizer):
+    """
+    Returns a description of the optimizer of a mode that is the same in
+    every process, or None if there is none.
+
+    Parameters
+    ----------
+    optimizer : str, Query or None
+        The `provided_optimizer` of the mode.
+    """
+    if optimizer is None or isinstance(optimizer, six.string_types):
+        return optimizer
+    if isinstance(optimizer, gof.Query):
+        return ('Query', sorted(optimizer.include),
+                sorted(optimizer.require), sorted(optimizer.exclude),
+                sorted(optimizer.subquery.keys()), optimizer.position_cutoff)
+    return None
+
+
+def _function_key(inputs, outputs, mode, accept_inplace):
+    """
+    Returns the key of the function built by a `FunctionMaker` from these
+    arguments, or None if it cannot be computed reliably.
+
+    Parameters
+    ----------
+    inputs : list
+        The inputs of the function, as given to `FunctionMaker`.
+    outputs : list, Variable or None
+        The outputs of the function, as given to `FunctionMaker`.
+    mode : theano.compile.Mode
+        The mode of the function.
+    accept_inplace : bool
+        Whether the graph may contain inplace operations.
+    """
+    mode = theano.compile.mode.get_mode(mode)
+    optimizer = _describe_optimizer(mode.provided_optimizer)
+    linker = mode.provided_linker
+    if optimizer is None or not isinstance(linker, six.string_types):
+        return None
+
+    if outputs is None:
+        outputs = []
+    elif not isinstance(outputs, (list, tuple)):
+        outputs = [outputs]
+    if not isinstance(inputs, (list, tuple)):
+        inputs = [inputs]
+    inputs = [FunctionMaker.wrap_in(i) for i in inputs]
+    outputs = [FunctionMaker.wrap_out(o) for o in outputs]
+    fgraph, _ = std_fgraph(inputs, outputs, accept_inplace)
+
+    digest = hashlib.sha1()
+
+    def add(item):
+        # The memo of cPickle depends on the reference counts of the
+        # objects, so equal items do not always give the same string. The
+        # pure Python pickler without memo is deterministic.
+        buf = six.BytesIO()
+        pickler = pickle.Pickler(buf, 2)
+        pickler.fast = True
+        pickler.dump(item)
+        digest.update(buf.getvalue())
+
+    add((CACHE_VERSION, theano.__version__, get_config_md5(),
+         theano.config.optimizer_including,
+         theano.config.optimizer_excluding,
+         theano.config.optimizer_requiring, optimizer, linker,
+         bool(accept_inplace)))
+
+    ids = {}
+    for var, spec in zip(fgraph.inputs, inputs):
+        ids[var] = len(ids)
+        add((var.type, spec.mutable, spec.strict, spec.allow_downcast,
+             spec.implicit, spec.update is not None))
+
+    def add_reference(var):
+        if var in ids:
+            add(('variable', ids[var]))
+        elif isinstance(var, gof.Constant):
+            add(('constant', var.type, var.data))
+        else:
+            raise ValueError("Unexpected variable %s in the graph" % var)
+
+    for node in fgraph.toposort():
+        if isinstance(node.op, _INNER_GRAPH_OPS):
+            return None
+        add(node.op)
+        for var in node.inputs:
+            add_reference(var)
+        for var in node.outputs:
+            ids[var] = len(ids)
+            add(var.type)
+    for var, spec in zip(fgraph.outputs, outputs):
+        add_reference(var)
+        add(spec.borrow)
+    # Updates are the last outputs of the graph
+    for var in fgraph.outputs[len(outputs):]:
+        add_reference(var)
+    return digest.hexdigest()
+
+
+def _persistent_id(obj):
+    """
+    Leaves the values of shared variables out of the cache files. The
+    functions built from a cached graph get the containers of their own
+    shared variables.
+    """
+    if isinstance(obj, gof.Container):
+        return 'container'
+    return None
+
+
+def _load_graph(path):
+    """
+    Returns the graph cached in `path`, or None if there is none.
+
+    Parameters
+    ----------
+    path : str
+        The cache file.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = lambda name: None
+            return unpickler.load()
+    except Exception as e:
+        log.warning("Could not read the cached graph %s, it will be "
+                    "optimized again: %s", path, e)
+        return None
+
+
+def _store_graph(path, fgraph):
+    """
+    Writes `fgraph` to the cache file `path`. The file is written under a
+    temporary name and renamed, so that other processes never read a
+    partial file.
+
+    Parameters
+    ----------
+    path : str
+        The cache file.
+    fgraph : FunctionGraph
+        The optimized graph.
+    """
+    dirname = os.path.dirname(path)
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+    except OSError:
+        # Another process may have created it in the meantime
+        if not os.path.isdir(dirname):
+            raise
+    tmp_path = os.path.join(dirname, '.tmp%d.%s' % (os.getpid(),
+                                                    os.path.basename(path)))
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickler = cPickle.Pickler(f, 2)
+            pickler.persistent_id = _persistent_id
+            pickler.dump(fgraph)
+        os.rename(tmp_path, path)
+    except Exception as e:
+        log.warning("Could not store the optimized graph in %s: %s",
+                    path, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _bind_shared(fgraph, inputs):
+    """
+    Makes the shared variables of a cached graph use the containers of
+    the shared variables of the function being compiled.
+
+    Parameters
+    ----------
+    fgraph : FunctionGraph
+        A graph returned by `_load_graph`.
+    inputs : list
+        The inputs of the function, as given to `FunctionMaker`.
+    """
+    if not isinstance(inputs, (list, tuple)):
+        inputs = [inputs]
+    inputs = [FunctionMaker.wrap_in(i) for i in inputs]
+    if len(inputs) != len(fgraph.inputs):
+        raise ValueError("The cached graph has %d inputs but the function "
+                         "has %d." % (len(fgraph.inputs), len(inputs)))
+    for var, spec in zip(fgraph.inputs, inputs):
+        if isinstance(var, SharedVariable):
+            if not isinstance(spec.variable, SharedVariable):
+                raise ValueError("Input %s of the cached graph is a shared "
+                                 "variable but %s is not."
+                                 % (var, spec.variable))
+            var.container = spec.variable.container
+
+
+class CachingFunctionMaker(FunctionMaker):
+    """
+    A `FunctionMaker` that reuses optimized graphs from the cache
+    directory, and stores the graphs it optimizes there.
+
+    Use it through `get_mode`.
+
+    Parameters
+    ----------
+    inputs : list
+        The inputs of the function.
+    outputs : list, Variable or None
+        The outputs of the function.
+    mode : theano.compile.Mode, optional
+        The mode of the function.
+    accept_inplace : bool, optional
+        Whether the graph may contain inplace operations.
+    function_builder : callable, optional
+        Builds the function from the linked graph.
+    profile : ProfileStats, optional
+        Where to record profiling information.
+    on_unused_input : str, optional
+        What to do with inputs the outputs do not depend on.
+    fgraph : FunctionGraph, optional
+        An already optimized graph, e.g. when unpickling a function. The
+        cache is not used when it is given.
+    """
+
+    def __init__(self, inputs, outputs, mode=None, accept_inplace=False,
+                 function_builder=Function, profile=None,
+                 on_unused_input=None, fgraph=None):
+        cache_dir = get_cache_dir()
+        path = None
+        cached = None
+        if fgraph is None and cache_dir is not None:
+            try:
+                key = _function_key(inputs, outputs, mode, accept_inplace)
+            except Exception as e:
+                log.debug("Not caching a function whose key could not be "
+                          "computed: %s", e)
+                key = None
+            if key is not None:
+                path = os.path.join(cache_dir, key + '.pkl')
+                cached = _load_graph(path)
+
+        init = super(CachingFunctionMaker, self).__init__
+        kwargs = dict(mode=mode, accept_inplace=accept_inplace,
+                      function_builder=function_builder, profile=profile,
+                      on_unused_input=on_unused_input)
+        if cached is not None:
+            try:
+                _bind_shared(cached, inputs)
+                init(inputs, outputs, fgraph=cached, **kwargs)
+                log.debug("Reused the optimized graph in %s", path)
+                return
+            except Exception as e:
+                log.warning("Could not use the cached graph %s, it will be "
+                            "optimized again: %s", path, e)
+        init(inputs, outputs, fgraph=fgraph, **kwargs)
+        if path is not None:
+            _store_graph(path, self.fgraph)
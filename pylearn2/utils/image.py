@@ -3,24 +3,12 @@ Utility functions for working with images.
 """
 import logging
 import numpy as np
-plt = None
-axes = None
 from theano.compat.six.moves import xrange
 from theano.compat.six import string_types
 import warnings
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib.axes
-except (RuntimeError, ImportError, TypeError) as matplotlib_exception:
-    warnings.warn("Unable to import matplotlib. Some features unavailable. "
-                  "Original exception: " + str(matplotlib_exception))
 import os
 
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
+from pylearn2.utils.lazy_import import is_available, lazy_import
 from pylearn2.utils import string_utils as string
 from pylearn2.utils.exc import reraise_as
 from tempfile import mkstemp
@@ -30,11 +18,16 @@ import subprocess
 
 logger = logging.getLogger(__name__)
 
+# matplotlib and PIL are optional and slow to import, so they are only
+# imported by the functions that use them.
+plt = lazy_import('matplotlib.pyplot')
+axes = lazy_import('matplotlib.axes')
+Image = lazy_import('PIL.Image')
+
 
 def ensure_Image():
-    """Makes sure Image has been imported from PIL"""
-    global Image
-    if Image is None:
+    """Makes sure Image can be imported from PIL"""
+    if not is_available(Image):
         raise RuntimeError("You are trying to use PIL-dependent functionality"
                            " but don't have PIL installed.")
 
@@ -72,11 +65,11 @@ def imview(*args, **kwargs):
         f = plt.figure()
     else:
         f = kwargs['figure']
-    new_ax = matplotlib.axes.Axes(f,
-                                  [0, 0, 1, 1],
-                                  xticks=[],
-                                  yticks=[],
-                                  frame_on=False)
+    new_ax = axes.Axes(f,
+                       [0, 0, 1, 1],
+                       xticks=[],
+                       yticks=[],
+                       frame_on=False)
     f.delaxes(f.gca())
     f.add_axes(new_ax)
     if len(args) < 5 and 'interpolation' not in kwargs:
@@ -25,6 +25,7 @@ from pylearn2.space import CompositeSpace
 from pylearn2.utils import safe_izip, wraps
 from pylearn2.utils.data_specs import is_flat_specs
 from pylearn2.utils.exc import reraise_as
+from pylearn2.utils.profiling import NullProfiler
 from pylearn2.utils.rng import make_np_rng
 import copy
 
@@ -759,6 +760,89 @@ class EvenSequencesSubsetIterator(SubsetIterator):
     uniform_batch_size = False
 
 
+class ShardedSubsetIterator(SubsetIterator):
+    """
+    Wraps another subset iterator and only returns one of `num_shards`
+    disjoint shards of its batches: the batches with index `shard`,
+    `shard + num_shards`, `shard + 2 * num_shards`, etc.
+
+    Several processes iterating with identically seeded wrapped iterators
+    and different values of `shard` thus cover each batch exactly once.
+
+    Parameters
+    ----------
+    subset_iterator : SubsetIterator
+        The iterator whose batches are sharded
+    shard : int
+        Index of the shard to return, in `[0, num_shards)`
+    num_shards : int
+        Number of shards
+    """
+
+    def __init__(self, subset_iterator, shard, num_shards):
+        if not 0 <= shard < num_shards:
+            raise ValueError("shard must be in [0, %d), got %d" %
+                             (num_shards, shard))
+        self._subset_iterator = subset_iterator
+        self._shard = shard
+        self._num_shards = num_shards
+        self._to_skip = shard
+
+    @wraps(SubsetIterator.next, assigned=(), updated=())
+    def next(self):
+        for i in six.moves.xrange(self._to_skip):
+            self._subset_iterator.next()
+        self._to_skip = self._num_shards - 1
+        return self._subset_iterator.next()
+
+    def __next__(self):
+        return self.next()
+
+    @property
+    @wraps(SubsetIterator.batch_size, assigned=(), updated=())
+    def batch_size(self):
+        return self._subset_iterator.batch_size
+
+    @property
+    @wraps(SubsetIterator.num_batches, assigned=(), updated=())
+    def num_batches(self):
+        num_batches = self._subset_iterator.num_batches
+        return max(0, int(np.ceil((num_batches - self._shard) /
+                                  self._num_shards)))
+
+    @property
+    @wraps(SubsetIterator.num_examples, assigned=(), updated=())
+    def num_examples(self):
+        num_batches = self.num_batches
+        if num_batches == 0:
+            return 0
+        subset_iterator = self._subset_iterator
+        num_examples = num_batches * self.batch_size
+        if (subset_iterator.num_batches - 1) % self._num_shards == self._shard:
+            # This shard returns the last batch, which may be smaller
+            num_examples -= (subset_iterator.batch_size *
+                             subset_iterator.num_batches -
+                             subset_iterator.num_examples)
+        return num_examples
+
+    @property
+    @wraps(SubsetIterator.uneven, assigned=(), updated=())
+    def uneven(self):
+        return self._subset_iterator.uneven
+
+    @property
+    def fancy(self):
+        return self._subset_iterator.fancy
+
+    @property
+    def stochastic(self):
+        return self._subset_iterator.stochastic
+
+    @property
+    def uniform_batch_size(self):
+        return self._subset_iterator.uniform_batch_size
+
+
 _iteration_schemes = {
     'sequential': SequentialSubsetIterator,
     'shuffled_sequential': ShuffledSequentialSubsetIterator,
@@ -937,17 +1021,17 @@ class FiniteDatasetIterator(object):
             # If there is a fn, it is supposed to take care of the formatting,
             # and it should be an error if it does not. If there was no fn,
             # then the iterator will try to format using the generic
-            # space-formatting functions.
+            # space-formatting functions. All the batches come from the
+            # same dataset, so only the first one needs to be validated.
             if fn is None:
-                # "dspace" and "sp" have to be passed as parameters
-                # to lambda, in order to capture their current value,
-                # otherwise they would change in the next iteration
-                # of the loop.
-                fn = (lambda batch, dspace=dspace, sp=sp:
-                      dspace.np_format_as(batch, sp))
+                fn = dspace.np_format_plan(sp, trusted=True)
 
             self._convert[i] = fn
 
+    # Measures the time spent converting the batches. Training algorithms
+    # replace it with their own profiler.
+    profiler = NullProfiler()
+
     def __iter__(self):
         return self
 
@@ -983,23 +1067,46 @@ class FiniteDatasetIterator(object):
         return rval
 
     def _next(self, next_index):
-        return tuple(
-            fn(batch) if fn else batch for batch, fn in
-            safe_izip(self._dataset.get(self._source, next_index),
-                      self._convert)
-        )
+        batches = self._dataset.get(self._source, next_index)
+        with self.profiler.phase('convert'):
+            return tuple(
+                fn(batch) if fn else batch for batch, fn in
+                safe_izip(batches, self._convert)
+            )
 
     def _fallback_next(self, next_index):
         # TODO: handle fancy-index copies by allocating a buffer and
         # using np.take()
-        return tuple(
-            fn(data[next_index]) if fn else data[next_index]
-            for data, fn in safe_izip(self._raw_data, self._convert)
-        )
+        batches = [data[next_index] for data in self._raw_data]
+        with self.profiler.phase('convert'):
+            return tuple(
+                fn(batch) if fn else batch
+                for batch, fn in safe_izip(batches, self._convert)
+            )
 
     def __next__(self):
         return self.next()
 
+    def shard(self, shard, num_shards):
+        """
+        Restricts this iterator to one of `num_shards` disjoint shards of
+        its batches. Batches that belong to other shards are skipped
+        without being loaded.
+
+        Parameters
+        ----------
+        shard : int
+            Index of the shard to keep, in `[0, num_shards)`
+        num_shards : int
+            Number of shards
+
+        See Also
+        --------
+        ShardedSubsetIterator
+        """
+        self._subset_iterator = ShardedSubsetIterator(self._subset_iterator,
+                                                      shard, num_shards)
+
     @property
     @wraps(SubsetIterator.batch_size, assigned=(), updated=())
     def batch_size(self):
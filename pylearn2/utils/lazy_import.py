@@ -0,0 +1,150 @@
+"""
+Deferred imports of heavy or optional modules.
+
+Importing matplotlib, PIL, yaml or the GPU modules of Theano can take
+much longer than the work done by a short script, e.g. printing the
+channels of a pickled monitor. Modules that only need them in some of
+their functions can bind a `LazyModule` at module level instead, and the
+import happens the first time one of its attributes is used.
+"""
+import sys
+import threading
+
+
+class LazyModule(object):
+    """
+    A stand-in for a module that imports it the first time one of its
+    attributes is accessed.
+
+    Parameters
+    ----------
+    name : str
+        The absolute name of the module, e.g. 'matplotlib.pyplot'.
+    """
+
+    def __init__(self, name):
+        # Go through object.__setattr__ so that nothing is forwarded to the
+        # module
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_module', None)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+
+    def _lazy_load(self):
+        """
+        Imports the module if it has not been imported yet, and returns it.
+        ImportError is raised if the module is not available.
+        """
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                module = self._lazy_module
+                if module is None:
+                    # __import__ returns the top-level package
+                    __import__(self._lazy_name)
+                    module = sys.modules[self._lazy_name]
+                    object.__setattr__(self, '_lazy_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_load(), name, value)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        if self._lazy_module is None:
+            return "<lazily imported module '%s'>" % self._lazy_name
+        return repr(self._lazy_module)
+
+
+def lazy_import(name):
+    """
+    Returns a `LazyModule` for the module `name`, or the module itself if
+    it has already been imported.
+
+    Parameters
+    ----------
+    name : str
+        The absolute name of the module.
+
+    Returns
+    -------
+    module : module or LazyModule
+        Use it as the module would be used.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_available(module):
+    """
+    Returns True if the module can be imported, importing it if it is a
+    `LazyModule` that has not been imported yet.
+
+    Parameters
+    ----------
+    module : module, LazyModule or None
+        The module to test. None stands for a module that could not be
+        imported.
+    """
+    if module is None:
+        return False
+    if isinstance(module, LazyModule):
+        try:
+            module._lazy_load()
+        except ImportError:
+            return False
+    return True
+
+
+class _LazyClassType(type):
+    """
+    Metaclass of the classes returned by `lazy_class`.
+    """
+
+    def _lazy_target(cls):
+        """
+        Returns the class stood for, or None if its module has not been
+        imported.
+        """
+        module = sys.modules.get(cls._lazy_module)
+        if module is None:
+            return None
+        return getattr(module, cls._lazy_name)
+
+    def __instancecheck__(cls, obj):
+        target = cls._lazy_target()
+        return target is not None and isinstance(obj, target)
+
+    def __subclasscheck__(cls, subclass):
+        target = cls._lazy_target()
+        return target is not None and issubclass(subclass, target)
+
+
+def lazy_class(module, name):
+    """
+    Returns a stand-in for the class `name` of the module `module`, to be
+    used in `isinstance` and `issubclass` checks without importing it.
+
+    Nothing can be an instance of a class whose module has not been
+    imported, so the checks are False until something else imports it.
+
+    Parameters
+    ----------
+    module : str
+        The absolute name of the module defining the class.
+    name : str
+        The name of the class.
+
+    Returns
+    -------
+    cls : type
+        A class that only supports `isinstance` and `issubclass` checks.
+    """
+    return _LazyClassType(name, (object,), {'_lazy_module': module,
+                                            '_lazy_name': name})
@@ -5,6 +5,15 @@
 """
 import subprocess
 import os
+import sys
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 
 def get_memory_usage():
@@ -22,6 +31,106 @@ def get_memory_usage():
     return int(stdout_list[0])
 
 
+def get_rss():
+    """
+    Returns the resident set size of this process, in bytes.
+
+    On Linux, it is read from /proc, which is much faster than
+    `get_memory_usage`. Elsewhere, it falls back to `get_memory_usage`.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return get_memory_usage() * 1024
+
+
+def get_peak_rss():
+    """
+    Returns the largest resident set size this process has had so far, in
+    bytes, or the current one if the platform does not keep track of it.
+    """
+    if resource is None:
+        return get_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return peak
+
+
+def get_nbytes(value):
+    """
+    Returns the number of bytes held by an array.
+
+    Parameters
+    ----------
+    value : object
+        A numpy array, a scipy sparse matrix, or any array with `size`
+        and `dtype` attributes, such as a CudaNdarray.
+    """
+    if hasattr(value, 'nbytes'):
+        return value.nbytes
+    if hasattr(value, 'indptr'):
+        # Compressed sparse matrix
+        return (value.data.nbytes + value.indices.nbytes +
+                value.indptr.nbytes)
+    return value.size * np.dtype(value.dtype).itemsize
+
+
+def get_shared_bytes(variables):
+    """
+    Returns the number of bytes held by the values of shared variables,
+    without copying them.
+
+    Parameters
+    ----------
+    variables : list of SharedVariable
+        The variables, e.g. the parameters of a model.
+    """
+    return sum(get_nbytes(var.get_value(borrow=True,
+                                        return_internal_type=True))
+               for var in variables)
+
+
+def get_resident_bytes(obj):
+    """
+    Returns the number of bytes of the numpy arrays that are attributes
+    of `obj`, e.g. the design matrix and targets of a dataset.
+
+    Arrays are counted once even if several attributes hold views of
+    them. Memory-mapped arrays are left out, since their pages are only
+    loaded when they are read, and can be dropped by the system.
+
+    Parameters
+    ----------
+    obj : object
+        The object holding the arrays, typically a `Dataset`.
+    """
+    seen = set()
+    total = 0
+    values = list(getattr(obj, '__dict__', {}).values())
+    while values:
+        value = values.pop()
+        if isinstance(value, (list, tuple)):
+            values.extend(value)
+            continue
+        if isinstance(value, dict):
+            values.extend(value.values())
+            continue
+        if not isinstance(value, np.ndarray):
+            continue
+        base = value
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        if isinstance(base, np.memmap) or id(base) in seen:
+            continue
+        seen.add(id(base))
+        total += base.nbytes
+    return total
+
+
 def improve_memory_error_message(error, msg=""):
     """
     Raises a TypicalMemoryError if the MemoryError has no messages
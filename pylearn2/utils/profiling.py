@@ -0,0 +1,339 @@
+"""
+Measures the time training spends in each of its phases: reading and
+converting the minibatches, running the callbacks, updating the
+parameters, monitoring, running the extensions and saving.
+
+`Train` publishes the totals of each epoch as the monitoring channels
+`profile_<phase>_seconds` when it is built with `profile=True`, and can
+also write every measured interval to a file in the Chrome trace event
+format, which can be opened in chrome://tracing or in Perfetto.
+
+`Reservoir` keeps a fixed-size sample of a stream of durations, such as
+the latencies of the parameter updates, to estimate their percentiles.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from pylearn2.compat import OrderedDict
+from pylearn2.space import NullSpace
+from pylearn2.utils import sharedX, wraps
+from pylearn2.utils.rng import make_np_rng
+from pylearn2.utils.string_utils import preprocess
+
+
+log = logging.getLogger(__name__)
+
+# The phases of training, with the documentation of their channels
+PHASES = OrderedDict([
+    ('fetch', "Seconds spent reading minibatches from the dataset."),
+    ('convert', "Seconds spent converting minibatches to the spaces "
+                "requested by the training algorithm."),
+    ('on_load_batch', "Seconds spent in the on_load_batch callbacks."),
+    ('update', "Seconds spent in the update functions of the training "
+               "algorithm, i.e. computing the gradients and updating the "
+               "parameters."),
+    ('update_callbacks', "Seconds spent in the update callbacks."),
+    ('monitor', "Seconds spent computing the monitoring channels."),
+    ('extensions', "Seconds spent in TrainExtension.on_monitor."),
+    ('save', "Seconds spent saving the model and the checkpoint."),
+])
+
+
+class Profiler(object):
+    """
+    Accumulates the time spent in each phase of training.
+
+    Phases may be nested, e.g. converting a minibatch happens while it is
+    fetched. The time of a phase excludes the time of the phases nested in
+    it, so that the phases never count the same second twice.
+
+    Parameters
+    ----------
+    trace_path : str, optional
+        If specified, every phase is also recorded as an event, and
+        `write_trace` writes the events to this file in the Chrome trace
+        event format.
+    max_trace_events : int, optional
+        The maximum number of events kept in memory. Later events are
+        dropped, and their number is written in the trace.
+    """
+
+    def __init__(self, trace_path=None, max_trace_events=1000000):
+        if trace_path is not None:
+            trace_path = preprocess(trace_path)
+        self.trace_path = trace_path
+        self.max_trace_events = max_trace_events
+        self._seconds = OrderedDict((name, 0.) for name in PHASES)
+        self._shared = OrderedDict()
+        for name, doc in PHASES.items():
+            shared = sharedX(0., name='profile_%s_seconds' % name)
+            shared.__doc__ = doc
+            self._shared[name] = shared
+        # The phases being measured, innermost last, and the time spent
+        # in the phases nested in each of them
+        self._names = []
+        self._nested = []
+        self._events = []
+        self._num_dropped = 0
+        self._origin = time.time()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Returns a context manager measuring the time spent in its block.
+
+        Parameters
+        ----------
+        name : str
+            One of the names of `PHASES`.
+        """
+        if name not in self._seconds:
+            raise ValueError("Unknown phase %s, expected one of %s"
+                             % (name, list(PHASES)))
+        nested = self._nested
+        nested.append(0.)
+        self._names.append(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            self._names.pop()
+            self._seconds[name] += elapsed - nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            if self.trace_path is not None:
+                self._record(name, start, elapsed)
+
+    @property
+    def current_phase(self):
+        """
+        The name of the innermost phase being measured, or None. It may
+        be read from other threads, e.g. to attribute samples to phases.
+        """
+        names = self._names
+        try:
+            return names[-1]
+        except IndexError:
+            return None
+
+    def iterate(self, iterable, name='fetch'):
+        """
+        Iterates over `iterable`, counting the time spent getting each
+        item in a phase.
+
+        Parameters
+        ----------
+        iterable : iterable
+            Typically an iterator over the minibatches of a dataset.
+        name : str, optional
+            The phase in which to count the time.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _record(self, name, start, elapsed):
+        """
+        Records an interval of a phase for the trace.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        start : float
+            The start of the interval, as returned by `time.time`.
+        elapsed : float
+            The length of the interval, in seconds.
+        """
+        if len(self._events) >= self.max_trace_events:
+            self._num_dropped += 1
+            return
+        self._events.append({'name': name, 'cat': 'pylearn2', 'ph': 'X',
+                             'ts': (start - self._origin) * 1e6,
+                             'dur': elapsed * 1e6, 'pid': os.getpid(),
+                             'tid': threading.current_thread().ident})
+
+    def add_channels(self, monitor):
+        """
+        Adds the `profile_<phase>_seconds` channels to a monitor.
+
+        Parameters
+        ----------
+        monitor : Monitor
+            The monitor of the model being trained. It must have at least
+            one dataset.
+        """
+        for shared in self._shared.values():
+            monitor.add_channel(name=shared.name,
+                                ipt=None,
+                                val=shared,
+                                data_specs=(NullSpace(), ''),
+                                dataset=monitor._datasets[0])
+
+    def publish(self):
+        """
+        Sets the channels to the time spent in each phase since the last
+        call, and starts counting again from zero.
+
+        `Train` calls it before each round of monitoring, so the channels
+        report the training phases of the epoch that just ended, and the
+        monitoring, extension and saving phases of the previous epoch,
+        whose duration is not known until its channels are recorded.
+        """
+        for name, seconds in self._seconds.items():
+            self._shared[name].set_value(seconds)
+            self._seconds[name] = 0.
+        if self.trace_path is not None:
+            # Counter events draw the totals of each epoch in the trace
+            args = dict((name, float(shared.get_value()))
+                        for name, shared in self._shared.items())
+            self._events.append({'name': 'profile_seconds', 'ph': 'C',
+                                 'ts': (time.time() - self._origin) * 1e6,
+                                 'pid': os.getpid(), 'args': args})
+
+    def write_trace(self, path=None):
+        """
+        Writes the recorded events in the Chrome trace event format.
+
+        Parameters
+        ----------
+        path : str, optional
+            The file to write. Defaults to `trace_path`. Nothing is
+            written if neither is specified.
+        """
+        if path is None:
+            path = self.trace_path
+        if path is None:
+            return
+        if self._num_dropped > 0:
+            log.warning("%d events were dropped from the trace because it "
+                        "exceeded %d events.", self._num_dropped,
+                        self.max_trace_events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self._events,
+                       'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self._num_dropped}},
+                      f)
+
+
+class _NullPhase(object):
+    """
+    A context manager that does nothing.
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullProfiler(object):
+    """
+    A profiler that measures nothing, used when profiling is disabled so
+    that the training loop does not need to check whether it is enabled.
+    """
+
+    @wraps(Profiler.phase)
+    def phase(self, name):
+        return _NULL_PHASE
+
+    @wraps(Profiler.iterate)
+    def iterate(self, iterable, name='fetch'):
+        return iterable
+
+    # Phases are not tracked
+    current_phase = None
+
+    @wraps(Profiler.add_channels)
+    def add_channels(self, monitor):
+        pass
+
+    @wraps(Profiler.publish)
+    def publish(self):
+        pass
+
+    @wraps(Profiler.write_trace)
+    def write_trace(self, path=None):
+        pass
+
+
+class Reservoir(object):
+    """
+    A uniform random sample of fixed size of the values added to it, from
+    which the percentiles of an arbitrarily long stream of values can be
+    estimated in constant memory.
+
+    Parameters
+    ----------
+    size : int, optional
+        The number of values kept. Percentiles are exact while fewer
+        values have been added.
+    seed : int, list or RandomState, optional
+        Seed of the random number generator choosing the values kept.
+    """
+
+    def __init__(self, size=1000, seed=None):
+        if size < 1:
+            raise ValueError("size must be at least 1, got %d" % size)
+        self.size = size
+        self._values = np.zeros(size)
+        self._count = 0
+        self._rng = make_np_rng(seed, [2015, 3, 17], which_method='randint')
+
+    def add(self, value):
+        """
+        Adds a value to the stream. Every value of the stream has the
+        same probability of being kept.
+
+        Parameters
+        ----------
+        value : float
+            The new value.
+        """
+        count = self._count
+        if count < self.size:
+            self._values[count] = value
+        else:
+            index = self._rng.randint(count + 1)
+            if index < self.size:
+                self._values[index] = value
+        self._count = count + 1
+
+    def clear(self):
+        """
+        Forgets all the values, e.g. at the start of an epoch.
+        """
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.size)
+
+    def percentile(self, q):
+        """
+        Returns an estimate of a percentile of the stream, or NaN if no
+        value was added.
+
+        Parameters
+        ----------
+        q : float
+            The percentile to compute, between 0 and 100.
+        """
+        if self._count == 0:
+            return np.nan
+        return float(np.percentile(self._values[:len(self)], q))
@@ -14,7 +14,10 @@ __email__ = "bouthilx@iro"
 import numpy
 from theano.compat import six
 
-from theano.sandbox.rng_mrg import MRG_RandomStreams as RandomStreams
+from pylearn2.utils.lazy_import import lazy_import
+
+# Imported on first use: theano.sandbox.rng_mrg imports the CUDA backend
+rng_mrg = lazy_import('theano.sandbox.rng_mrg')
 # more distributions but slower
 # from theano.tensor.shared_randomstreams import RandomStreams
 
@@ -121,4 +124,5 @@ def make_theano_rng(rng_or_seed=None, default_seed=None, which_method=None):
     4) RandomState(42)
     """
 
-    return make_rng(rng_or_seed, default_seed, which_method, RandomStreams)
+    return make_rng(rng_or_seed, default_seed, which_method,
+                    rng_mrg.MRG_RandomStreams)
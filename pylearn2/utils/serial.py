@@ -7,15 +7,21 @@ try:
     from cPickle import BadPickleGet
 except ImportError:
     BadPickleGet = KeyError
+import copy
 import pickle
 import logging
 import numpy as np
 from theano.compat import six
 from theano.compat.six.moves import cPickle, xrange
 import os
+import re
 import time
 import warnings
 import sys
+import threading
+import uuid
+import weakref
+from theano.gof import Container
 from pylearn2.utils.string_utils import preprocess
 from pylearn2.utils.mem import improve_memory_error_message
 io = None
@@ -24,9 +30,24 @@ import struct
 from pylearn2.utils.exc import reraise_as
 from pylearn2.utils.string_utils import match
 import shutil
+import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Suffix of the paths of array directories, see `save`
+ARRAY_DIR_SUFFIX = '.pkld'
+# Name of the pickled object graph in an array directory
+ARRAY_DIR_MANIFEST = 'manifest.pkl'
+# Arrays smaller than this are pickled in the manifest rather than stored
+# in their own file, to avoid a file per monitoring record
+ARRAY_DIR_MIN_BYTES = 1024
+# Lists the array files referenced by the manifest of an array directory
+ARRAY_DIR_INDEX = 'arrays.txt'
+
+# Maps the absolute paths of array directories to the arrays written to
+# them by the last save in this process, see `_save_array_dir`
+_array_dir_written = {}
+
 
 def raise_cannot_open(path):
     """
@@ -65,7 +86,7 @@ def raise_cannot_open(path):
     assert False
 
 
-def load(filepath, recurse_depth=0, retry=True):
+def load(filepath, recurse_depth=0, retry=True, mmap_mode='c'):
     """
     Loads object(s) from file specified by 'filepath'.
 
@@ -88,7 +109,16 @@ def load(filepath, recurse_depth=0, retry=True):
         training script--sometimes the load attempt might fail if the
         training script writes at the same time show_weights tries to
         read, but if you try again after a few seconds you should be able
-        to open the file.
+        to open the file. Files written by `save` are replaced
+        atomically, so this only matters for files written by other
+        means.
+    mmap_mode : str or None, optional
+        How to load the arrays of an array directory (see `save`). By
+        default, they are memory-mapped copy-on-write ('c'): loading
+        takes no time, pages are read from disk as they are accessed and
+        modifying an array does not modify the file. Any other
+        `numpy.load` mmap_mode is accepted; None reads the arrays into
+        memory.
 
     Returns
     -------
@@ -106,6 +136,9 @@ def load(filepath, recurse_depth=0, retry=True):
     if filepath.endswith('.npy') or filepath.endswith('.npz'):
         return np.load(filepath)
 
+    if filepath.endswith(ARRAY_DIR_SUFFIX):
+        return _load_array_dir(filepath, mmap_mode)
+
     if filepath.endswith('.amat') or filepath.endswith('txt'):
         try:
             return np.loadtxt(filepath)
@@ -171,9 +204,12 @@ def load(filepath, recurse_depth=0, retry=True):
         if os.path.splitext(filepath)[1] == ".pkl":
             improve_memory_error_message(e, 
                 "You do not have enough memory to open %s \n"
-                " + Try using numpy.{save,load} (file with extension '.npy') "
-                "to save your file. It uses less memory when reading and "
-                "writing files than pickled files." % filepath)
+                " + Try saving your object to an array directory (path "
+                "with extension '%s'), whose arrays are memory-mapped "
+                "when loading, or using numpy.{save,load} (file with "
+                "extension '.npy'). They use less memory when reading and "
+                "writing files than pickled files."
+                % (filepath, ARRAY_DIR_SUFFIX))
         else:
             improve_memory_error_message(e, 
                 "You do not have enough memory to open %s" % filepath)
@@ -203,18 +239,35 @@ def load(filepath, recurse_depth=0, retry=True):
 
     return obj
 
-def save(filepath, obj, on_overwrite = 'ignore'):
+def save(filepath, obj, on_overwrite='ignore', keep_versions=None):
     """
     Serialize `object` to a file denoted by `filepath`.
 
+    The object is first written to a temporary file in the same
+    directory, which is flushed to disk and then renamed over
+    `filepath`. Readers thus always find either the previous version of
+    the file or the new one, never a partially written one, and a crash
+    while saving leaves the previous version intact.
+
     Parameters
     ----------
     filepath : str
         A filename. If the suffix is `.joblib` and joblib can be
         imported, `joblib.dump` is used in place of the regular
         pickling mechanisms; this results in much faster saves by
-        saving arrays as separate .npy files on disk. If the file
+        saving arrays as separate .npy files on disk. These files are
+        replaced right before the file itself, so a reader may see
+        them change while the file is saved. If the file
         suffix is `.npy` than `numpy.save` is attempted on `obj`.
+        If the suffix is `.pkld`, `obj` is saved as an array directory:
+        each large numpy array it contains (such as the values of the
+        shared variables of a model) is stored in its own `.npy` file,
+        and the rest of the object graph is pickled into a manifest that
+        refers to these files. `load` memory-maps the arrays. Saving
+        again to the same directory, or to a new version of it with
+        `keep_versions`, reuses the files of the arrays it already
+        wrote, except for the values of shared variables, which Theano
+        updates in place.
         Otherwise, (c)pickle is used.
 
     obj : object
@@ -225,27 +278,239 @@ def save(filepath, obj, on_overwrite = 'ignore'):
         Possible values include:
 
         - "ignore" : Just overwrite the existing file.
-        - "backup" : Make a backup copy of the file (<filepath>.bak).
-          Save the new copy. Then delete the backup copy. This allows
-          recovery of the old version of the file if saving the new one
-          fails.
+        - "backup" : Kept for backward compatibility. Since the
+          existing file is only replaced once the new one is completely
+          written, it is the same as "ignore".
+
+    keep_versions : int, optional
+        If specified, `obj` is saved to a new numbered version of
+        `filepath` (`model.pkl` is saved to `model.1.pkl`, then
+        `model.2.pkl`, etc.), `filepath` is atomically made a symbolic
+        link to this latest version, and only the `keep_versions` most
+        recent versions are kept.
     """
     filepath = preprocess(filepath)
 
-    if os.path.exists(filepath):
-        if on_overwrite == 'backup':
-            backup = filepath + '.bak'
-            shutil.move(filepath, backup)
-            save(filepath, obj)
-            try:
-                os.remove(backup)
-            except Exception as e:
-                warnings.warn("Got an error while traing to remove "+backup+":"+str(e))
+    if on_overwrite not in ('ignore', 'backup'):
+        raise ValueError("on_overwrite should be 'ignore' or 'backup', "
+                         "got " + str(on_overwrite))
+
+    if keep_versions is not None:
+        _save_version(filepath, obj, keep_versions)
+        return
+
+    if filepath.endswith(ARRAY_DIR_SUFFIX):
+        # Array directories are updated atomically by replacing their
+        # manifest
+        _save_allowing_recursion(filepath, obj)
+        return
+
+    if filepath.endswith('.joblib'):
+        _save_joblib(filepath, obj)
+        return
+
+    tmp_path = _temporary_path(filepath)
+    try:
+        _save_allowing_recursion(tmp_path, obj)
+        _fsync(tmp_path)
+        _replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    try:
+        # Make the rename itself durable
+        _fsync(os.path.dirname(filepath) or '.')
+    except OSError:
+        # Directories cannot be opened on every platform
+        pass
+
+
+def _save_joblib(filepath, obj):
+    """
+    Implements `save` for `.joblib` files.
+
+    `joblib.dump` writes the arrays of the object to companion files,
+    named after the file, to which the file refers by name. They are
+    all written to a temporary directory, then moved next to
+    `filepath`, the file itself last, and the companion files left by
+    the previous save are removed. A reader loading the file while it
+    is saved may thus find companion files of the new version. Without
+    joblib, the file is pickled and moved the same way.
+
+    Parameters
+    ----------
+    filepath : str
+        The destination file.
+    obj : object
+        The object to save.
+    """
+    directory, filename = os.path.split(filepath)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp', dir=directory or '.')
+    try:
+        _save_allowing_recursion(os.path.join(tmp_dir, filename), obj)
+        # False sorts first, so the file itself is moved last
+        names = sorted(os.listdir(tmp_dir), key=lambda name: name == filename)
+        for name in names:
+            _fsync(os.path.join(tmp_dir, name))
+            _replace(os.path.join(tmp_dir, name),
+                     os.path.join(directory, name))
+    finally:
+        shutil.rmtree(tmp_dir)
+    companion = re.compile(re.escape(filename) + r'_\d+\.npy')
+    for name in os.listdir(directory or '.'):
+        if companion.match(name) and name not in names:
+            os.remove(os.path.join(directory, name))
+
+
+def _temporary_path(filepath):
+    """
+    Returns the path of a temporary file to write `filepath` to before
+    renaming it. It is in the same directory, so that the rename is
+    atomic, and has the same extension, which `save` uses to choose the
+    format.
+
+    Parameters
+    ----------
+    filepath : str
+        The destination file.
+    """
+    directory, filename = os.path.split(filepath)
+    return os.path.join(directory, '.tmp%d.%s' % (os.getpid(), filename))
+
+
+def _fsync(path):
+    """
+    Flushes the file or directory at `path` to disk.
+
+    Parameters
+    ----------
+    path : str
+        The file or directory to flush.
+    """
+    if os.path.isdir(path):
+        if os.name == 'nt':
+            # Directories cannot be opened, nor flushed, on Windows
             return
+        flags = os.O_RDONLY
+    else:
+        # Windows only flushes files opened for writing
+        flags = os.O_RDWR
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace(src, dst):
+    """
+    Renames `src` to `dst`, replacing `dst` if it exists.
+
+    `os.rename` already does so atomically on POSIX systems, but fails
+    on Windows if `dst` exists. There, without `os.replace` (Python 2),
+    `dst` is removed first, so a crash in between can leave no file at
+    `dst`.
+
+    Parameters
+    ----------
+    src : str
+        The file to rename.
+    dst : str
+        The new path of the file.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    if os.name == 'nt' and os.path.lexists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _list_versions(filepath):
+    """
+    Returns the numbered versions of `filepath` saved by `save` with
+    `keep_versions`, as a list of (number, path) pairs sorted by number.
+
+    Parameters
+    ----------
+    filepath : str
+        The path of the link to the latest version.
+    """
+    directory, filename = os.path.split(filepath)
+    root, ext = os.path.splitext(filename)
+    pattern = re.compile(re.escape(root) + r'\.(\d+)' + re.escape(ext) + '$')
+    versions = []
+    for name in os.listdir(directory or '.'):
+        match_obj = pattern.match(name)
+        if match_obj is not None:
+            versions.append((int(match_obj.group(1)),
+                             os.path.join(directory, name)))
+    return sorted(versions)
+
+
+def _save_version(filepath, obj, keep_versions):
+    """
+    Implements the `keep_versions` option of `save`.
+
+    Parameters
+    ----------
+    filepath : str
+        The path of the link to the latest version.
+    obj : object
+        The object to save.
+    keep_versions : int
+        The number of versions to keep.
+    """
+    if keep_versions < 1:
+        raise ValueError("keep_versions must be at least 1, got " +
+                         str(keep_versions))
+    directory = os.path.dirname(filepath)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory)
+    versions = _list_versions(filepath)
+    number = versions[-1][0] + 1 if versions else 1
+    root, ext = os.path.splitext(filepath)
+    version_path = '%s.%d%s' % (root, number, ext)
+    if versions and version_path.endswith(ARRAY_DIR_SUFFIX):
+        _seed_array_dir(version_path, versions[-1][1])
+    save(version_path, obj)
+
+    if hasattr(os, 'symlink'):
+        if os.path.isdir(filepath) and not os.path.islink(filepath):
+            # An array directory saved without versions: a link cannot
+            # be renamed over it
+            shutil.rmtree(filepath)
+        tmp_link = _temporary_path(filepath)
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.basename(version_path), tmp_link)
+        _replace(tmp_link, filepath)
+    else:
+        save(filepath, obj)
+
+    versions.append((number, version_path))
+    for _, old_path in versions[:-keep_versions]:
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+            _array_dir_written.pop(os.path.abspath(old_path), None)
         else:
-            assert on_overwrite == 'ignore'
+            os.remove(old_path)
 
 
+def _save_allowing_recursion(filepath, obj):
+    """
+    Calls `_save`, raising the recursion limit if pickling the object
+    exceeds it.
+
+    Parameters
+    ----------
+    filepath : str
+        The file to write.
+    obj : object
+        The object to save.
+    """
     try:
         _save(filepath, obj)
     except RuntimeError as e:
@@ -272,6 +537,8 @@ def save(filepath, obj, on_overwrite = 'ignore'):
                 _save(filepath, obj)
             finally:
                 sys.setrecursionlimit(old_limit)
+        else:
+            raise
 
 def get_pickle_protocol():
     """
@@ -307,6 +574,9 @@ def _save(filepath, obj):
     if filepath.endswith('.npy'):
         np.save(filepath, obj)
         return
+    if filepath.endswith(ARRAY_DIR_SUFFIX):
+        _save_array_dir(filepath, obj)
+        return
     # This is dumb
     # assert filepath.endswith('.pkl')
     save_dir = os.path.dirname(filepath)
@@ -372,6 +642,300 @@ def _save(filepath, obj):
                        ' is really big?)'.format(filepath, e))
 
 
+def _read_array_dir_index(dirpath):
+    """
+    Returns the names of the array files referenced by the manifest of
+    an array directory, as listed in its index.
+
+    Parameters
+    ----------
+    dirpath : str
+        The array directory.
+    """
+    index_path = os.path.join(dirpath, ARRAY_DIR_INDEX)
+    if not os.path.exists(index_path):
+        # Written by an older version: every array file may be in use
+        return set(name for name in os.listdir(dirpath)
+                   if name.endswith('.npy'))
+    with open(index_path) as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def _save_array_dir(dirpath, obj):
+    """
+    Saves `obj` to an array directory, see `save`.
+
+    Arrays that hold the value of a shared variable are written on every
+    save, since Theano updates them in place. Other arrays are assumed
+    not to be modified in place: if an array is the very object written
+    by the previous save to the same directory in this process (or to
+    the directory it was seeded from by `_seed_array_dir`), its file is
+    reused rather than written again. Only weak references to these
+    arrays are kept between saves.
+
+    The new manifest is then renamed over the old one, which atomically
+    switches readers to the new version. Array files are deleted once
+    neither this manifest nor the previous one refers to them, so that
+    processes still loading the previous version can finish.
+
+    Parameters
+    ----------
+    dirpath : str
+        The array directory.
+    obj : object
+        The object to save.
+    """
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    for path in list(_array_dir_written):
+        if not os.path.isdir(path):
+            del _array_dir_written[path]
+    written = _array_dir_written.get(os.path.abspath(dirpath), {})
+    live = set()
+    referenced = {}
+
+    def persistent_id(value):
+        if isinstance(value, Container):
+            live.add(id(value.storage[0]))
+            return None
+        if (not isinstance(value, np.ndarray) or value.dtype.hasobject or
+                value.nbytes < ARRAY_DIR_MIN_BYTES):
+            return None
+        key = id(value)
+        if key in referenced:
+            return referenced[key][1]
+        name = None
+        if key not in live and key in written:
+            ref, old_name, shape, dtype = written[key]
+            if (ref() is value and shape == value.shape and
+                    dtype == value.dtype.str and
+                    os.path.exists(os.path.join(dirpath, old_name))):
+                name = old_name
+        if name is None:
+            name = uuid.uuid4().hex + '.npy'
+            tmp_path = os.path.join(dirpath, '.tmp.' + name)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, value)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(tmp_path, os.path.join(dirpath, name))
+        # Holding the array keeps its id from being reused
+        referenced[key] = (value, name, value.shape, value.dtype.str)
+        return name
+
+    manifest_path = os.path.join(dirpath, ARRAY_DIR_MANIFEST)
+    tmp_path = os.path.join(dirpath, '.tmp.' + ARRAY_DIR_MANIFEST)
+    with open(tmp_path, 'wb') as f:
+        pickler = cPickle.Pickler(f, get_pickle_protocol())
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        f.flush()
+        os.fsync(f.fileno())
+    previous = _read_array_dir_index(dirpath)
+    if not os.path.exists(manifest_path):
+        # Files put there by `_seed_array_dir` are not in use yet
+        previous -= set(entry[1] for entry in six.itervalues(written))
+    names = set(entry[1] for entry in six.itervalues(referenced))
+    index_path = os.path.join(dirpath, ARRAY_DIR_INDEX)
+    tmp_index_path = os.path.join(dirpath, '.tmp.' + ARRAY_DIR_INDEX)
+    with open(tmp_index_path, 'w') as f:
+        f.write(''.join(name + '\n' for name in sorted(names)))
+        f.flush()
+        os.fsync(f.fileno())
+    _replace(tmp_path, manifest_path)
+    _replace(tmp_index_path, index_path)
+    _array_dir_written[os.path.abspath(dirpath)] = dict(
+        (key, (weakref.ref(value), name, shape, dtype))
+        for key, (value, name, shape, dtype) in six.iteritems(referenced)
+        if key not in live)
+
+    for name in os.listdir(dirpath):
+        if (name.endswith('.npy') and name not in names and
+                name not in previous):
+            os.remove(os.path.join(dirpath, name))
+
+
+def _seed_array_dir(dirpath, previous_dirpath):
+    """
+    Prepares a new array directory to reuse the array files of another
+    one, e.g. the previous version saved with `keep_versions`: the files
+    of the arrays written to `previous_dirpath` by the last save in this
+    process that are still alive are hard-linked (or, without hard
+    links, copied) into `dirpath`, and `_save_array_dir` reuses them
+    for the same arrays. Those it does not reuse are deleted.
+
+    Parameters
+    ----------
+    dirpath : str
+        The new array directory.
+    previous_dirpath : str
+        The array directory to reuse the files of.
+    """
+    written = _array_dir_written.pop(os.path.abspath(previous_dirpath), {})
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    seeded = {}
+    for key, entry in six.iteritems(written):
+        ref, name = entry[:2]
+        src = os.path.join(previous_dirpath, name)
+        dst = os.path.join(dirpath, name)
+        if ref() is None or not os.path.exists(src):
+            continue
+        if not os.path.exists(dst):
+            try:
+                os.link(src, dst)
+            except (AttributeError, OSError):
+                # No hard links on this platform or file system
+                shutil.copyfile(src, dst)
+        seeded[key] = entry
+    _array_dir_written[os.path.abspath(dirpath)] = seeded
+
+
+def _load_array_dir(dirpath, mmap_mode):
+    """
+    Loads an object saved by `_save_array_dir`.
+
+    Parameters
+    ----------
+    dirpath : str
+        The array directory.
+    mmap_mode : str or None
+        Passed to `numpy.load` to load the arrays.
+    """
+    manifest_path = os.path.join(dirpath, ARRAY_DIR_MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise_cannot_open(manifest_path)
+
+    def persistent_load(name):
+        return np.load(os.path.join(dirpath, name), mmap_mode=mmap_mode)
+
+    with open(manifest_path, 'rb') as f:
+        unpickler = cPickle.Unpickler(f)
+        unpickler.persistent_load = persistent_load
+        obj = unpickler.load()
+    if not hasattr(obj, 'yaml_src'):
+        try:
+            obj.yaml_src = '!pkl: "' + os.path.abspath(dirpath) + '"'
+        except Exception:
+            pass
+    return obj
+
+
+class AsyncSaver(object):
+    """
+    Saves objects to disk in background threads, so that the caller can
+    go on working while they are serialized and written.
+
+    Objects are written with `save`, so readers always find either the
+    previous version of a file or the new one, never a partially written
+    one. Saves are completed in the order they were requested.
+
+    Parameters
+    ----------
+    max_pending : int, optional
+        The maximum number of saves that may be in progress at once.
+        `save` blocks until a previous save completes when this bound
+        is reached, which bounds the memory held by pending objects.
+
+    Notes
+    -----
+    Objects that keep changing after `save` returns must be saved with
+    `snapshot=True` (or `replace`), which deep-copies them in the
+    calling thread, so that the saved object is consistent. Only the
+    pickling and the writing of the copy happen in the background.
+    """
+
+    def __init__(self, max_pending=1):
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1, got " +
+                             str(max_pending))
+        self.max_pending = max_pending
+        self._slots = threading.Semaphore(max_pending)
+        self._last_thread = None
+        self._error = None
+
+    def save(self, filepath, obj, keep_versions=None, snapshot=False,
+             replace=None):
+        """
+        Starts saving `obj` to `filepath` with `serial.save`.
+
+        Parameters
+        ----------
+        filepath : str
+            The destination file.
+        obj : object
+            The object to save.
+        keep_versions : int, optional
+            Passed to `serial.save`.
+        snapshot : bool, optional
+            If True, `obj` is deep-copied before this method returns,
+            and the copy is saved, so that `obj` may change in the
+            meantime.
+        replace : dict, optional
+            Maps objects reachable from `obj` to the objects saved in
+            their place. Implies `snapshot`.
+        """
+        self._raise_errors()
+        if snapshot or replace:
+            memo = {}
+            if replace is not None:
+                for original, substitute in six.iteritems(replace):
+                    memo[id(original)] = substitute
+            obj = copy.deepcopy(obj, memo)
+        self._slots.acquire()
+        thread = threading.Thread(target=self._write,
+                                  args=(preprocess(filepath), obj,
+                                        keep_versions, self._last_thread),
+                                  name='AsyncSaver')
+        thread.start()
+        self._last_thread = thread
+
+    def _write(self, filepath, obj, keep_versions, previous):
+        """
+        Body of the threads started by `save`.
+
+        Parameters
+        ----------
+        filepath : str
+            The destination file.
+        obj : object
+            The object to save.
+        keep_versions : int or None
+            Passed to `serial.save`.
+        previous : threading.Thread or None
+            The thread of the previous save, which must complete first.
+        """
+        try:
+            if previous is not None:
+                previous.join()
+            save(filepath, obj, keep_versions=keep_versions)
+        except Exception:
+            logger.exception("Failed to save " + filepath)
+            self._error = sys.exc_info()
+        finally:
+            self._slots.release()
+
+    def _raise_errors(self):
+        """
+        Raises the last error that occurred in a background save, if it
+        was not raised yet.
+        """
+        exc_info = self._error
+        if exc_info is not None:
+            self._error = None
+            six.reraise(*exc_info)
+
+    def wait(self):
+        """
+        Blocks until every save that was started is complete, and raises
+        the last error that occurred in them, if any.
+        """
+        if self._last_thread is not None:
+            self._last_thread.join()
+            self._last_thread = None
+        self._raise_errors()
+
+
 def clone_via_serialize(obj):
     """
     .. todo::
@@ -0,0 +1,91 @@
+"""
+Tests for pylearn2.utils.function_cache
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import theano
+from theano import tensor as T
+
+from pylearn2.utils import function_cache, sharedX
+from pylearn2.utils.function_cache import get_mode
+
+
+def compile_update(init):
+    """
+    Builds a gradient step on a new shared variable.
+
+    Every call builds the same graph.
+
+    Parameters
+    ----------
+    init : float
+        The initial value of the elements of the shared variable.
+
+    Returns
+    -------
+    W : SharedVariable
+        The shared variable updated by the function.
+    f : theano function
+        Takes a matrix, returns the cost and updates `W`.
+    """
+    W = sharedX(np.ones((3, 2)) * init)
+    x = T.matrix()
+    cost = T.sqr(T.dot(x, W)).sum()
+    f = theano.function([x], cost, updates=[(W, W - .1 * T.grad(cost, W))],
+                        mode=get_mode())
+    return W, f
+
+
+def test_function_cache():
+    """
+    Tests that a function compiled twice reuses the cached graph and acts
+    on its own shared variables.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    old_value = os.environ.get('PYLEARN2_FUNCTION_CACHE')
+    loaded = []
+    load_graph = function_cache._load_graph
+
+    def record_load(path):
+        rval = load_graph(path)
+        loaded.append(rval is not None)
+        return rval
+
+    function_cache._load_graph = record_load
+    try:
+        os.environ['PYLEARN2_FUNCTION_CACHE'] = tmp_dir
+        x = np.ones((4, 3), dtype=theano.config.floatX)
+        W1, f1 = compile_update(1.)
+        assert len(os.listdir(tmp_dir)) == 1
+        W2, f2 = compile_update(2.)
+        assert len(os.listdir(tmp_dir)) == 1
+        assert loaded == [False, True]
+
+        np.testing.assert_allclose(f1(x), 72.)
+        np.testing.assert_allclose(W1.get_value(), -1.4)
+        np.testing.assert_allclose(f2(x), 288.)
+        np.testing.assert_allclose(W2.get_value(), -2.8)
+        np.testing.assert_allclose(W1.get_value(), -1.4)
+    finally:
+        function_cache._load_graph = load_graph
+        if old_value is None:
+            del os.environ['PYLEARN2_FUNCTION_CACHE']
+        else:
+            os.environ['PYLEARN2_FUNCTION_CACHE'] = old_value
+        shutil.rmtree(tmp_dir)
+
+
+def test_disabled():
+    """
+    Tests that the mode is left alone when the cache is disabled.
+    """
+    old_value = os.environ.pop('PYLEARN2_FUNCTION_CACHE', None)
+    try:
+        assert get_mode() is None
+        assert get_mode('FAST_RUN') == 'FAST_RUN'
+    finally:
+        if old_value is not None:
+            os.environ['PYLEARN2_FUNCTION_CACHE'] = old_value
@@ -15,6 +15,7 @@ from pylearn2.utils.iteration import (
     BatchwiseShuffledSequentialIterator,
     as_even,
     EvenSequencesSubsetIterator,
+    ShardedSubsetIterator,
 )
 
 
@@ -252,3 +253,37 @@ def test_determinism_even_sequences():
         for i in ind_list:
             visited2[i] = b_ind
     assert np.all(np.asarray(visited1) == np.asarray(visited2))
+
+
+def test_sharded_subset_iterator():
+    """
+    Checks that the shards of an iterator are disjoint and cover all of
+    its batches, and that they count their own examples.
+    """
+    dataset_size = 20
+    batch_size = 3
+    num_shards = 3
+    batches = list(ShuffledSequentialSubsetIterator(dataset_size, batch_size,
+                                                    None, rng=5))
+    for shard in range(num_shards):
+        iterator = ShardedSubsetIterator(
+            ShuffledSequentialSubsetIterator(dataset_size, batch_size,
+                                             None, rng=5),
+            shard, num_shards)
+        assert iterator.uneven
+        num_examples = iterator.num_examples
+        shard_batches = list(iterator)
+        assert len(shard_batches) == iterator.num_batches
+        assert num_examples == sum(len(batch) for batch in shard_batches)
+        expected = batches[shard::num_shards]
+        assert len(shard_batches) == len(expected)
+        for batch, expected_batch in zip(shard_batches, expected):
+            assert np.all(batch == expected_batch)
+    assert_raises(ValueError, ShardedSubsetIterator,
+                  SequentialSubsetIterator(10, 3, None), 3, 3)
+
+    dataset = DenseDesignMatrix(X=np.zeros((dataset_size, 2)))
+    iterator = dataset.iterator(mode='sequential', batch_size=batch_size)
+    iterator.shard(1, num_shards)
+    assert iterator.uneven
+    assert iterator.num_examples == sum(len(batch) for batch in iterator)
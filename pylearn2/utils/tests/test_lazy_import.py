@@ -0,0 +1,73 @@
+"""
+Tests for pylearn2.utils.lazy_import
+"""
+import subprocess
+import sys
+
+from pylearn2.utils.lazy_import import (LazyModule, is_available,
+                                        lazy_class, lazy_import)
+
+
+def test_lazy_import():
+    """
+    Tests that a LazyModule imports its module on first use only.
+    """
+    name = 'pylearn2.utils.tests.lazy_import_target'
+    assert lazy_import('sys') is sys
+
+    module = lazy_import('xml.dom.minidom')
+    if 'xml.dom.minidom' not in sys.modules:
+        assert isinstance(module, LazyModule)
+        assert module.parseString('<a/>').documentElement.tagName == 'a'
+        assert 'xml.dom.minidom' in sys.modules
+
+    missing = lazy_import(name)
+    assert isinstance(missing, LazyModule)
+    assert not is_available(missing)
+    assert not is_available(None)
+    assert is_available(sys)
+    try:
+        missing.anything
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("Using a missing module should raise "
+                             "ImportError.")
+
+
+def test_lazy_class():
+    """
+    Tests that lazy_class only matches instances once the module is
+    imported, and does not import it.
+    """
+    missing = lazy_class('pylearn2.utils.tests.lazy_import_target', 'Foo')
+    assert not isinstance(object(), missing)
+    assert not issubclass(int, missing)
+    assert 'pylearn2.utils.tests.lazy_import_target' not in sys.modules
+
+    fraction = lazy_class('fractions', 'Fraction')
+    import fractions
+    assert isinstance(fractions.Fraction(1, 2), fraction)
+    assert isinstance(fractions.Fraction(1, 2), (int, fraction))
+    assert not isinstance(.5, fraction)
+    assert issubclass(fractions.Fraction, fraction)
+
+
+def test_no_heavy_imports():
+    """
+    Tests that importing the MLP and the monitor does not import the
+    modules that pylearn2 only imports on first use.
+    """
+    heavy = ['matplotlib', 'PIL', 'yaml', 'theano.sandbox.cuda',
+             'theano.sandbox.rng_mrg', 'theano.tensor.signal.downsample',
+             'pylearn2.costs']
+    code = ("import sys\n"
+            "import pylearn2.models.mlp, pylearn2.monitor, pylearn2.train\n"
+            "print([name for name in %r "
+            "if sys.modules.get(name) is not None])" % heavy)
+    process = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    assert process.returncode == 0
+    imported = output.decode('utf-8').strip().splitlines()[-1]
+    assert imported == '[]', imported
@@ -1,10 +1,15 @@
 """
 Tests for pylearn2.utils.mem functions and classes.
 """
+import numpy as np
 
-
+from pylearn2.utils import sharedX
 from pylearn2.utils.mem import (
     TypicalMemoryError,
+    get_peak_rss,
+    get_resident_bytes,
+    get_rss,
+    get_shared_bytes,
     improve_memory_error_message
 )
 
@@ -35,3 +40,27 @@ def test_improve_memory_error_message():
         improve_memory_error_message(MemoryError("test"), "should not")
     except MemoryError as e:
         assert str(e) == "test"
+
+
+def test_memory_sizes():
+    """
+    Tests the functions measuring the memory held by a process, shared
+    variables and the arrays of an object.
+    """
+    rss = get_rss()
+    assert rss > 0
+    assert get_peak_rss() >= rss
+
+    W = sharedX(np.zeros((10, 20)))
+    b = sharedX(np.zeros(20))
+    assert get_shared_bytes([W, b]) == 220 * np.dtype(W.dtype).itemsize
+
+    class Holder(object):
+        pass
+
+    holder = Holder()
+    holder.X = np.zeros((10, 5))
+    holder.X_view = holder.X[:5]
+    holder.arrays = [np.zeros(3, dtype='int32')]
+    holder.name = 'holder'
+    assert get_resident_bytes(holder) == 50 * 8 + 3 * 4
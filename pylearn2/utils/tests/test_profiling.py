@@ -0,0 +1,71 @@
+"""
+Tests for pylearn2.utils.profiling
+"""
+import time
+
+import numpy as np
+
+from pylearn2.utils.profiling import NullProfiler, Profiler, Reservoir
+
+
+def test_nested_phases():
+    """
+    Tests that the time of a phase excludes the phases nested in it.
+    """
+    profiler = Profiler()
+    start = time.time()
+    with profiler.phase('fetch'):
+        time.sleep(.01)
+        with profiler.phase('convert'):
+            time.sleep(.02)
+    for batch in profiler.iterate(range(3)):
+        time.sleep(.001)
+    elapsed = time.time() - start
+    profiler.publish()
+    fetch = profiler._shared['fetch'].get_value()
+    convert = profiler._shared['convert'].get_value()
+    assert fetch >= .01, fetch
+    assert convert >= .02, convert
+    # The time spent converting is not counted twice
+    assert fetch + convert <= elapsed + 1e-3, (fetch, convert, elapsed)
+
+    # publish starts counting from zero again
+    profiler.publish()
+    assert profiler._shared['fetch'].get_value() == 0
+
+
+def test_unknown_phase():
+    """
+    Tests that measuring an unknown phase raises ValueError.
+    """
+    for profiler in [Profiler(), NullProfiler()]:
+        try:
+            with profiler.phase('unknown'):
+                pass
+        except ValueError:
+            assert isinstance(profiler, Profiler)
+        else:
+            assert isinstance(profiler, NullProfiler)
+    assert list(NullProfiler().iterate([1, 2])) == [1, 2]
+
+
+def test_reservoir():
+    """
+    Tests that a Reservoir keeps a fixed number of values sampled from
+    the whole stream.
+    """
+    reservoir = Reservoir(size=100, seed=0)
+    assert np.isnan(reservoir.percentile(50))
+    for value in range(10):
+        reservoir.add(value)
+    assert len(reservoir) == 10
+    assert reservoir.percentile(50) == 4.5
+    assert reservoir.percentile(100) == 9
+
+    reservoir.clear()
+    for value in range(10000):
+        reservoir.add(value)
+    assert len(reservoir) == 100
+    # The sample covers the whole stream, not only its start
+    assert 3000 < reservoir.percentile(50) < 7000
+    assert reservoir.percentile(99) > 9000
@@ -2,8 +2,15 @@
 Tests for the pylearn2.utils.serial module. Currently only tests
 read_bin_lush_matrix and load_train_file methods.
 """
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
 from theano.compat.six.moves import xrange
 import pylearn2
+from pylearn2.utils import serial, sharedX
 from pylearn2.utils.serial import read_bin_lush_matrix, load_train_file
 import numpy as np
 
@@ -135,3 +142,291 @@ def test_load_train_file():
     }
     load_train_file(yaml_path + 'test_model.yaml')
     load_train_file(yaml_path + 'test_model.yaml', environ=environ)
+
+
+def test_async_saver():
+    """
+    Saves several objects in the background and checks that the last one
+    wins and that no temporary file is left behind.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkl')
+        saver = serial.AsyncSaver(max_pending=2)
+        for i in xrange(5):
+            saver.save(path, {'step': i, 'value': np.arange(i + 1)})
+        saver.wait()
+        obj = serial.load(path)
+        assert obj['step'] == 4
+        assert np.all(obj['value'] == np.arange(5))
+        assert os.listdir(tmp_dir) == ['obj.pkl']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+class _Gate(object):
+    """
+    Blocks the pickling of the objects holding it until it is opened.
+    Copies of it are the gate itself.
+    """
+
+    def __init__(self):
+        self.opened = threading.Event()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        self.opened.wait()
+        return {}
+
+
+def test_async_saver_snapshot():
+    """
+    Checks that background saves with snapshot=True hold the state that
+    the object had when they were started.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkl')
+        var = sharedX(np.zeros(3))
+        obj = {'var': var, 'gate': _Gate(), 'seen': [0]}
+        saver = serial.AsyncSaver()
+        saver.save(path, obj, snapshot=True)
+        var.set_value(np.ones(3, dtype=var.dtype))
+        obj['seen'].append(1)
+        obj['gate'].opened.set()
+        saver.wait()
+        saved = serial.load(path)
+        assert np.all(saved['var'].get_value() == 0)
+        assert saved['seen'] == [0]
+        assert np.all(var.get_value() == 1)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_async_saver_error():
+    """
+    Checks that errors in background saves are raised by wait.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        not_a_dir = os.path.join(tmp_dir, 'file')
+        with open(not_a_dir, 'w') as f:
+            f.write('')
+        saver = serial.AsyncSaver()
+        saver.save(os.path.join(not_a_dir, 'obj.pkl'), 1)
+        try:
+            saver.wait()
+        except (IOError, OSError):
+            pass
+        else:
+            raise AssertionError("The failed save was not reported.")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_array_dir():
+    """
+    Saves an object holding arrays to an array directory, checks that
+    the arrays are memory-mapped when loading and that saving again
+    only writes the arrays that changed.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkld')
+        rng = np.random.RandomState([2014, 11, 5])
+        obj = {'W': rng.randn(100, 20), 'b': np.zeros(20),
+               'V': rng.randn(20, 30).astype('float32'), 'name': 'model'}
+        serial.save(path, obj)
+        # b is small enough to be pickled in the manifest
+        assert len([name for name in os.listdir(path)
+                    if name.endswith('.npy')]) == 2
+
+        loaded = serial.load(path)
+        assert loaded['name'] == 'model'
+        assert isinstance(loaded['W'], np.memmap)
+        for key in ['W', 'b', 'V']:
+            assert loaded[key].dtype == obj[key].dtype
+            assert np.array_equal(loaded[key], obj[key])
+
+        # Loaded arrays are copy-on-write
+        loaded['W'][0, 0] = 42.
+        assert np.array_equal(serial.load(path)['W'], obj['W'])
+
+        before = set(os.listdir(path))
+        obj['W'] = obj['W'] + 1.
+        serial.save(path, obj)
+        after = set(os.listdir(path))
+        # The new W was written, V was left alone, and the old W is kept
+        # for readers of the previous manifest
+        assert len(after - before) == 1
+        assert before <= after
+        assert np.array_equal(serial.load(path)['W'], obj['W'])
+        assert np.array_equal(serial.load(path, mmap_mode=None)['V'],
+                              obj['V'])
+
+        serial.save(path, obj)
+        # The old W is deleted once neither manifest refers to it
+        array_files = [name for name in os.listdir(path)
+                       if name.endswith('.npy')]
+        assert len(array_files) == 2
+        assert set(array_files) <= after
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_array_dir_shared_variables():
+    """
+    Checks that the values of shared variables are written on every save
+    to an array directory, even when they were updated in place.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkld')
+        var = sharedX(np.zeros((20, 20)))
+        serial.save(path, var)
+        var.get_value(borrow=True)[:] = 1.
+        serial.save(path, var)
+        assert np.all(serial.load(path).get_value() == 1.)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_array_dir_keep_versions():
+    """
+    Saves new versions of an array directory and checks that they reuse
+    the files of the unchanged arrays of the previous version, and that
+    only weak references to the arrays of the latest version are kept.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkld')
+        rng = np.random.RandomState([2015, 3, 20])
+        obj = {'W': rng.randn(100, 20), 'V': rng.randn(20, 30)}
+        v_files = []
+        for i in xrange(4):
+            obj['W'] = obj['W'] + 1.
+            serial.save(path, obj, keep_versions=2)
+            version = os.path.abspath(serial._list_versions(path)[-1][1])
+            written = serial._array_dir_written[version]
+            v_name, = [entry[1] for entry in written.values()
+                       if entry[0]() is obj['V']]
+            v_files.append(os.path.join(version, v_name))
+            assert all(isinstance(entry[0], weakref.ref)
+                       for entry in written.values())
+            assert len([name for name in os.listdir(version)
+                        if name.endswith('.npy')]) == 2
+            assert np.array_equal(serial.load(path)['W'], obj['W'])
+            assert len([dirpath for dirpath in serial._array_dir_written
+                        if dirpath.startswith(tmp_dir)]) == 1
+        # V was written once, then linked or copied into every version
+        assert len(set(os.path.basename(name) for name in v_files)) == 1
+        if hasattr(os, 'link'):
+            assert os.path.samefile(v_files[-1], v_files[-2])
+        del obj
+        assert all(entry[0]() is None for entry in
+                   serial._array_dir_written[version].values())
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_atomic_save():
+    """
+    Checks that a failed save leaves the previous version of the file
+    intact and no temporary file behind.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.pkl')
+        serial.save(path, {'step': 0})
+        serial.save(path, {'step': 1})
+        try:
+            serial.save(path, {'step': 2, 'unpicklable': lambda x: x})
+        except Exception:
+            pass
+        else:
+            raise AssertionError("Saving a lambda should fail.")
+        assert serial.load(path) == {'step': 1}
+        assert os.listdir(tmp_dir) == ['obj.pkl']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_joblib_save():
+    """
+    Checks that joblib saves move the array files written by joblib
+    along with the file, and remove the ones of the previous save. The
+    files are pickled if joblib is not installed.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'obj.joblib')
+        serial.save(path, {'a': np.arange(10.), 'b': np.ones(5)})
+        serial.save(path, {'a': np.arange(20.)})
+        loaded = serial.load(path)
+        assert np.array_equal(loaded['a'], np.arange(20.))
+        assert list(loaded.keys()) == ['a']
+        assert not [name for name in os.listdir(tmp_dir)
+                    if name.startswith('.tmp')]
+        assert len(os.listdir(tmp_dir)) <= 2
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_keep_versions():
+    """
+    Saves several versions of a file and checks that only the most
+    recent ones are kept, and that the file itself is the latest one.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for filename in ['obj.pkl', 'obj.pkld']:
+            path = os.path.join(tmp_dir, filename)
+            for i in xrange(4):
+                serial.save(path, {'step': i, 'value': np.arange(200.)},
+                            keep_versions=2)
+                assert serial.load(path)['step'] == i
+            root, ext = os.path.splitext(filename)
+            versions = sorted(name for name in os.listdir(tmp_dir)
+                              if name.startswith(root + '.') and
+                              name.endswith(ext) and name != filename)
+            assert versions == [root + '.3' + ext, root + '.4' + ext]
+            assert serial.load(os.path.join(tmp_dir, versions[0]))['step'] == 2
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_save_overwrite_windows():
+    """
+    Saves over an existing file with the renaming behavior of Windows,
+    where `os.rename` fails if the destination exists and Python 2 has
+    no `os.replace`.
+    """
+    rename = os.rename
+    replace = getattr(os, 'replace', None)
+    name = os.name
+
+    def windows_rename(src, dst):
+        if os.path.lexists(dst):
+            raise OSError("Cannot rename over an existing file.")
+        rename(src, dst)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        os.rename = windows_rename
+        if replace is not None:
+            del os.replace
+        os.name = 'nt'
+        for filename in ['obj.pkl', 'obj.pkld']:
+            path = os.path.join(tmp_dir, filename)
+            serial.save(path, {'step': 0, 'value': np.arange(200.)})
+            serial.save(path, {'step': 1, 'value': np.arange(200.)})
+            assert serial.load(path)['step'] == 1
+        assert sorted(os.listdir(tmp_dir)) == ['obj.pkl', 'obj.pkld']
+    finally:
+        os.rename = rename
+        if replace is not None:
+            os.replace = replace
+        os.name = name
+        shutil.rmtree(tmp_dir)
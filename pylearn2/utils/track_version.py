@@ -28,6 +28,7 @@ import platform
 import socket
 import subprocess
 import sys
+import threading
 
 from theano.compat import six
 
@@ -50,7 +51,25 @@ class MetaLibVersion(type):
 
     def __init__(cls, name, bases, dict):
         type.__init__(cls, name, bases, dict)
-        cls.libv = LibVersion()
+        cls.libv = _SharedLibVersion()
+
+
+class _SharedLibVersion(object):
+    """
+    Gives all the classes using `MetaLibVersion` the same `LibVersion`,
+    created the first time one of them accesses its `libv` attribute.
+    Creating it runs git, which took most of the time of importing the
+    modules defining many models.
+    """
+
+    lock = threading.Lock()
+    libv = None
+
+    def __get__(self, obj, cls=None):
+        with self.lock:
+            if _SharedLibVersion.libv is None:
+                _SharedLibVersion.libv = LibVersion()
+        return _SharedLibVersion.libv
 
 
 class LibVersion(object):